@@ -0,0 +1,106 @@
+import hashlib
+import json
+import logging
+import threading
+import zlib
+from typing import Optional, Tuple
+
+import redis
+from haystack.schema import Answer
+
+from askyves.cleaner import clean_description
+from askyves.models import INFERENCE_BACKEND, READER_MODEL_NAME, embedding_model_id
+from config import INDEX_VERSION_KEY, PASSAGE_MODE
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_PREFIX = "qa_answer:"
+ANSWER_CACHE_TTL = 7 * 24 * 3600
+# Settings the answers depend on: app instances sharing a Redis with other settings do not share their answers.
+# Passage-mode answers, in particular, have offsets in the passage rather than the abstract
+ANSWER_SETTINGS = f"{embedding_model_id()}|{READER_MODEL_NAME}@{INFERENCE_BACKEND}|passages={PASSAGE_MODE}"
+
+
+def _to_builtin(value):
+    # Reader scores may be numpy scalars, which json cannot serialise
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class AnswerCache:
+    """Redis cache of `ExtractiveQAPipeline` answers, keyed by normalised question, year filter, top-k settings and
+    `ANSWER_SETTINGS`. Each entry records the index version it was computed against: entries computed before the
+    paper index was last rebuilt are ignored, so rebuilding the index invalidates the cache without having to scan
+    for keys.
+    """
+
+    def __init__(self, redis_client: redis.Redis, ttl: int = ANSWER_CACHE_TTL):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(question: str, date_range: list, top_k_retriever: int, top_k_reader: int) -> str:
+        normalised = " ".join(clean_description(question).split())
+        years = ",".join(sorted(set(map(str, date_range or []))))
+        key = f"{normalised}|{years}|{top_k_retriever}|{top_k_reader}|{ANSWER_SETTINGS}"
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return ANSWER_CACHE_PREFIX + digest
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get(
+        self, question: str, date_range: list, top_k_retriever: int, top_k_reader: int
+    ) -> Tuple[Optional[dict], Optional[int]]:
+        """The cached results, None on a miss, and the current index version, to `set` the answers computed after a
+        miss with. The version is None when the cache is unavailable.
+        """
+        key = self._key(question, date_range, top_k_retriever, top_k_reader)
+        try:
+            # Fetch the current index version along with the entry: a single round trip
+            with self.redis_client.pipeline(transaction=False) as pipe:
+                version, value = pipe.get(INDEX_VERSION_KEY).get(key).execute()
+        except redis.exceptions.RedisError as e:
+            logger.warning("Answer cache unavailable: %s", e)
+            return None, None
+
+        version = int(version or 0)
+        if value is not None:
+            entry = json.loads(zlib.decompress(value))
+            if entry["version"] == version:
+                self._count("hits")
+                answers = [Answer.from_dict(answer) for answer in entry["answers"]]
+                return {"query": question, "answers": answers}, version
+        self._count("misses")
+        return None, version
+
+    def set(
+        self,
+        question: str,
+        date_range: list,
+        top_k_retriever: int,
+        top_k_reader: int,
+        results: dict,
+        version: Optional[int],
+    ) -> None:
+        """Cache `results`, computed against the index `version` returned by `get`: answers computed while the index
+        was rebuilt are ignored once it is swapped in.
+        """
+        if version is None:
+            return
+        key = self._key(question, date_range, top_k_retriever, top_k_reader)
+        try:
+            entry = {"version": version, "answers": [answer.to_dict() for answer in results["answers"]]}
+            value = zlib.compress(json.dumps(entry, separators=(",", ":"), default=_to_builtin).encode())
+            self.redis_client.set(key, value, ex=self.ttl)
+        except redis.exceptions.RedisError as e:
+            logger.warning("Could not write to the answer cache: %s", e)
+
+    def info(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {**self.stats, "hit_rate": self.stats["hits"] / lookups if lookups else 0.0}
@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import time
+from typing import List, Optional, Set
+
+from config import DEFAULT_YEARS, TOP_K_READER, TOP_K_RETRIEVER
+
+# Questions embedded, searched and read together
+CHUNK_SIZE = 256
+
+
+def question_filters(record: dict) -> dict:
+    """haystack-style `filters` of a question, or the years of its `start_year`..`end_year` range, by default the
+    one the app starts with.
+    """
+    if record.get("filters"):
+        return record["filters"]
+    start_year, end_year = record.get("start_year", DEFAULT_YEARS[0]), record.get("end_year", DEFAULT_YEARS[1])
+    return {"date_range": list(map(str, range(int(start_year), int(end_year) + 1)))}
+
+
+def read_questions(path: str) -> List[dict]:
+    """One JSON object per line with a `question`, optional filters as accepted by the service, and an optional `id`,
+    by default its line number. Ids identify the questions already answered when a run is resumed.
+    """
+    records, ids = [], set()
+    with open(path, "r") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            question_id = record.get("id", number)
+            if question_id in ids:
+                raise ValueError(f"Line {number}: duplicate question id {question_id!r}")
+            ids.add(question_id)
+            records.append({"id": question_id, "question": record["question"], "filters": question_filters(record)})
+    return records
+
+
+def answered_ids(path: str) -> Set:
+    """Ids of the questions answered in the output file of a previous run. A last line cut short by a crash is
+    truncated, so that its question is answered again and the file stays valid JSONL.
+    """
+    if not os.path.exists(path):
+        return set()
+    ids, complete = set(), 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                ids.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                break
+            complete += len(line)
+    with open(path, "r+b") as f:
+        f.truncate(complete)
+    return ids
+
+
+def answer_batch(
+    document_store,
+    reader,
+    records: List[dict],
+    top_k_retriever: int = TOP_K_RETRIEVER,
+    top_k_reader: int = TOP_K_READER,
+    batch_size: Optional[int] = None,
+) -> List[dict]:
+    """Answer `records` together: their questions are embedded in one call, their KNN searches sent in one pipeline
+    and their documents read in one `run_batch` call, with `batch_size` question-document pairs per forward pass.
+    """
+    from askyves.embedder import make_embeddings
+
+    questions = [record["question"] for record in records]
+    documents = document_store.query_by_embedding_batch(
+        make_embeddings(questions), filters=[record["filters"] for record in records], top_k=top_k_retriever
+    )
+    answers = [[] for _ in records]
+    # Questions without documents have no answer: the reader only gets the others
+    read = [i for i, question_documents in enumerate(documents) if question_documents]
+    if read:
+        output, _ = reader.run_batch(
+            queries=[questions[i] for i in read],
+            documents=[documents[i] for i in read],
+            top_k=top_k_reader,
+            batch_size=batch_size,
+        )
+        for i, question_answers in zip(read, output["answers"]):
+            answers[i] = question_answers
+    return [
+        {
+            **record,
+            "documents": [{"id": document.id, "score": document.score} for document in question_documents],
+            "answers": [answer.to_dict() for answer in question_answers],
+        }
+        for record, question_documents, question_answers in zip(records, documents, answers)
+    ]
+
+
+def run_batch_qa(
+    questions_path: str, output_path: str, chunk_size: int = CHUNK_SIZE, batch_size: Optional[int] = None
+) -> int:
+    """Answer the questions of `questions_path` `chunk_size` at a time, appending the answers of each chunk to the
+    JSONL `output_path` as soon as it is read. Questions already answered there by a previous run are skipped.
+    Returns the number of questions answered.
+    """
+    from askyves.answer_cache import _to_builtin
+    from askyves.pipeline import build_document_store, build_reader
+
+    records = read_questions(questions_path)
+    done = answered_ids(output_path)
+    pending = [record for record in records if record["id"] not in done]
+    print(f"{len(records) - len(pending)} questions already answered, {len(pending)} to go")
+    if not pending:
+        return 0
+    document_store = build_document_store()
+    reader = build_reader(document_store)
+
+    start_time = time.perf_counter()
+    with open(output_path, "a") as f:
+        for start in range(0, len(pending), chunk_size):
+            end = start + chunk_size
+            for result in answer_batch(document_store, reader, pending[start:end], batch_size=batch_size):
+                f.write(json.dumps(result, default=_to_builtin) + "\n")
+            f.flush()
+            answered = min(end, len(pending))
+            rate = answered / (time.perf_counter() - start_time)
+            print(f"{answered}/{len(pending)} questions answered ({rate:.1f} questions/s)")
+    return len(pending)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a file of questions offline, in batches")
+    parser.add_argument(
+        "--questions",
+        required=True,
+        help='JSONL file of {"question": ..., "id": ..., "start_year": ..., "end_year": ...} or with "filters"',
+    )
+    parser.add_argument("--output", required=True, help="JSONL file the answers are appended to, resumed if it exists")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="questions embedded and read together")
+    parser.add_argument("--batch-size", type=int, help="question-document pairs per reader forward pass")
+    args = parser.parse_args()
+    run_batch_qa(args.questions, args.output, chunk_size=args.chunk_size, batch_size=args.batch_size)
@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, List, Optional
+
+from askyves import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_WINDOW_SECONDS = 0.005
+MAX_BATCH_SIZE = 16
+MAX_QUEUE_DEPTH = 64
+BATCH_TIMEOUT_SECONDS = 30.0
+
+
+class Overloaded(RuntimeError):
+    """The request was dropped: too many requests are already waiting, or it waited longer than the timeout."""
+
+
+class MicroBatcher:
+    """Runs `fn` on batches of the items submitted by concurrent callers, e.g. the questions of every Streamlit
+    session, and hands each caller its own result. A worker thread waits for a first item, then collects the items
+    submitted within `window` seconds of it, up to `max_batch_size`, and makes a single `fn` call for all of them.
+    `fn` gets a list of items and returns their results in the same order.
+
+    Admission control: at most `max_queue_depth` items wait for the worker, further submissions raise `Overloaded`
+    right away, as do callers whose item is not done after `timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[list], list],
+        name: str,
+        window: float = BATCH_WINDOW_SECONDS,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_queue_depth: int = MAX_QUEUE_DEPTH,
+        timeout: Optional[float] = BATCH_TIMEOUT_SECONDS,
+    ):
+        self.fn = fn
+        self.name = name
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_queue_depth = max_queue_depth
+        self.timeout = timeout
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._worker = None
+        self.stats = {"submitted": 0, "rejected": 0, "timed_out": 0, "batches": 0}
+
+    def submit(self, item):
+        """Queue `item` and block until its batch is run: returns its result or raises the exception of `fn`."""
+        future = Future()
+        with self._condition:
+            if len(self._queue) >= self.max_queue_depth:
+                self.stats["rejected"] += 1
+                metrics.BATCH_REJECTED.labels(self.name, "queue_full").inc()
+                raise Overloaded(f"{self.name}: {len(self._queue)} requests are already waiting")
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+                self._worker.start()
+            self._queue.append((item, future, time.perf_counter()))
+            self.stats["submitted"] += 1
+            self._condition.notify()
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Dropped from its batch if that has not started yet, its result is ignored otherwise
+            future.cancel()
+            with self._condition:
+                self.stats["timed_out"] += 1
+            metrics.BATCH_REJECTED.labels(self.name, "timeout").inc()
+            raise Overloaded(f"{self.name}: no result after {self.timeout}s") from None
+
+    def _next_batch(self) -> list:
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = self._queue[0][2] + self.window
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return [self._queue.popleft() for _ in range(min(self.max_batch_size, len(self._queue)))]
+
+    def _run(self) -> None:
+        while True:
+            # Callers that timed out have cancelled their future: their items are not run
+            batch = [entry for entry in self._next_batch() if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            # Once the batch is formed: the wait includes the window spent gathering it
+            now = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                metrics.BATCH_WAIT_SECONDS.labels(self.name).observe(now - enqueued_at)
+            metrics.BATCH_SIZE.labels(self.name).observe(len(batch))
+            try:
+                with metrics.stage(f"{self.name}_batch"):
+                    results = self.fn([item for item, _, _ in batch])
+            except Exception as e:
+                logger.debug("Batch of %d %s requests failed", len(batch), self.name, exc_info=True)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            with self._condition:
+                self.stats["batches"] += 1
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def info(self) -> dict:
+        with self._condition:
+            return {**self.stats, "queue_depth": len(self._queue)}
+
+
+def batch_reader(reader, **kwargs) -> MicroBatcher:
+    """Route the `predict` calls of a FARMReader through a `MicroBatcher`: the questions of concurrent callers, each
+    with its own documents, are read in one `predict_batch` forward pass. Returns the batcher.
+    """
+    if getattr(reader, "batcher", None) is not None:
+        # The reader is shared by every pipeline of the process: it is only wrapped once
+        return reader.batcher
+    predict_batch, predict_one = reader.predict_batch, reader.predict
+
+    def read(requests: List[tuple]) -> List[dict]:
+        queries = [query for query, _, _ in requests]
+        top_ks = [reader.top_k if top_k is None else top_k for _, _, top_k in requests]
+        # Answers are ranked per question: asking for the largest top_k and truncating gives every caller its own
+        documents = [documents for _, documents, _ in requests]
+        results = predict_batch(queries=queries, documents=documents, top_k=max(top_ks))
+        return [
+            {"query": query, "no_ans_gap": no_ans_gap, "answers": answers[:top_k]}
+            for query, top_k, answers, no_ans_gap in zip(queries, top_ks, results["answers"], results["no_ans_gaps"])
+        ]
+
+    batcher = MicroBatcher(read, "reader", **kwargs)
+
+    def predict(query: str, documents: list, top_k: Optional[int] = None) -> dict:
+        if not documents:
+            return predict_one(query=query, documents=documents, top_k=top_k)
+        return batcher.submit((query, documents, top_k))
+
+    reader.predict = predict
+    reader.batcher = batcher
+    return batcher
@@ -0,0 +1,183 @@
+import argparse
+import csv
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+import redis
+from redis.commands.search.field import VectorField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+
+from askyves.ingest import read_vectors
+from askyves.vector_codec import VECTOR_TYPES, VectorCodec, normalize
+from config import HNSW_EF_CONSTRUCTION, HNSW_EF_RUNTIME, HNSW_M, REDIS_DISTANCE_METRIC
+
+# Keys and indexes written by the benchmark, all removed when it ends
+BENCHMARK_PREFIX = "benchmark:"
+BENCHMARK_INDEX = "benchmark_index"
+WRITE_BATCH_SIZE = 1000
+GROUND_TRUTH_BATCH_SIZE = 256
+
+
+def load_sample(ingest_dir: str, num_vectors: int, num_queries: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Random corpus vectors and held-out query vectors from the ingest directory."""
+    vectors = read_vectors(ingest_dir)
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(vectors), min(num_vectors + num_queries, len(vectors)), replace=False)
+    sample = np.asarray(vectors[np.sort(rows)], dtype=np.float32)
+    rng.shuffle(sample)
+    return sample[num_queries:], sample[:num_queries]
+
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, metric: str, k: int) -> List[set]:
+    """Ground truth: the `k` nearest corpus rows of each query, by brute force in float32."""
+    if metric == "COSINE":
+        corpus, queries = normalize(corpus), normalize(queries)
+    squared_norms = (corpus**2).sum(axis=1)
+    neighbours = []
+    for start in range(0, len(queries), GROUND_TRUTH_BATCH_SIZE):
+        end = start + GROUND_TRUTH_BATCH_SIZE
+        # Lower is closer; the squared norm of the query does not change the order of its neighbours
+        scores = -queries[start:end] @ corpus.T
+        if metric == "L2":
+            scores = squared_norms + 2 * scores
+        neighbours.extend(set(row) for row in np.argpartition(scores, k, axis=1)[:, :k])
+    return neighbours
+
+
+def write_corpus(client: redis.Redis, corpus: np.ndarray, prefix: str) -> None:
+    for start in range(0, len(corpus), WRITE_BATCH_SIZE):
+        end = start + WRITE_BATCH_SIZE
+        with client.pipeline(transaction=False) as pipe:
+            for i, vector in enumerate(corpus[start:end], start):
+                pipe.hset(f"{prefix}{i}", "vector", vector.tobytes())
+            pipe.execute()
+
+
+def build_index(client: redis.Redis, prefix: str, algorithm: str, attributes: dict) -> Tuple[float, float]:
+    """Index the vectors under `prefix` and return the build time in seconds and the index size in MB."""
+    start_time = time.perf_counter()
+    client.ft(BENCHMARK_INDEX).create_index(
+        fields=[VectorField("vector", algorithm, attributes)],
+        definition=IndexDefinition(prefix=[prefix], index_type=IndexType.HASH),
+    )
+    # Existing keys are indexed in the background
+    while float(client.ft(BENCHMARK_INDEX).info()["percent_indexed"]) < 1:
+        time.sleep(0.05)
+    build_seconds = time.perf_counter() - start_time
+    return build_seconds, float(client.ft(BENCHMARK_INDEX).info().get("vector_index_sz_mb", "nan"))
+
+
+def search(client: redis.Redis, queries: np.ndarray, k: int, ef_runtime: Optional[int]) -> Tuple[List[set], list]:
+    knn_args = f" EF_RUNTIME {ef_runtime}" if ef_runtime else ""
+    q = Query(f"*=>[KNN {k} @vector $vec{knn_args} AS score]").sort_by("score").paging(0, k).no_content().dialect(2)
+    results, latencies = [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        docs = client.ft(BENCHMARK_INDEX).search(q, query_params={"vec": query.tobytes()}).docs
+        latencies.append(1000 * (time.perf_counter() - start_time))
+        results.append({int(doc.id.rsplit(":", 1)[1]) for doc in docs})
+    return results, latencies
+
+
+def measure(client, queries, truth, k, ef_runtime, **setting) -> dict:
+    results, latencies = search(client, queries, k, ef_runtime)
+    recall = np.mean([len(found & expected) / k for found, expected in zip(results, truth)])
+    row = {**setting, "ef_runtime": ef_runtime, "recall": float(recall)}
+    row.update(p50_ms=float(np.percentile(latencies, 50)), p99_ms=float(np.percentile(latencies, 99)))
+    print(
+        ", ".join(
+            f"{name}={value:.3f}" if isinstance(value, float) else f"{name}={value}" for name, value in row.items()
+        )
+    )
+    return row
+
+
+def benchmark(
+    client: redis.Redis,
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    metric: str,
+    vector_types: List[str],
+    ms: List[int],
+    ef_constructions: List[int],
+    ef_runtimes: List[int],
+) -> List[dict]:
+    """Measure recall@k, latency, build time and memory of a FLAT index and of a grid of HNSW indexes."""
+    truth = exact_neighbours(corpus, queries, metric, k)
+    rows = []
+    for vector_type in vector_types:
+        codec = VectorCodec(vector_type, corpus.shape[1], metric)
+        prefix = f"{BENCHMARK_PREFIX}{vector_type.lower()}:"
+        write_corpus(client, codec.encode(corpus), prefix)
+        encoded_queries = codec.encode(queries)
+        attributes = {"TYPE": vector_type, "DIM": codec.dim, "DISTANCE_METRIC": metric, "INITIAL_CAP": len(corpus)}
+
+        settings = [("FLAT", {}, [None])]
+        settings += [
+            ("HNSW", {"M": m, "EF_CONSTRUCTION": ef_construction}, ef_runtimes)
+            for m in ms
+            for ef_construction in ef_constructions
+        ]
+        for algorithm, params, index_ef_runtimes in settings:
+            build_seconds, memory_mb = build_index(client, prefix, algorithm, {**attributes, **params})
+            setting = {"index": algorithm, "vector_type": vector_type, "m": params.get("M")}
+            setting.update(ef_construction=params.get("EF_CONSTRUCTION"), build_s=build_seconds, memory_mb=memory_mb)
+            try:
+                for ef_runtime in index_ef_runtimes:
+                    rows.append(measure(client, encoded_queries, truth, k, ef_runtime, **setting))
+            finally:
+                client.ft(BENCHMARK_INDEX).dropindex(delete_documents=False)
+    return rows
+
+
+def clean_up(client: redis.Redis) -> None:
+    try:
+        client.ft(BENCHMARK_INDEX).dropindex(delete_documents=False)
+    except redis.exceptions.ResponseError:
+        pass
+    keys = list(client.scan_iter(f"{BENCHMARK_PREFIX}*", count=10_000))
+    for start in range(0, len(keys), WRITE_BATCH_SIZE):
+        end = start + WRITE_BATCH_SIZE
+        client.unlink(*keys[start:end])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall vs latency of FLAT and HNSW indexes on a local Redis Stack")
+    parser.add_argument("--papers", default="data/arxiv_embeddings", help="columnar ingest directory")
+    parser.add_argument("--redis-url", default="redis://localhost:6379", help="a disposable Redis Stack")
+    parser.add_argument("--num-vectors", type=int, default=100_000, help="corpus size")
+    parser.add_argument("--num-queries", type=int, default=500, help="held-out query vectors")
+    parser.add_argument("--k", type=int, default=10, help="recall@k")
+    parser.add_argument("--metric", choices=["L2", "IP", "COSINE"], default=REDIS_DISTANCE_METRIC)
+    parser.add_argument("--vector-types", nargs="+", choices=list(VECTOR_TYPES), default=["FLOAT32"])
+    parser.add_argument("--m", nargs="+", type=int, default=[HNSW_M])
+    parser.add_argument("--ef-construction", nargs="+", type=int, default=[HNSW_EF_CONSTRUCTION])
+    parser.add_argument("--ef-runtime", nargs="+", type=int, default=[HNSW_EF_RUNTIME, 50, 100, 200])
+    parser.add_argument("--output", help="write the results to this CSV file")
+    args = parser.parse_args()
+
+    corpus, queries = load_sample(args.papers, args.num_vectors, args.num_queries)
+    client = redis.from_url(args.redis_url)
+    clean_up(client)
+    try:
+        results = benchmark(
+            client,
+            corpus,
+            queries,
+            args.k,
+            args.metric,
+            args.vector_types,
+            args.m,
+            args.ef_construction,
+            args.ef_runtime,
+        )
+    finally:
+        clean_up(client)
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
@@ -0,0 +1,204 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from askyves.cleaner import clean_descriptions
+from askyves.ingest import PaperWriter, count_papers, iter_paper_batches, read_vectors
+from askyves.models import EMBEDDING_MODEL_NAME
+
+YEAR_PATTERN = re.compile(r"(19|20[0-9]{2})")
+MIN_YEAR = 1991
+MAX_YEAR = 2022
+SHARD_SIZE = 50_000
+BATCH_SIZE = 64
+NUM_WORKERS = max(1, (os.cpu_count() or 1) // 4)
+MANIFEST_FILE = "manifest.json"
+
+# Set in each worker process by `_init_worker`
+_worker_model = None
+
+
+def parse_paper(line: str, max_year: int = MAX_YEAR) -> Optional[dict]:
+    """Parse one line of the snapshot, keeping only papers with a publication year in their journal reference."""
+    paper = json.loads(line)
+    years = [int(year) for year in YEAR_PATTERN.findall(paper["journal-ref"] or "")]
+    years = [year for year in years if MIN_YEAR <= year <= max_year]
+    if not years:
+        return None
+    return {
+        "id": paper["id"],
+        "title": paper["title"] or "",
+        "year": str(min(years)),
+        "authors": paper["authors"] or "",
+        "categories": ",".join((paper["categories"] or "").split(" ")),
+        "abstract": paper["abstract"] or "",
+        "update_date": paper["update_date"] or "",
+        "doi": paper["doi"] or "",
+        "journal-ref": paper["journal-ref"] or "",
+        "submitter": paper["submitter"] or "",
+    }
+
+
+def iter_shards(path: str, shard_size: int, max_year: int = MAX_YEAR) -> Iterator[List[dict]]:
+    shard = []
+    with open(path, "r") as f:
+        for line in f:
+            paper = parse_paper(line, max_year)
+            if paper is None:
+                continue
+            shard.append(paper)
+            if len(shard) == shard_size:
+                yield shard
+                shard = []
+    if shard:
+        yield shard
+
+
+def paper_text(paper: dict) -> str:
+    """The text of a paper that is embedded, before cleaning."""
+    return paper["title"] + " " + paper["abstract"]
+
+
+def make_batches(texts: List[str], batch_size: int) -> Iterator[Tuple[List[int], List[str]]]:
+    """Group texts of similar length together so that each batch is padded as little as possible."""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), batch_size):
+        end = start + batch_size
+        indices = order[start:end]
+        yield indices, [texts[i] for i in indices]
+
+
+def _init_worker(model_name: str, num_threads: int) -> None:
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # Each worker gets its share of the cores instead of every worker spawning one thread per core
+    torch.set_num_threads(num_threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_batch(batch: Tuple[List[int], List[str]]) -> Tuple[List[int], np.ndarray]:
+    indices, texts = batch
+    vectors = _worker_model.encode(texts, batch_size=len(texts), normalize_embeddings=True)
+    return indices, vectors.astype(np.float32)
+
+
+def encoder_pool(model_name: str = EMBEDDING_MODEL_NAME, num_workers: int = NUM_WORKERS):
+    """A pool of `num_workers` processes, each holding the model and its share of the cores, for `embed_texts`."""
+    num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+    # Spawn rather than fork: torch's thread pools do not survive a fork
+    context = mp.get_context("spawn")
+    return context.Pool(num_workers, initializer=_init_worker, initargs=(model_name, num_threads))
+
+
+def embed_texts(pool, texts: List[str], batch_size: int) -> np.ndarray:
+    vectors = None
+    for indices, batch_vectors in pool.imap_unordered(_encode_batch, make_batches(texts, batch_size)):
+        if vectors is None:
+            vectors = np.empty((len(texts), batch_vectors.shape[1]), dtype=np.float32)
+        vectors[indices] = batch_vectors
+    return vectors
+
+
+def write_shard(shard_dir: Path, papers: List[dict], vectors: np.ndarray) -> None:
+    # Write to a temporary directory and rename it, so that a shard directory only exists once complete
+    tmp_dir = shard_dir.with_suffix(".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    with PaperWriter(tmp_dir, len(papers), dim=vectors.shape[1]) as writer:
+        writer.write_batch(papers, vectors)
+    tmp_dir.rename(shard_dir)
+
+
+def merge_shards(shards_dir: Path, output_dir: Path) -> int:
+    shard_dirs = sorted(shards_dir.glob("shard-[0-9]*[0-9]"))
+    if not shard_dirs:
+        raise ValueError(f"No embedded shards found in {shards_dir}")
+    total = sum(count_papers(shard_dir) for shard_dir in shard_dirs)
+    dim = read_vectors(shard_dirs[0]).shape[1]
+    with PaperWriter(output_dir, total, dim=dim) as writer:
+        for shard_dir in shard_dirs:
+            for _, papers in iter_paper_batches(shard_dir, SHARD_SIZE):
+                writer.write_batch(papers, np.stack([paper["vector"] for paper in papers]))
+    return total
+
+
+def check_manifest(shards_dir: Path, manifest: dict) -> None:
+    """Shard boundaries depend on these settings: refuse to resume a job that was started with other ones."""
+    path = shards_dir / MANIFEST_FILE
+    if path.exists():
+        existing = json.loads(path.read_text())
+        if existing != manifest:
+            raise ValueError(f"{shards_dir} was built with {existing}, not {manifest}. Use another output directory.")
+    else:
+        shards_dir.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(manifest))
+
+
+def build_embeddings(
+    input_path: str,
+    output_dir: str,
+    model_name: str = EMBEDDING_MODEL_NAME,
+    num_workers: int = NUM_WORKERS,
+    batch_size: int = BATCH_SIZE,
+    shard_size: int = SHARD_SIZE,
+    max_year: int = MAX_YEAR,
+) -> None:
+    output_dir = Path(output_dir)
+    shards_dir = output_dir / "shards"
+    check_manifest(
+        shards_dir, {"input": str(input_path), "model": model_name, "shard_size": shard_size, "max_year": max_year}
+    )
+
+    embedded, start_time = 0, time.perf_counter()
+    with encoder_pool(model_name, num_workers) as pool:
+        for shard_id, papers in enumerate(iter_shards(input_path, shard_size, max_year)):
+            shard_dir = shards_dir / f"shard-{shard_id:05d}"
+            if shard_dir.exists():
+                print(f"Shard {shard_id} already embedded, skipping")
+                continue
+
+            shard_start = time.perf_counter()
+            texts = clean_descriptions([paper_text(paper) for paper in papers])
+            vectors = embed_texts(pool, texts, batch_size)
+            write_shard(shard_dir, papers, vectors)
+
+            now = time.perf_counter()
+            embedded += len(papers)
+            print(
+                f"Shard {shard_id}: {len(papers)} docs in {now - shard_start:.1f}s "
+                f"({len(papers) / (now - shard_start):.1f} docs/s, {embedded / (now - start_time):.1f} docs/s overall)"
+            )
+
+    print("Merging shards")
+    total = merge_shards(shards_dir, output_dir)
+    print(f"{total} papers written to {output_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed the arXiv snapshot on CPU into the columnar ingest format")
+    parser.add_argument("--input", default="data/arxiv-metadata-oai-snapshot.json", help="arXiv JSON lines snapshot")
+    parser.add_argument("--output", default="data/arxiv_embeddings", help="output ingest directory")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME, help="sentence-transformers model name")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="number of encoding processes")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="texts per forward pass")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="papers per checkpointed shard")
+    parser.add_argument("--max-year", type=int, default=MAX_YEAR, help="ignore journal reference years after this")
+    args = parser.parse_args()
+    build_embeddings(
+        args.input,
+        args.output,
+        model_name=args.model,
+        num_workers=args.workers,
+        batch_size=args.batch_size,
+        shard_size=args.shard_size,
+        max_year=args.max_year,
+    )
@@ -0,0 +1,39 @@
+import re
+import string
+from typing import List, Optional
+
+_PUNCTUATION_TO_SPACE = str.maketrans(string.punctuation, " " * len(string.punctuation))
+_MULTIPLE_SPACES = re.compile(r"\s{2,}")
+_BEFORE_CAPITAL = re.compile(r"(?=[A-Z])")
+# Joins a batch into a single string: it is ASCII, not punctuation, not whitespace and not a letter,
+# so none of the cleaning steps below can alter, split or merge across it
+_BATCH_SEPARATOR = "\x00"
+
+
+def _clean(text: str) -> str:
+    # Same steps as the original cleaner: drop non-ASCII characters, turn punctuation and newlines into spaces,
+    # split on capitalised words and lowercase. Collapsing runs of whitespace only once, at the end, gives the
+    # same result as collapsing them before and after splitting on capitals.
+    text = text.encode("ascii", "ignore").decode()
+    text = text.translate(_PUNCTUATION_TO_SPACE).replace("\n", " ")
+    text = _BEFORE_CAPITAL.sub(" ", text)
+    return _MULTIPLE_SPACES.sub(" ", text).lower()
+
+
+# String cleaner
+def clean_description(description: str) -> str:
+    if not description:
+        return ""
+    return _clean(description)
+
+
+def clean_descriptions(descriptions: List[Optional[str]]) -> List[str]:
+    """Batch version of `clean_description`: the batch is cleaned as one joined string, so every step is a
+    single pass in C over the whole batch instead of one Python call per description.
+    """
+    descriptions = [description or "" for description in descriptions]
+    if not descriptions:
+        return []
+    if any(_BATCH_SEPARATOR in description for description in descriptions):
+        return [clean_description(description) for description in descriptions]
+    return _clean(_BATCH_SEPARATOR.join(descriptions)).split(_BATCH_SEPARATOR)
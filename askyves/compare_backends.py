@@ -0,0 +1,97 @@
+import argparse
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+from askyves.cleaner import clean_descriptions
+from askyves.ingest import iter_paper_batches
+from askyves.models import get_reader, get_sentence_transformer
+
+BACKENDS = ["torch", "onnx"]
+
+
+def read_questions(path: str) -> List[str]:
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def timed(function, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, 1000 * (time.perf_counter() - start_time)
+
+
+def load_papers(ingest_dir: str, sample: int):
+    papers = []
+    for _, batch in iter_paper_batches(ingest_dir, batch_size=min(sample, 10_000)):
+        papers.extend(batch[: sample - len(papers)])
+        if len(papers) >= sample:
+            break
+    vectors = np.stack([paper["vector"] for paper in papers]).astype(np.float32)
+    return papers, vectors
+
+
+def compare(questions: List[str], ingest_dir: str, sample: int, top_k: int) -> dict:
+    from haystack.schema import Document
+
+    papers, paper_vectors = load_papers(ingest_dir, sample)
+    texts = clean_descriptions(questions)
+    report = {backend: {"embed_ms": [], "read_ms": []} for backend in BACKENDS}
+    query_vectors, top_docs, top_answers = {}, {}, {}
+
+    for backend in BACKENDS:
+        encoder = get_sentence_transformer(backend=backend)
+        encoder.encode(["warm up"], normalize_embeddings=True)
+        vectors = []
+        for text in texts:
+            vector, latency = timed(encoder.encode, [text], normalize_embeddings=True)
+            vectors.append(vector[0])
+            report[backend]["embed_ms"].append(latency)
+        query_vectors[backend] = np.stack(vectors)
+        top_docs[backend] = np.argsort(-query_vectors[backend] @ paper_vectors.T, axis=1)[:, :top_k]
+
+    for backend in BACKENDS:
+        reader = get_reader(backend=backend)
+        top_answers[backend] = []
+        # Both readers read the same documents, those retrieved with the reference embedder
+        for question, doc_ids in zip(questions, top_docs["torch"]):
+            documents = [Document(content=papers[i]["abstract"], id=papers[i]["id"]) for i in doc_ids]
+            prediction, latency = timed(reader.predict, query=question, documents=documents, top_k=1)
+            answers = prediction["answers"]
+            top_answers[backend].append(answers[0].answer if answers else None)
+            report[backend]["read_ms"].append(latency)
+
+    cosines = (query_vectors["torch"] * query_vectors["onnx"]).sum(axis=1)
+    overlaps = [len(set(a) & set(b)) / top_k for a, b in zip(top_docs["torch"], top_docs["onnx"])]
+    agreement = np.mean([a == b for a, b in zip(top_answers["torch"], top_answers["onnx"])])
+    return {
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "retrieval_overlap": float(np.mean(overlaps)),
+        "answer_agreement": float(agreement),
+        **{
+            f"{backend}_{stage}_p50_ms": float(np.percentile(report[backend][f"{stage}_ms"], 50))
+            for backend in BACKENDS
+            for stage in ("embed", "read")
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the accuracy and latency of the torch and ONNX backends")
+    parser.add_argument("--questions", required=True, help="text file with one question per line")
+    parser.add_argument("--papers", default="data/arxiv_embeddings", help="columnar ingest directory")
+    parser.add_argument("--sample", type=int, default=50_000, help="number of papers to retrieve from")
+    parser.add_argument("--top-k", type=int, default=10, help="documents retrieved and read per question")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="tolerance on query embedding similarity")
+    parser.add_argument("--min-agreement", type=float, default=0.9, help="tolerance on identical top answers")
+    args = parser.parse_args()
+
+    results = compare(read_questions(args.questions), args.papers, args.sample, args.top_k)
+    for name, value in results.items():
+        print(f"{name:>24}: {value:.4f}")
+    within_tolerance = results["min_cosine"] >= args.min_cosine and results["answer_agreement"] >= args.min_agreement
+    print("Within tolerance" if within_tolerance else "OUT OF TOLERANCE")
+    sys.exit(0 if within_tolerance else 1)
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from askyves import metrics
+
+DOCUMENT_CACHE_SIZE = 10_000
+# Fields of a paper hash used to build its document, see `RedisDocumentStore.convert_hit_to_document`
+DOCUMENT_FIELDS = ["paper_id", "abstract", "title", "categories", "update_date"]
+
+
+class DocumentCache:
+    """In-process LRU of the paper fields needed to build documents, keyed by the Redis key of the paper.
+    With it, `RedisDocumentStore` KNN searches only return ids and scores, and the abstracts of popular papers are
+    transferred once instead of on every search. Entries are dropped when the index version changes, i.e. when the
+    paper index is rebuilt.
+    """
+
+    def __init__(self, maxsize: int = DOCUMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def check_version(self, version: Optional[bytes]) -> None:
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+                self._report()
+
+    def get_many(self, keys: List[str]) -> Dict[str, Optional[dict]]:
+        with self._lock:
+            papers = {key: self._entries.get(key) for key in keys}
+            for key, paper in papers.items():
+                if paper is not None:
+                    self._entries.move_to_end(key)
+            self.stats["hits"] += sum(paper is not None for paper in papers.values())
+            self.stats["misses"] += sum(paper is None for paper in papers.values())
+            self._report()
+        return papers
+
+    def set_many(self, keys: List[str], values: List[list]) -> Dict[str, Optional[dict]]:
+        """Cache the raw `HMGET` replies of `DOCUMENT_FIELDS` and return the decoded papers, None for deleted papers."""
+        papers = {}
+        for key, value in zip(keys, values):
+            if all(field is None for field in value):
+                papers[key] = None
+                continue
+            papers[key] = {field: (data or b"").decode() for field, data in zip(DOCUMENT_FIELDS, value)}
+        with self._lock:
+            for key, paper in papers.items():
+                if paper is not None:
+                    self._entries[key] = paper
+                    self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._report()
+        return papers
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._report()
+
+    def _hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def _report(self) -> None:
+        # Called with the lock held
+        metrics.DOCUMENT_CACHE_ENTRIES.set(len(self._entries))
+        metrics.DOCUMENT_CACHE_HIT_RATE.set(self._hit_rate())
+
+    def info(self) -> dict:
+        with self._lock:
+            return {**self.stats, "size": len(self._entries), "maxsize": self.maxsize, "hit_rate": self._hit_rate()}
@@ -1,48 +1,179 @@
-import re
-import string
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional
 
-from sentence_transformers import SentenceTransformer
+import numpy as np
+import redis
 
-model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+from askyves import metrics
+from askyves.cleaner import clean_description, clean_descriptions
+from askyves.models import EMBEDDING_MODEL_NAME, embedding_model_id, get_sentence_transformer
 
+logger = logging.getLogger(__name__)
 
-# String cleaner
-def clean_description(description: str):
-    if not description:
-        return ""
-    # remove unicode characters
-    description = description.encode("ascii", "ignore").decode()
+MODEL_NAME = EMBEDDING_MODEL_NAME
+QUERY_CACHE_SIZE = 10_000
+QUERY_CACHE_TTL = 24 * 3600
+QUERY_CACHE_PREFIX = "query_embedding:"
 
-    # remove punctuation
-    description = re.sub("[%s]" % re.escape(string.punctuation), " ", description)
 
-    # clean up the spacing
-    description = re.sub("\s{2,}", " ", description)
+class QueryEmbeddingCache:
+    """Two-tier cache of query embeddings, keyed by model name and cleaned query text.
+    The first tier is an in-process LRU shared by every Streamlit session of the process, the optional second
+    tier is a Redis instance shared by every worker, storing float32 bytes with a TTL.
+    """
 
-    # remove urls
-    # description = re.sub("https*\S+", " ", description)
+    def __init__(
+        self,
+        model_name: str = embedding_model_id(MODEL_NAME),
+        maxsize: int = QUERY_CACHE_SIZE,
+        redis_client: Optional[redis.Redis] = None,
+        ttl: int = QUERY_CACHE_TTL,
+    ):
+        self.model_name = model_name
+        self.maxsize = maxsize
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0}
 
-    # remove newlines
-    description = description.replace("\n", " ")
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha1(text.encode()).hexdigest()
+        return f"{QUERY_CACHE_PREFIX}{self.model_name}:{digest}"
 
-    # remove all numbers
-    # description = re.sub('\w*\d+\w*', '', description)
+    def _set_local(self, key: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
 
-    # split on capitalized words
-    description = " ".join(re.split("(?=[A-Z])", description))
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            vectors = [self._entries.get(key) for key in keys]
+            for key, vector in zip(keys, vectors):
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    self.stats["local_hits"] += 1
 
-    # clean up the spacing again
-    description = re.sub("\s{2,}", " ", description)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing and self.redis_client is not None:
+            try:
+                missing_keys = [keys[i] for i in missing]
+                values = self.redis_client.mget(missing_keys)
+                metrics.record_round_trip(
+                    "query_cache", metrics.payload_size(missing_keys), metrics.payload_size(values)
+                )
+            except redis.exceptions.RedisError as e:
+                logger.warning("Query embedding cache unavailable, falling back to the model: %s", e)
+                values = [None] * len(missing)
+            for i, value in zip(missing, values):
+                if value is not None:
+                    vectors[i] = np.frombuffer(value, dtype=np.float32)
+                    self._set_local(keys[i], vectors[i])
 
-    # make all words lowercase
-    description = description.lower()
+        with self._lock:
+            self.stats["redis_hits"] += sum(vectors[i] is not None for i in missing)
+            self.stats["misses"] += sum(vectors[i] is None for i in missing)
+        return vectors
 
-    return description
+    def set_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        keys = [self._key(text) for text in texts]
+        vectors = [np.array(vector, dtype=np.float32) for vector in vectors]
+        for key, vector in zip(keys, vectors):
+            # Cached vectors are handed to every caller: make sure none of them can mutate it in place
+            vector.setflags(write=False)
+            self._set_local(key, vector)
+        if self.redis_client is not None:
+            try:
+                with self.redis_client.pipeline(transaction=False) as pipe:
+                    for key, vector in zip(keys, vectors):
+                        pipe.set(key, vector.tobytes(), ex=self.ttl)
+                    metrics.execute_pipeline(pipe, "query_cache_write")
+            except redis.exceptions.RedisError as e:
+                logger.warning("Could not write to the query embedding cache: %s", e)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def info(self) -> dict:
+        with self._lock:
+            lookups = sum(self.stats.values())
+            hits = self.stats["local_hits"] + self.stats["redis_hits"]
+            return {
+                **self.stats,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+
+query_cache = QueryEmbeddingCache()
+# Set by `configure_query_batching`: concurrent queries are then encoded together
+query_batcher = None
+
+
+def configure_query_cache(
+    maxsize: int = QUERY_CACHE_SIZE, redis_client: Optional[redis.Redis] = None, ttl: int = QUERY_CACHE_TTL
+) -> QueryEmbeddingCache:
+    """Replace the process-wide query cache, e.g. to back it with a shared Redis tier."""
+    global query_cache
+    query_cache = QueryEmbeddingCache(
+        model_name=embedding_model_id(MODEL_NAME), maxsize=maxsize, redis_client=redis_client, ttl=ttl
+    )
+    return query_cache
+
+
+def _encode_batch(batches: List[List[str]]) -> List[np.ndarray]:
+    texts = list(dict.fromkeys(text for texts in batches for text in texts))
+    encoded = dict(zip(texts, get_sentence_transformer(MODEL_NAME).encode(texts, normalize_embeddings=True)))
+    return [np.stack([encoded[text] for text in texts]) for texts in batches]
+
+
+def configure_query_batching(**kwargs):
+    """Encode the queries of concurrent callers in shared forward passes, see `askyves.batching.MicroBatcher` for
+    the settings. Returns the batcher.
+    """
+    from askyves.batching import MicroBatcher
+
+    global query_batcher
+    query_batcher = MicroBatcher(_encode_batch, "embed", **kwargs)
+    return query_batcher
 
 
 def make_embeddings(sentences: list):
     if isinstance(sentences, list):
-        sentences = [clean_description(description) for description in sentences]
+        sentences = clean_descriptions(sentences)
     else:
         sentences = clean_description(sentences)
-    return model.encode(sentences, normalize_embeddings=True)
+    return get_sentence_transformer(MODEL_NAME).encode(sentences, normalize_embeddings=True)
+
+
+def make_query_embeddings(queries: list):
+    """Same as `make_embeddings`, but looks each cleaned query up in the query cache before running the model."""
+    single = not isinstance(queries, list)
+    texts = clean_descriptions([queries] if single else queries)
+    with metrics.stage("query_cache"):
+        vectors = query_cache.get_many(texts)
+
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        # Repeated questions within one batch only need a single forward pass
+        to_encode = list(dict.fromkeys(texts[i] for i in missing))
+        with metrics.stage("embed_query"):
+            if query_batcher is None:
+                encoded = get_sentence_transformer(MODEL_NAME).encode(to_encode, normalize_embeddings=True)
+            else:
+                encoded = query_batcher.submit(to_encode)
+        query_cache.set_many(to_encode, encoded)
+        encoded_by_text = dict(zip(to_encode, encoded))
+        for i in missing:
+            vectors[i] = encoded_by_text[texts[i]]
+
+    vectors = np.stack(vectors)
+    return vectors[0] if single else vectors
@@ -0,0 +1,140 @@
+import re
+from typing import Iterable, List, Optional, Tuple, Union
+
+# Fields of the paper index that can be used to pre-filter KNN searches, see `frontend.lib.query_utils.create_index`
+NUMERIC_FIELDS = {"year"}
+TAG_FIELDS = {"categories", "submitter"}
+
+LOGICAL_OPERATORS = {"$and", "$or", "$not"}
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+COMPARISON_OPERATORS = {"$eq", "$ne", "$in", "$nin"} | RANGE_OPERATORS
+
+# Characters with a meaning in RediSearch query syntax, escaped in tag values
+_TAG_SPECIAL_CHARACTERS = re.compile(r"([,.<>{}\[\]\"':;!@#$%^&*()\-+=~|/\\ ])")
+
+Filters = Optional[dict]
+# A parsed filter: `("$and", [nodes])`, `("$or", [nodes])`, `("$not", node)` or a `(field, operator, value)` leaf.
+# Range operators on a numeric field are merged into a single `(field, "$range", {operator: value})` leaf.
+FilterNode = Tuple
+
+
+def escape_tag(value) -> str:
+    return _TAG_SPECIAL_CHARACTERS.sub(r"\\\1", str(value))
+
+
+def _year_runs(years: Iterable[int]) -> List[tuple]:
+    """Group years into runs of consecutive years, so that 2011..2022 becomes a single range instead of 12 terms."""
+    runs = []
+    for year in sorted(set(years)):
+        if runs and year == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], year)
+        else:
+            runs.append((year, year))
+    return runs
+
+
+def _number(value) -> Union[int, float]:
+    return value if isinstance(value, float) else int(value)
+
+
+def _parse_field(field: str, condition) -> List[FilterNode]:
+    # haystack shorthands: a list means `$in`, a scalar means `$eq`, and several operators are combined with AND
+    if not isinstance(condition, dict):
+        condition = {"$in": condition} if isinstance(condition, list) else {"$eq": condition}
+    nodes = []
+    for operator, value in condition.items():
+        if operator not in COMPARISON_OPERATORS:
+            raise ValueError(f"Unknown comparison operator `{operator}` on `{field}`")
+        if field not in NUMERIC_FIELDS | TAG_FIELDS:
+            raise ValueError(f"`{field}` cannot be filtered on, use one of {sorted(NUMERIC_FIELDS | TAG_FIELDS)}")
+        if operator in RANGE_OPERATORS and field in TAG_FIELDS:
+            raise ValueError(f"`{operator}` is not supported on the tag field `{field}`")
+        if operator in ("$in", "$nin") and not value:
+            raise ValueError(f"`{operator}` on `{field}` needs at least one value")
+        if operator not in RANGE_OPERATORS:
+            nodes.append((field, operator, value))
+    bounds = {operator: _number(value) for operator, value in condition.items() if operator in RANGE_OPERATORS}
+    if bounds:
+        nodes.insert(0, (field, "$range", bounds))
+    return nodes
+
+
+def _parse(filters: Union[dict, list], operator: str = "$and") -> FilterNode:
+    # `$and`/`$or` accept either a dict of conditions or a list of dicts, each of which is a conjunction
+    if isinstance(filters, list):
+        nodes = [_parse(condition) for condition in filters]
+    else:
+        nodes = []
+        for key, value in filters.items():
+            if key == "$not":
+                nodes.append(("$not", _parse(value)))
+            elif key in LOGICAL_OPERATORS:
+                nodes.append(_parse(value, key))
+            elif key == "date_range":
+                # Legacy filter of the Streamlit app: a list of years
+                nodes.extend(_parse_field("year", {"$in": value}))
+            else:
+                nodes.extend(_parse_field(key, value))
+    if not nodes:
+        raise ValueError(f"Empty `{operator}` filter")
+    return nodes[0] if len(nodes) == 1 else (operator, nodes)
+
+
+def parse_filters(filters: Filters) -> Optional[FilterNode]:
+    """Validate haystack-style `filters` and parse them into a `FilterNode` tree, None without filters."""
+    # The app sends an empty `date_range` when no year is selected
+    filters = {key: value for key, value in (filters or {}).items() if not (key == "date_range" and not value)}
+    return _parse(filters) if filters else None
+
+
+def _or(clauses: List[str]) -> str:
+    return clauses[0] if len(clauses) == 1 else "(" + " | ".join(clauses) + ")"
+
+
+def _and(clauses: List[str]) -> str:
+    return clauses[0] if len(clauses) == 1 else "(" + " ".join(clauses) + ")"
+
+
+def _numeric_range(field: str, bounds: dict) -> str:
+    """One range for all the `$gt`/`$gte`/`$lt`/`$lte` bounds on a field, e.g. `@year:[2015 (2020]`."""
+    low, high = "-inf", "+inf"
+    if "$gte" in bounds:
+        low = bounds["$gte"]
+    if "$gt" in bounds:
+        low = f"({bounds['$gt']}"
+    if "$lte" in bounds:
+        high = bounds["$lte"]
+    if "$lt" in bounds:
+        high = f"({bounds['$lt']}"
+    return f"@{field}:[{low} {high}]"
+
+
+def _render_leaf(field: str, operator: str, value) -> str:
+    negation = "-" if operator in ("$ne", "$nin") else ""
+    if operator == "$range":
+        return _numeric_range(field, value)
+    if field in NUMERIC_FIELDS and operator in ("$in", "$nin"):
+        return negation + _or([f"@{field}:[{low} {high}]" for low, high in _year_runs(int(v) for v in value)])
+    if field in NUMERIC_FIELDS:
+        value = _number(value)
+        return f"{negation}@{field}:[{value} {value}]"
+    values = value if operator in ("$in", "$nin") else [value]
+    return f"{negation}@{field}:{{{' | '.join(escape_tag(v) for v in values)}}}"
+
+
+def _render(node: FilterNode) -> str:
+    if node[0] == "$not":
+        return f"-{_render(node[1])}"
+    if node[0] in ("$and", "$or"):
+        clauses = [_render(child) for child in node[1]]
+        return _or(clauses) if node[0] == "$or" else _and(clauses)
+    return _render_leaf(*node)
+
+
+def compile_filters(filters: Filters) -> str:
+    """Compile haystack-style `filters` into a RediSearch pre-filter expression for a hybrid KNN query.
+    For example `{"year": {"$gte": 2015}, "categories": ["cs.LG", "stat.ML"]}` becomes
+    `(@year:[2015 +inf] @categories:{cs\\.LG | stat\\.ML})`. Returns `*`, which matches every paper, without filters.
+    """
+    node = parse_filters(filters)
+    return "*" if node is None else _render(node)
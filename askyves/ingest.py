@@ -0,0 +1,168 @@
+import hashlib
+import typing as t
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Columnar ingest format: paper metadata in a Parquet file and the embeddings in a contiguous float32 `.npy`
+# matrix, both in the same row order. Row i of `vectors.npy` is the embedding of row i of `papers.parquet`.
+METADATA_FILE = "papers.parquet"
+VECTORS_FILE = "vectors.npy"
+PAPER_FIELDS = [
+    "id",
+    "title",
+    "year",
+    "authors",
+    "categories",
+    "abstract",
+    "update_date",
+    "doi",
+    "journal-ref",
+    "submitter",
+]
+# Fields that only need to be rewritten, not re-embedded, when they change
+METADATA_FIELDS = [field for field in PAPER_FIELDS if field not in ("id", "title", "abstract")]
+ROW_GROUP_SIZE = 50_000
+EMBEDDING_DIM = 768
+
+
+class PaperWriter:
+    """Write papers to the columnar ingest format batch by batch, so that the whole corpus never has to be
+    held in memory. The number of papers must be known up front to size the vectors memory map.
+    """
+
+    def __init__(self, output_dir: str, num_papers: int, dim: int = EMBEDDING_DIM):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.num_papers = num_papers
+        self._vectors = np.lib.format.open_memmap(
+            self.output_dir / VECTORS_FILE, mode="w+", dtype=np.float32, shape=(num_papers, dim)
+        )
+        self._metadata = None
+        self._offset = 0
+
+    def write_batch(self, papers: t.List[dict], vectors: np.ndarray) -> None:
+        if len(papers) != len(vectors):
+            raise ValueError(f"Got {len(papers)} papers but {len(vectors)} vectors")
+        start, end = self._offset, self._offset + len(papers)
+        if end > self.num_papers:
+            raise ValueError(f"Writing {end} papers but the writer was sized for {self.num_papers}")
+
+        table = pa.Table.from_pylist([{field: paper[field] for field in PAPER_FIELDS} for paper in papers])
+        if self._metadata is None:
+            self._metadata = pq.ParquetWriter(self.output_dir / METADATA_FILE, table.schema)
+        self._metadata.write_table(table, row_group_size=ROW_GROUP_SIZE)
+        self._vectors[start:end] = vectors
+        self._offset = end
+
+    def close(self) -> None:
+        if self._offset != self.num_papers:
+            raise ValueError(f"Only {self._offset} of the {self.num_papers} expected papers were written")
+        if self._metadata is not None:
+            self._metadata.close()
+        self._vectors.flush()
+        del self._vectors
+
+    def __enter__(self) -> "PaperWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+
+
+def write_papers(output_dir: str, df, batch_size: int = ROW_GROUP_SIZE) -> None:
+    """Convert a DataFrame with a `vector` column of embeddings (the legacy pickle layout) to the ingest format."""
+    dim = len(df["vector"].iloc[0])
+    with PaperWriter(output_dir, len(df), dim=dim) as writer:
+        for start in range(0, len(df), batch_size):
+            end = start + batch_size
+            batch = df.iloc[start:end]
+            vectors = np.array(batch["vector"].tolist(), dtype=np.float32)
+            writer.write_batch(batch[PAPER_FIELDS].to_dict("records"), vectors)
+
+
+def is_ingest_dir(path: str) -> bool:
+    path = Path(path)
+    return (path / METADATA_FILE).exists() and (path / VECTORS_FILE).exists()
+
+
+def read_vectors(input_dir: str) -> np.ndarray:
+    """Memory map the embeddings matrix: rows are only paged in from disk when they are sliced."""
+    return np.load(Path(input_dir) / VECTORS_FILE, mmap_mode="r")
+
+
+def count_papers(input_dir: str) -> int:
+    return pq.ParquetFile(Path(input_dir) / METADATA_FILE).metadata.num_rows
+
+
+def iter_paper_batches(input_dir: str, batch_size: int, offset: int = 0) -> t.Iterator[t.Tuple[int, t.List[dict]]]:
+    """Lazily yield `(start, papers)` batches starting at row `offset`.
+    Each paper's `vector` is a row view of the memory-mapped matrix, not a copy.
+    """
+    vectors = read_vectors(input_dir)
+    parquet_file = pq.ParquetFile(Path(input_dir) / METADATA_FILE)
+
+    # Skip whole row groups before `offset` without decoding them
+    row_groups, position = [], 0
+    for i in range(parquet_file.num_row_groups):
+        num_rows = parquet_file.metadata.row_group(i).num_rows
+        if row_groups or position + num_rows > offset:
+            row_groups.append(i)
+        else:
+            position += num_rows
+    if not row_groups:
+        return
+
+    for batch in parquet_file.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=PAPER_FIELDS):
+        skip = max(0, offset - position)
+        papers = batch.to_pylist()[skip:]
+        start = position + skip
+        for i, paper in enumerate(papers):
+            paper["vector"] = vectors[start + i]
+        position += batch.num_rows
+        if papers:
+            yield start, papers
+
+
+def vector_to_bytes(vector) -> t.Union[bytes, memoryview]:
+    # Rows of the memory-mapped ingest matrix, or of a chunk encoded by a `VectorCodec`, are already contiguous:
+    # hand redis a byte view, not a copy
+    if isinstance(vector, np.ndarray) and vector.dtype in (np.float32, np.float16) and vector.flags.c_contiguous:
+        return memoryview(vector).cast("B")
+    return np.array(vector, dtype=np.float32).tobytes()
+
+
+def _digest(values: t.List[str]) -> str:
+    return hashlib.blake2b("\x1f".join(map(str, values)).encode(), digest_size=8).hexdigest()
+
+
+def content_hash(paper: dict) -> str:
+    """Hash of the embedded text of a paper: the paper needs a new vector when it changes."""
+    return _digest([paper["title"], paper["abstract"]])
+
+
+def metadata_hash(paper: dict) -> str:
+    return _digest([paper[field] for field in METADATA_FIELDS])
+
+
+def paper_to_mapping(paper: dict, vector=None) -> dict:
+    """`vector` overrides the paper's own vector, e.g. once compressed by a `VectorCodec`."""
+    return {
+        "paper_id": paper["id"],
+        "categories": paper["categories"],
+        "title": paper["title"],
+        "year": paper["year"],
+        "authors": paper["authors"],
+        "abstract": paper["abstract"],
+        "update_date": paper["update_date"],
+        "doi": paper["doi"],
+        "journal-ref": paper["journal-ref"],
+        "submitter": paper["submitter"],
+        "vector": vector_to_bytes(paper["vector"] if vector is None else vector),
+        # Compared by `data/sync_papers.py` to the next snapshot
+        "content_hash": content_hash(paper),
+        "metadata_hash": metadata_hash(paper),
+    }
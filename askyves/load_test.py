@@ -0,0 +1,241 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from askyves.ingest import EMBEDDING_DIM, PaperWriter
+from askyves.vector_codec import normalize
+from config import DEFAULT_YEARS
+
+logger = logging.getLogger(__name__)
+
+MODES = ["retriever", "qa"]
+
+SYNTHETIC_CATEGORIES = ["cs.LG", "cs.CL", "cs.CV", "cs.AI", "stat.ML", "math.OC", "physics.comp-ph", "q-bio.NC"]
+SYNTHETIC_WORDS = (
+    "model network learning data training neural graph attention language image inference gradient optimization "
+    "bayesian kernel representation robust sparse convex stochastic embedding transformer retrieval question answer "
+    "benchmark dataset evaluation method approach results performance theory algorithm analysis"
+).split()
+SYNTHETIC_CLUSTERS = 64
+SYNTHETIC_BATCH_SIZE = 10_000
+
+Query = Tuple[str, List[str]]
+
+
+def read_query_log(path: str) -> List[Query]:
+    """One question per line, optionally followed by the tab-separated first and last years of its date filter."""
+    queries = []
+    with open(path, "r") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if not fields[0].strip():
+                continue
+            start_year, end_year = (int(fields[1]), int(fields[2])) if len(fields) >= 3 else DEFAULT_YEARS
+            queries.append((fields[0].strip(), list(map(str, range(start_year, end_year + 1)))))
+    return queries
+
+
+def write_synthetic_corpus(output_dir: str, num_papers: int, dim: int = EMBEDDING_DIM, seed: int = 0) -> None:
+    """Random papers in the ingest format, to load into a local Redis Stack with `data/load_data_in_redis.py`.
+    Vectors are drawn around a few cluster centres, so that HNSW graphs and filters behave as on real embeddings.
+    """
+    rng = np.random.default_rng(seed)
+    centres = normalize(rng.normal(size=(SYNTHETIC_CLUSTERS, dim)).astype(np.float32))
+    with PaperWriter(output_dir, num_papers, dim=dim) as writer:
+        for start in range(0, num_papers, SYNTHETIC_BATCH_SIZE):
+            size = min(SYNTHETIC_BATCH_SIZE, num_papers - start)
+            clusters = rng.integers(SYNTHETIC_CLUSTERS, size=size)
+            vectors = normalize(centres[clusters] + 0.5 * rng.normal(size=(size, dim)).astype(np.float32) / dim**0.5)
+            papers = []
+            for i, year in enumerate(rng.integers(2007, 2023, size=size), start):
+                categories = rng.choice(SYNTHETIC_CATEGORIES, size=rng.integers(1, 4), replace=False)
+                papers.append(
+                    {
+                        "id": f"synthetic.{i:07d}",
+                        "title": " ".join(rng.choice(SYNTHETIC_WORDS, size=8)).capitalize(),
+                        "year": str(year),
+                        "authors": f"Author {i % 997}, Author {i % 991}",
+                        "categories": ",".join(categories),
+                        "abstract": " ".join(rng.choice(SYNTHETIC_WORDS, size=rng.integers(80, 200))).capitalize(),
+                        "update_date": f"{year}-01-01",
+                        "doi": "",
+                        "journal-ref": "",
+                        "submitter": f"Submitter {i % 200}",
+                    }
+                )
+            writer.write_batch(papers, vectors)
+            print(f"{start + size}/{num_papers} synthetic papers written")
+
+
+def _hit_counts(stats: dict) -> Tuple[int, int]:
+    # The query embedding cache counts local and Redis hits apart
+    hits = sum(value for key, value in stats.items() if key.endswith("hits"))
+    return hits, hits + stats["misses"]
+
+
+def cache_stats(document_store, answer_cache=None) -> dict:
+    from askyves import embedder
+
+    caches = {"query_embedding": embedder.query_cache, "document": getattr(document_store, "document_cache", None)}
+    caches["answer"] = answer_cache
+    return {name: cache.info() for name, cache in caches.items() if cache is not None}
+
+
+def hit_rates(before: dict, after: dict) -> dict:
+    """Hit rate of each cache during the run, from its stats before and after."""
+    rates = {}
+    for name in after:
+        hits_before, lookups_before = _hit_counts(before[name])
+        hits_after, lookups_after = _hit_counts(after[name])
+        lookups = lookups_after - lookups_before
+        rates[name] = (hits_after - hits_before) / lookups if lookups else None
+    return rates
+
+
+def run_load(
+    call: Callable[[int, Query], object],
+    queries: List[Query],
+    num_requests: int,
+    concurrency: int,
+    qps: Optional[float] = None,
+) -> dict:
+    """Send `num_requests` queries, cycling through `queries`, from `concurrency` threads.
+    With `qps`, requests are started on a fixed schedule (open loop) and their latency is measured from the time
+    they were due, so that queueing behind slow requests is counted. Without it, every thread sends its next
+    request as soon as the previous one is answered (closed loop).
+    """
+    latencies, errors = [], Counter()
+    lock = threading.Lock()
+
+    def send(i: int, due: Optional[float]) -> None:
+        start_time = time.perf_counter() if due is None else due
+        try:
+            call(i, queries[i % len(queries)])
+            error = None
+        except Exception as e:
+            logger.debug("Request %d failed", i, exc_info=True)
+            error = type(e).__name__
+        latency = time.perf_counter() - start_time
+        with lock:
+            latencies.append(latency)
+            if error is not None:
+                errors[error] += 1
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i in range(num_requests):
+            due = None
+            if qps:
+                due = start_time + i / qps
+                time.sleep(max(0.0, due - time.perf_counter()))
+            executor.submit(send, i, due)
+    duration = time.perf_counter() - start_time
+
+    latencies_ms = 1000 * np.array(latencies)
+    return {
+        "requests": num_requests,
+        "concurrency": concurrency,
+        "target_qps": qps,
+        "duration_s": duration,
+        "throughput_qps": num_requests / duration,
+        "error_rate": sum(errors.values()) / num_requests,
+        "errors": dict(errors),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "max_ms": float(latencies_ms.max()),
+    }
+
+
+def load_test(
+    queries: List[Query],
+    mode: str,
+    num_requests: int,
+    concurrency: int,
+    qps: Optional[float] = None,
+    top_k: int = 10,
+    random_embeddings: bool = False,
+) -> dict:
+    """Replay `queries` against the document store only (`retriever`) or the full QA pipeline (`qa`), built
+    from the same settings as the app.
+    """
+    from askyves.pipeline import build_answer_cache, build_document_store, build_pipeline, make_qa_query
+
+    answer_cache = None
+    if mode == "qa":
+        pipe = build_pipeline()
+        document_store = pipe.get_document_store()
+        answer_cache = build_answer_cache(pipe)
+
+        def call(i: int, query: Query):
+            return make_qa_query(pipe, text=query[0], date_range=query[1], answer_cache=answer_cache)
+
+    elif random_embeddings:
+        # No model to download or run: measures Redis and the document store alone
+        document_store = build_document_store()
+        codec = document_store.codec
+        dim = codec.dim if codec.components is None else codec.components.shape[1]
+        vectors = normalize(np.random.default_rng(0).normal(size=(len(queries), dim)).astype(np.float32))
+
+        def call(i: int, query: Query):
+            filters = {"date_range": query[1]}
+            return document_store.query_by_embedding(vectors[i % len(queries)], filters=filters, top_k=top_k)
+
+    else:
+        document_store = build_document_store()
+
+        def call(i: int, query: Query):
+            return document_store.query(query[0], filters={"date_range": query[1]}, top_k=top_k)
+
+    before = cache_stats(document_store, answer_cache)
+    report = {"mode": mode, **run_load(call, queries, num_requests, concurrency, qps)}
+    report["cache_hit_rates"] = hit_rates(before, cache_stats(document_store, answer_cache))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a query log against the retriever or the QA pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="replay the query log and report latency and throughput")
+    run_parser.add_argument("--queries", required=True, help="one question per line, optionally <TAB>start<TAB>end")
+    run_parser.add_argument("--mode", choices=MODES, default="retriever", help="document store only or full QA")
+    run_parser.add_argument("--requests", type=int, help="number of requests, the size of the query log by default")
+    run_parser.add_argument("--concurrency", type=int, default=8, help="concurrent requests")
+    run_parser.add_argument("--qps", type=float, help="target queries per second, as fast as possible by default")
+    run_parser.add_argument("--top-k", type=int, default=10, help="retriever mode: documents per query")
+    run_parser.add_argument(
+        "--random-embeddings", action="store_true", help="retriever mode: search random vectors, without the model"
+    )
+    run_parser.add_argument("--output", help="also write the report to this JSON file")
+
+    corpus_parser = subparsers.add_parser("synthetic-corpus", help="write a random corpus in the ingest format")
+    corpus_parser.add_argument("--output", default="data/synthetic_corpus", help="ingest directory to write")
+    corpus_parser.add_argument("--papers", type=int, default=100_000, help="number of papers")
+    corpus_parser.add_argument("--dim", type=int, default=EMBEDDING_DIM, help="vector dimension")
+    args = parser.parse_args()
+
+    if args.command == "synthetic-corpus":
+        write_synthetic_corpus(args.output, args.papers, args.dim)
+    else:
+        query_log = read_query_log(args.queries)
+        results = load_test(
+            query_log,
+            mode=args.mode,
+            num_requests=args.requests or len(query_log),
+            concurrency=args.concurrency,
+            qps=args.qps,
+            top_k=args.top_k,
+            random_embeddings=args.random_embeddings,
+        )
+        print(json.dumps(results, indent=2))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
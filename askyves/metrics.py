@@ -0,0 +1,171 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Iterator, Optional
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, multiprocess, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# Read from the environment rather than `config`: offline jobs import the embedder without any Redis settings
+# Questions slower than this are logged with their per-stage breakdown, 0 to disable
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "5"))
+# Wrap every stage in an OpenTelemetry span, exported by whatever tracer provider the process configures
+OTEL_TRACING = os.getenv("OTEL_TRACING", "false").lower() == "true"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGE_SECONDS = Histogram(
+    "askyves_stage_seconds", "Latency of each stage of the QA pipeline", ["stage"], buckets=LATENCY_BUCKETS
+)
+QUESTION_SECONDS = Histogram("askyves_question_seconds", "End-to-end latency of a question", buckets=LATENCY_BUCKETS)
+REDIS_ROUND_TRIPS = Counter("askyves_redis_round_trips_total", "Redis round trips", ["operation"])
+REDIS_PAYLOAD_BYTES = Counter(
+    "askyves_redis_payload_bytes_total", "Bytes of Redis commands and replies", ["operation", "direction"]
+)
+BATCH_SIZE = Histogram(
+    "askyves_batch_size", "Requests run in one micro-batch", ["batcher"], buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+BATCH_WAIT_SECONDS = Histogram(
+    "askyves_batch_wait_seconds", "Time requests wait for their micro-batch", ["batcher"], buckets=LATENCY_BUCKETS
+)
+BATCH_REJECTED = Counter("askyves_batch_rejected_total", "Requests dropped by a micro-batcher", ["batcher", "reason"])
+DOCUMENT_CACHE_ENTRIES = Gauge("askyves_document_cache_entries", "Papers held by the document cache")
+DOCUMENT_CACHE_HIT_RATE = Gauge("askyves_document_cache_hit_rate", "Share of the hits found in the document cache")
+
+# Breakdown of the question being answered by the current thread or task, see `track_question`
+_breakdown: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("breakdown", default=None)
+_server_lock = threading.Lock()
+_server_port = None
+
+
+@functools.lru_cache(maxsize=None)
+def _tracer():
+    try:
+        from opentelemetry import trace
+    except ImportError as e:
+        raise ImportError("OTEL_TRACING needs OpenTelemetry: pip install opentelemetry-api opentelemetry-sdk") from e
+    return trace.get_tracer("askyves")
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage into the `askyves_stage_seconds` histogram and the breakdown of the current question.
+    Stages can be nested, e.g. `retriever` includes `embed_query` and `knn_search`.
+    """
+    span = _tracer().start_as_current_span(name) if OTEL_TRACING else contextlib.nullcontext()
+    start_time = time.perf_counter()
+    try:
+        with span:
+            yield
+    finally:
+        seconds = time.perf_counter() - start_time
+        STAGE_SECONDS.labels(name).observe(seconds)
+        breakdown = _breakdown.get()
+        if breakdown is not None:
+            breakdown["stages"][name] = breakdown["stages"].get(name, 0.0) + seconds
+
+
+def payload_size(value) -> int:
+    """Approximate size in bytes of Redis command arguments or of a parsed Redis reply."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(payload_size(key) + payload_size(item) for key, item in value.items())
+    return 0 if value is None else len(str(value))
+
+
+def record_round_trip(operation: str, sent: int, received: int) -> None:
+    REDIS_ROUND_TRIPS.labels(operation).inc()
+    REDIS_PAYLOAD_BYTES.labels(operation, "sent").inc(sent)
+    REDIS_PAYLOAD_BYTES.labels(operation, "received").inc(received)
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown["redis_round_trips"] += 1
+        breakdown["redis_bytes_sent"] += sent
+        breakdown["redis_bytes_received"] += received
+
+
+def execute_pipeline(pipe, operation: str, raise_on_error: bool = True) -> list:
+    """`pipe.execute()`, recorded as one round trip of `operation`. Without `raise_on_error`, the errors of the
+    commands are returned in place of their replies.
+    """
+    sent = payload_size([args for args, _ in pipe.command_stack])
+    responses = pipe.execute(raise_on_error=raise_on_error)
+    record_round_trip(operation, sent, payload_size(responses))
+    return responses
+
+
+async def aexecute_pipeline(pipe, operation: str, raise_on_error: bool = True) -> list:
+    sent = payload_size([args for args, _ in pipe.command_stack])
+    responses = await pipe.execute(raise_on_error=raise_on_error)
+    record_round_trip(operation, sent, payload_size(responses))
+    return responses
+
+
+@contextlib.contextmanager
+def track_question(question: str) -> Iterator[dict]:
+    """Collect the stages and Redis round trips of one question, and log them when it is slower than
+    `SLOW_QUERY_SECONDS`.
+    """
+    breakdown = {"stages": {}, "redis_round_trips": 0, "redis_bytes_sent": 0, "redis_bytes_received": 0}
+    token = _breakdown.set(breakdown)
+    start_time = time.perf_counter()
+    try:
+        with stage("question"):
+            yield breakdown
+    finally:
+        _breakdown.reset(token)
+        seconds = time.perf_counter() - start_time
+        QUESTION_SECONDS.observe(seconds)
+        if SLOW_QUERY_SECONDS and seconds > SLOW_QUERY_SECONDS:
+            breakdown["stages"] = {name: round(value, 4) for name, value in breakdown["stages"].items()}
+            logger.warning("Slow question (%.2fs): %r %s", seconds, question, json.dumps(breakdown))
+
+
+def instrument_node(node, name: str):
+    """Time the `run` and `run_batch` of a haystack node as the `name` stage. haystack still sees the original
+    signatures, through `functools.wraps`, to dispatch the pipeline parameters.
+    """
+    for method_name in ("run", "run_batch"):
+        method = getattr(node, method_name, None)
+        if method is None:
+            continue
+
+        @functools.wraps(method)
+        def timed(*args, _method=method, **kwargs):
+            with stage(name):
+                return _method(*args, **kwargs)
+
+        setattr(node, method_name, timed)
+    return node
+
+
+def start_metrics_server(port: int) -> None:
+    """Serve the metrics on `http://<host>:<port>/metrics`, once per process. With `PROMETHEUS_MULTIPROC_DIR` set,
+    e.g. for `askyves.service`, the metrics of every process started from this one are aggregated.
+    """
+    global _server_port
+    with _server_lock:
+        if _server_port is None:
+            registry = REGISTRY
+            if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+                registry = CollectorRegistry()
+                multiprocess.MultiProcessCollector(registry)
+            try:
+                start_http_server(port, registry=registry)
+            except OSError as e:
+                # e.g. another app or service process on the same host already serves its metrics there
+                logger.warning("Prometheus metrics not served, port %d unavailable: %s", port, e)
+                return
+            _server_port = port
+            logger.info("Prometheus metrics served on port %d", port)
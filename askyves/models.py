@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+READER_MODEL_NAME = "deepset/roberta-base-squad2"
+READER_CONTEXT_WINDOW_SIZE = 2000
+
+# Read from the environment rather than `config`: offline jobs import this module without any Redis settings.
+# "torch" runs the original models, "onnx" their int8-quantized ONNX exports (see `askyves.onnx_backend`)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", str(Path(__file__).parent.parent / "models" / "onnx"))
+if INFERENCE_BACKEND not in ("torch", "onnx"):
+    raise ValueError(f"INFERENCE_BACKEND must be 'torch' or 'onnx', not {INFERENCE_BACKEND!r}")
+
+# Models are loaded once per process on first use, and shared by every caller of the process.
+# Heavy libraries (torch, sentence-transformers, haystack) are only imported by the loaders below.
+_models: Dict[str, object] = {}
+_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_load(key: str, loader: Callable[[], object]) -> object:
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    # One lock per model: concurrent first calls load it only once, without blocking the other models
+    with lock:
+        if key not in _models:
+            start_time = time.perf_counter()
+            _models[key] = loader()
+            logger.info("Loaded %s in %.1fs", key, time.perf_counter() - start_time)
+    return _models[key]
+
+
+def use_gpu() -> bool:
+    import torch
+
+    return torch.cuda.is_available()
+
+
+def embedding_model_id(model_name: str = EMBEDDING_MODEL_NAME, backend: str = INFERENCE_BACKEND) -> str:
+    """Identifies the vectors a model produces: the ONNX export is quantized, so it does not give the same ones."""
+    return f"{model_name}@{backend}"
+
+
+def get_sentence_transformer(model_name: str = EMBEDDING_MODEL_NAME, backend: str = INFERENCE_BACKEND):
+    def load():
+        if backend == "onnx":
+            from askyves.onnx_backend import OnnxSentenceEncoder, model_dir
+
+            return OnnxSentenceEncoder(model_dir(model_name, ONNX_MODEL_DIR))
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(model_name)
+
+    return _get_or_load(f"sentence_transformer:{embedding_model_id(model_name, backend)}", load)
+
+
+def get_reader(model_name: str = READER_MODEL_NAME, backend: str = INFERENCE_BACKEND):
+    def load():
+        from haystack.nodes.reader.farm import FARMReader
+
+        model_name_or_path = model_name
+        if backend == "onnx":
+            from askyves.onnx_backend import model_dir
+
+            # FARMReader picks the ONNX runtime by itself when the directory holds a `model.onnx`
+            model_name_or_path = str(model_dir(model_name, ONNX_MODEL_DIR))
+        return FARMReader(
+            model_name_or_path=model_name_or_path, use_gpu=use_gpu(), context_window_size=READER_CONTEXT_WINDOW_SIZE
+        )
+
+    return _get_or_load(f"reader:{model_name}@{backend}", load)
+
+
+def get_reader_tokenizer(model_name: str = READER_MODEL_NAME):
+    """The tokenizer FARMReader loads for `model_name`, without the model, e.g. to tokenize abstracts at ingest."""
+
+    def load():
+        from transformers import AutoTokenizer
+
+        return AutoTokenizer.from_pretrained(model_name, use_fast=True)
+
+    return _get_or_load(f"reader_tokenizer:{model_name}", load)
+
+
+def warm_up(embedding_model: str = EMBEDDING_MODEL_NAME, reader_model: str = READER_MODEL_NAME) -> None:
+    """Eagerly load the models and run one forward pass each, so that the first user query does not pay for it."""
+    from haystack.schema import Document
+
+    start_time = time.perf_counter()
+    get_sentence_transformer(embedding_model).encode(["warm up"])
+    get_reader(reader_model).predict(query="warm up", documents=[Document(content="warm up")], top_k=1)
+    logger.info("Models warmed up in %.1fs", time.perf_counter() - start_time)
@@ -0,0 +1,389 @@
+import argparse
+import functools
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Generator, List, Optional, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import redis
+from haystack.document_stores.base import BaseDocumentStore
+from haystack.schema import Document
+
+from askyves import metrics
+from askyves.embedder import make_query_embeddings
+from askyves.filters import FilterNode, parse_filters
+from askyves.ingest import METADATA_FILE, PAPER_FIELDS, PaperWriter, read_vectors
+from askyves.vector_codec import CODEC_FILE, CODEC_KEY, VectorCodec
+from config import INDEX_NAME, PAPER_PREFIX, REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 65_536
+# Below this fraction of matching papers, only the matching rows are scored instead of the whole matrix
+SPARSE_FILTER_RATIO = 0.05
+EXPORT_BATCH_SIZE = 1000
+
+
+def _union(bitmaps: List[np.ndarray], size: int) -> np.ndarray:
+    return functools.reduce(np.bitwise_or, bitmaps, np.zeros(size, dtype=np.uint8))
+
+
+class NumpyDocumentStore(BaseDocumentStore):
+    """Read-only, in-process alternative to `RedisDocumentStore` with the same query interface, over the columnar
+    ingest format (see `askyves.ingest`), e.g. for development, CI or a local copy next to the app.
+    KNN searches are blocked matrix products over the memory-mapped vectors, and filters are evaluated on bitmaps
+    of the papers of each year and category, precomputed at startup.
+    The vectors are expected to be normalised, as written by `askyves.build_embeddings`, so that scores are the same
+    as those of a Redis index with the same distance metric.
+    """
+
+    def __init__(
+        self, path: str, index: str = INDEX_NAME, distance_metric: str = "COSINE", block_size: int = BLOCK_SIZE
+    ):
+        super().__init__()
+        self.index = index
+        self.label_index = None
+        self.similarity = "cosine"
+        self.return_embedding = False
+        self.block_size = block_size
+        self.vectors = read_vectors(path)
+        self.papers = pq.read_table(Path(path) / METADATA_FILE, columns=PAPER_FIELDS, memory_map=True)
+        # An export of a Redis index holds vectors in the index space, queries have to be projected the same way
+        codec_path = Path(path) / CODEC_FILE
+        if codec_path.exists():
+            self.codec = VectorCodec.load(codec_path)
+        else:
+            self.codec = VectorCodec(dim=self.vectors.shape[1], distance_metric=distance_metric)
+        self._bitmap_size = (len(self.papers) + 7) // 8
+        self._year_bitmaps = self._build_year_bitmaps()
+        self._category_bitmaps = self._build_category_bitmaps()
+        self._submitters = None
+        self._row_by_id = None
+
+    def _build_year_bitmaps(self) -> Dict[int, np.ndarray]:
+        years = self.papers["year"]
+        # Papers stored in Redis without a year are exported with an empty one
+        years = pc.if_else(pc.equal(years, ""), pa.scalar(None, years.type), years)
+        years = pc.cast(years, pa.int32()).fill_null(0).to_numpy()
+        return {int(year): np.packbits(years == year) for year in np.unique(years)}
+
+    def _build_category_bitmaps(self) -> Dict[str, np.ndarray]:
+        # Categories are comma separated, like the tags of the Redis index; tags are case insensitive
+        categories = pc.split_pattern(pc.utf8_lower(self.papers["categories"].fill_null("")), ",").combine_chunks()
+        rows = pc.list_parent_indices(categories).to_numpy()
+        names = pc.utf8_trim_whitespace(categories.flatten()).dictionary_encode()
+        codes = names.indices.to_numpy()
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes, minlength=len(names.dictionary))
+        bitmaps = {}
+        for name, category_rows in zip(names.dictionary.to_pylist(), np.split(rows[order], np.cumsum(counts)[:-1])):
+            mask = np.zeros(len(self.papers), dtype=bool)
+            mask[category_rows] = True
+            bitmaps[name] = np.packbits(mask)
+        return bitmaps
+
+    def _field_bitmap(self, field: str, operator: str, value) -> np.ndarray:
+        values = value if operator in ("$in", "$nin") else [value]
+        if field == "year":
+            if operator == "$range":
+                lowest = max(value.get("$gte", -np.inf), np.nextafter(value.get("$gt", -np.inf), np.inf))
+                highest = min(value.get("$lte", np.inf), np.nextafter(value.get("$lt", np.inf), -np.inf))
+                years = [year for year in self._year_bitmaps if lowest <= year <= highest]
+            else:
+                years = [int(year) for year in values]
+            bitmaps = [self._year_bitmaps[year] for year in years if year in self._year_bitmaps]
+        elif field == "categories":
+            bitmaps = [self._category_bitmaps.get(str(category).lower()) for category in values]
+            bitmaps = [bitmap for bitmap in bitmaps if bitmap is not None]
+        else:
+            # Too many submitters for bitmaps: compare the column, lowercased once
+            if self._submitters is None:
+                self._submitters = pc.utf8_lower(self.papers["submitter"].fill_null(""))
+            mask = pc.is_in(self._submitters, value_set=pa.array([str(v).lower() for v in values])).to_numpy()
+            bitmaps = [np.packbits(mask)]
+        bitmap = _union(bitmaps, self._bitmap_size)
+        return ~bitmap if operator in ("$ne", "$nin") else bitmap
+
+    def _bitmap(self, node: FilterNode) -> np.ndarray:
+        if node[0] == "$not":
+            return ~self._bitmap(node[1])
+        if node[0] in ("$and", "$or"):
+            combine = np.bitwise_and if node[0] == "$and" else np.bitwise_or
+            return functools.reduce(combine, [self._bitmap(child) for child in node[1]])
+        return self._field_bitmap(*node)
+
+    def _mask(self, filters: Optional[dict]) -> Optional[np.ndarray]:
+        """Boolean mask of the papers matching `filters`, None when every paper matches."""
+        node = parse_filters(filters)
+        if node is None:
+            return None
+        return np.unpackbits(self._bitmap(node), count=len(self.papers)).astype(bool)
+
+    def _dense_blocks(self) -> Generator[Tuple[np.ndarray, np.ndarray], None, None]:
+        for start in range(0, len(self.vectors), self.block_size):
+            end = min(start + self.block_size, len(self.vectors))
+            yield np.arange(start, end), self.vectors[start:end]
+
+    def _sparse_blocks(self, matching: np.ndarray) -> Generator[Tuple[np.ndarray, np.ndarray], None, None]:
+        for start in range(0, len(matching), self.block_size):
+            end = start + self.block_size
+            yield matching[start:end], self.vectors[matching[start:end]]
+
+    def _top_k(self, queries: np.ndarray, mask: Optional[np.ndarray], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and inner products of the `top_k` closest papers to each query, in order, scanning the vectors block
+        by block so that only one block is paged in at a time.
+        """
+        num_queries = len(queries)
+        best_rows = np.empty((num_queries, 0), dtype=np.int64)
+        best_scores = np.empty((num_queries, 0), dtype=np.float32)
+        if mask is not None and mask.sum() < SPARSE_FILTER_RATIO * len(mask):
+            blocks = self._sparse_blocks(np.flatnonzero(mask))
+            mask = None
+        else:
+            blocks = self._dense_blocks()
+
+        for rows, vectors in blocks:
+            scores = queries @ np.asarray(vectors, dtype=np.float32).T
+            if mask is not None:
+                scores[:, ~mask[rows]] = -np.inf
+            rows = np.broadcast_to(rows, scores.shape)
+            if scores.shape[1] > top_k:
+                keep = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+                scores, rows = np.take_along_axis(scores, keep, axis=1), np.take_along_axis(rows, keep, axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            if best_scores.shape[1] > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1, axis=1)[:, :top_k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def _distance(self, score: float) -> float:
+        """The `vector_score` Redis reports for an inner product `score` between normalised vectors."""
+        return 2 - 2 * score if self.codec.distance_metric == "L2" else 1 - score
+
+    @staticmethod
+    def paper_to_document(paper: dict, score: Optional[float] = None) -> Document:
+        return Document.from_dict(
+            {
+                "id": paper["id"],
+                "content": paper["abstract"],
+                "content_type": "text",
+                "meta": {
+                    "categories": paper["categories"],
+                    "name": paper["title"],
+                    "update_date": paper["update_date"],
+                },
+                "score": score,
+                "embedding": None,
+            }
+        )
+
+    def _to_documents(self, rows: np.ndarray, scores: np.ndarray, scale_score: bool) -> List[Document]:
+        found = np.isfinite(scores)
+        papers = self.papers.take(pa.array(rows[found])).to_pylist()
+        documents = []
+        for paper, score in zip(papers, scores[found]):
+            distance = self._distance(float(score))
+            # Same scores as `RedisDocumentStore.convert_hit_to_document`
+            documents.append(self.paper_to_document(paper, round(100 * distance, 1) if scale_score else distance))
+        return documents
+
+    def _embed(self, query_embs) -> np.ndarray:
+        if isinstance(query_embs, str) or (
+            isinstance(query_embs, list) and query_embs and isinstance(query_embs[0], str)
+        ):
+            query_embs = make_query_embeddings(query_embs)
+        return np.atleast_2d(self.codec.project(query_embs))
+
+    def query_by_embedding(
+        self,
+        query_emb: Union[str, np.ndarray],
+        filters: Optional[dict] = None,
+        top_k: int = 10,
+        index: Optional[str] = None,
+        return_embedding: Optional[bool] = None,
+        headers: Optional[Dict[str, str]] = None,
+        scale_score: bool = True,
+        **kwargs,
+    ) -> List[Document]:
+        (documents,) = self.query_by_embedding_batch(
+            self._embed(query_emb), filters, top_k, index, return_embedding, headers, scale_score
+        )
+        return documents
+
+    def query_by_embedding_batch(
+        self,
+        query_embs: Union[List[np.ndarray], np.ndarray],
+        filters: Optional[Union[dict, List[dict]]] = None,
+        top_k: int = 10,
+        index: Optional[str] = None,
+        return_embedding: Optional[bool] = None,
+        headers: Optional[Dict[str, str]] = None,
+        scale_score: bool = True,
+    ) -> List[List[Document]]:
+        """Queries sharing the same filters are scored together, in a single pass over the vectors."""
+        if return_embedding:
+            raise NotImplementedError("`return_embedding` is not implemented yet")
+        queries = self._embed(query_embs)
+        if not isinstance(filters, list):
+            filters = [filters] * len(queries)
+        if len(filters) != len(queries):
+            raise ValueError(f"Got {len(filters)} filters for {len(queries)} queries")
+
+        groups = {}
+        for i, query_filters in enumerate(filters):
+            groups.setdefault(json.dumps(query_filters, sort_keys=True, default=str), []).append(i)
+        documents = [None] * len(queries)
+        for indices in groups.values():
+            with metrics.stage("knn_search"):
+                rows, scores = self._top_k(queries[indices], self._mask(filters[indices[0]]), top_k)
+            with metrics.stage("convert_documents"):
+                for i, query_rows, query_scores in zip(indices, rows, scores):
+                    documents[i] = self._to_documents(query_rows, query_scores, scale_score)
+        return documents
+
+    def query(
+        self,
+        query: Optional[str],
+        filters: Optional[dict] = None,
+        top_k: int = 10,
+        custom_query: Optional[str] = None,
+        index: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        all_terms_must_match: bool = False,
+        scale_score: bool = True,
+    ) -> List[Document]:
+        return self.query_by_embedding(query, filters=filters, top_k=top_k, index=index, scale_score=scale_score)
+
+    def query_batch(
+        self,
+        queries: List[str],
+        filters: Optional[Union[dict, List[dict]]] = None,
+        top_k: int = 10,
+        custom_query: Optional[str] = None,
+        index: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        all_terms_must_match: bool = False,
+        scale_score: bool = True,
+    ) -> List[List[Document]]:
+        return self.query_by_embedding_batch(
+            list(queries), filters=filters, top_k=top_k, index=index, scale_score=scale_score
+        )
+
+    def get_document_count(
+        self,
+        filters: Optional[dict] = None,
+        index: Optional[str] = None,
+        only_documents_without_embedding: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> int:
+        if only_documents_without_embedding:
+            return 0
+        mask = self._mask(filters)
+        return len(self.papers) if mask is None else int(mask.sum())
+
+    def get_all_documents_generator(
+        self,
+        index: Optional[str] = None,
+        filters: Optional[dict] = None,
+        return_embedding: Optional[bool] = None,
+        batch_size: int = 10_000,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Generator[Document, None, None]:
+        mask = self._mask(filters)
+        for start in range(0, len(self.papers), batch_size):
+            batch = self.papers.slice(start, batch_size)
+            if mask is not None:
+                end = start + batch_size
+                batch = batch.filter(pa.array(mask[start:end]))
+            for paper in batch.to_pylist():
+                yield self.paper_to_document(paper)
+
+    def get_all_documents(
+        self,
+        index: Optional[str] = None,
+        filters: Optional[dict] = None,
+        return_embedding: Optional[bool] = None,
+        batch_size: int = 10_000,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> List[Document]:
+        return list(self.get_all_documents_generator(index, filters, return_embedding, batch_size, headers))
+
+    def get_documents_by_id(
+        self,
+        ids: List[str],
+        index: Optional[str] = None,
+        batch_size: int = 10_000,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> List[Document]:
+        if self._row_by_id is None:
+            self._row_by_id = {paper_id: row for row, paper_id in enumerate(self.papers["id"].to_pylist())}
+        rows = [self._row_by_id[paper_id] for paper_id in ids if paper_id in self._row_by_id]
+        return [self.paper_to_document(paper) for paper in self.papers.take(pa.array(rows, pa.int64())).to_pylist()]
+
+    def get_document_by_id(
+        self, id: str, index: Optional[str] = None, headers: Optional[Dict[str, str]] = None
+    ) -> Optional[Document]:
+        documents = self.get_documents_by_id([id], index=index, headers=headers)
+        return documents[0] if documents else None
+
+    def get_all_labels(self, index=None, filters=None, headers=None) -> list:
+        return []
+
+    def get_label_count(self, index: Optional[str] = None, headers: Optional[Dict[str, str]] = None) -> int:
+        return 0
+
+    # The store is a read-only view of an ingest directory: rebuild the directory to change its content
+    def _read_only(self, *args, **kwargs):
+        raise NotImplementedError("NumpyDocumentStore is read-only, rebuild its ingest directory instead")
+
+    write_documents = _read_only
+    write_labels = _read_only
+    update_document_meta = _read_only
+    delete_documents = _read_only
+    delete_labels = _read_only
+    delete_index = _read_only
+
+    def _create_document_field_map(self) -> Dict:
+        return {}
+
+
+def export_redis(redis_client: redis.Redis, output_dir: str, batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    """Write the papers stored in Redis to the ingest format, for `NumpyDocumentStore`. Vectors are written in the
+    index space, decoded to float32, along with the codec to project queries with.
+    """
+    codec = VectorCodec.from_mapping(redis_client.hgetall(CODEC_KEY))
+    keys = sorted(redis_client.scan_iter(f"{PAPER_PREFIX}*", count=10_000))
+    fields = ["paper_id", *[field for field in PAPER_FIELDS if field != "id"], "vector"]
+    with PaperWriter(output_dir, len(keys), dim=codec.dim) as writer:
+        for start in range(0, len(keys), batch_size):
+            end = start + batch_size
+            with redis_client.pipeline(transaction=False) as pipe:
+                for key in keys[start:end]:
+                    pipe.hmget(key, fields)
+                values = pipe.execute()
+            papers = [
+                {
+                    ("id" if field == "paper_id" else field): (value or b"").decode()
+                    for field, value in zip(fields[:-1], row)
+                }
+                for row in values
+            ]
+            writer.write_batch(papers, np.stack([codec.decode(row[-1]) for row in values]))
+            logger.info("%d/%d papers exported", min(end, len(keys)), len(keys))
+    codec.save(Path(output_dir) / CODEC_FILE)
+    return len(keys)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the papers stored in Redis for NumpyDocumentStore")
+    parser.add_argument("output", help="ingest directory to write")
+    args = parser.parse_args()
+    print(f"{export_redis(redis.from_url(REDIS_URL), args.output)} papers exported to {args.output}")
@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+
+from askyves.models import EMBEDDING_MODEL_NAME, ONNX_MODEL_DIR, READER_MODEL_NAME
+
+ONNX_FILE = "model.onnx"
+ENCODER_CONFIG_FILE = "encoder_config.json"
+OPSET_VERSION = 13
+
+
+def _import_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError("The ONNX backend needs onnxruntime: pip install 'farm-haystack[onnx]==1.10.0'") from e
+    return onnxruntime
+
+
+def model_dir(model_name: str, output_dir: Union[str, Path] = ONNX_MODEL_DIR) -> Path:
+    return Path(output_dir) / model_name.replace("/", "__")
+
+
+def quantize(onnx_path: Path) -> None:
+    """Dynamic int8 quantization of the weights, in place: activations are quantized on the fly at inference."""
+    _import_onnxruntime()
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized_path = onnx_path.with_suffix(".quantized.onnx")
+    quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+    os.replace(quantized_path, onnx_path)
+
+
+def export_embedder(model_name: str = EMBEDDING_MODEL_NAME, output_dir: Union[str, Path] = ONNX_MODEL_DIR) -> Path:
+    """Export the transformer of a sentence-transformers model to ONNX. Pooling and normalisation are cheap and
+    are done in NumPy by `OnnxSentenceEncoder`.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    export_dir = model_dir(model_name, output_dir)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+    transformer.tokenizer.save_pretrained(export_dir)
+
+    dummy = transformer.tokenizer(["warm up"], return_tensors="pt")
+    dynamic_axes = {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"}}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer.auto_model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            str(export_dir / ONNX_FILE),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={**dynamic_axes, "last_hidden_state": {0: "batch", 1: "sequence"}},
+            opset_version=OPSET_VERSION,
+        )
+    quantize(export_dir / ONNX_FILE)
+    (export_dir / ENCODER_CONFIG_FILE).write_text(json.dumps({"max_seq_length": model.max_seq_length}))
+    return export_dir
+
+
+def export_reader(model_name: str = READER_MODEL_NAME, output_dir: Union[str, Path] = ONNX_MODEL_DIR) -> Path:
+    """Export a QA model with haystack's converter. The result can be loaded by `FARMReader` like a model name."""
+    from haystack.nodes.reader.farm import FARMReader
+
+    export_dir = model_dir(model_name, output_dir)
+    # haystack's own `quantize` flag writes a separate `model-quantized.onnx` that FARMReader never loads
+    FARMReader.convert_to_onnx(model_name=model_name, output_path=export_dir, quantize=False)
+    quantize(export_dir / ONNX_FILE)
+    return export_dir
+
+
+class OnnxSentenceEncoder:
+    """Drop-in replacement for `SentenceTransformer.encode` running an int8 ONNX export with mean pooling."""
+
+    def __init__(self, export_dir: Union[str, Path], num_threads: int = 0):
+        from transformers import AutoTokenizer
+
+        onnxruntime = _import_onnxruntime()
+        export_dir = Path(export_dir)
+        if not (export_dir / ONNX_FILE).exists():
+            raise FileNotFoundError(f"No ONNX export in {export_dir}: run `python -m askyves.onnx_backend` first")
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        self.max_seq_length = json.loads((export_dir / ENCODER_CONFIG_FILE).read_text())["max_seq_length"]
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            str(export_dir / ONNX_FILE), options, providers=["CPUExecutionProvider"]
+        )
+
+    def encode(
+        self, sentences: Union[str, List[str]], batch_size: int = 32, normalize_embeddings: bool = False, **kwargs
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        embeddings = []
+        for start in range(0, len(sentences), batch_size):
+            end = start + batch_size
+            tokens = self.tokenizer(
+                sentences[start:end], padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np"
+            )
+            (hidden,) = self.session.run(
+                ["last_hidden_state"],
+                {"input_ids": tokens["input_ids"].astype(np.int64), "attention_mask": tokens["attention_mask"]},
+            )
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            embeddings.append(pooled.astype(np.float32))
+        embeddings = np.concatenate(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the embedder and the reader to int8-quantized ONNX")
+    parser.add_argument("--output", default=ONNX_MODEL_DIR, help="directory to write the exports to")
+    parser.add_argument("--embedding-model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--reader-model", default=READER_MODEL_NAME)
+    args = parser.parse_args()
+    print(f"Embedder exported to {export_embedder(args.embedding_model, args.output)}")
+    print(f"Reader exported to {export_reader(args.reader_model, args.output)}")
@@ -0,0 +1,93 @@
+import re
+from typing import List, Tuple
+
+from askyves.filters import NUMERIC_FIELDS
+from askyves.ingest import _digest, vector_to_bytes
+
+# An abstract is split into windows of PASSAGE_SENTENCES sentences, starting every PASSAGE_STRIDE sentences: with the
+# defaults, consecutive windows share one sentence, so that an answer spanning two sentences is in some window
+PASSAGE_SENTENCES = 3
+PASSAGE_STRIDE = 2
+# Fields of a passage hash returned by the KNN searches of `RedisDocumentStore` in passage mode
+PASSAGE_FIELDS = ["paper_id", "passage_start", "passage_end"]
+# Paper fields copied to its passages, so that the searches are pre-filtered like paper searches
+FILTER_FIELDS = ["year", "categories", "submitter"]
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """`(start, end)` character offsets of the sentences of `text`, leading and trailing whitespace excluded."""
+    spans, start = [], len(text) - len(text.lstrip())
+    for match in SENTENCE_END.finditer(text):
+        if match.start() > start:
+            spans.append((start, match.start()))
+        start = match.end()
+    end = len(text.rstrip())
+    if end > start:
+        spans.append((start, end))
+    return spans
+
+
+def split_passages(
+    text: str, sentences: int = PASSAGE_SENTENCES, stride: int = PASSAGE_STRIDE
+) -> List[Tuple[int, int]]:
+    """`(start, end)` character offsets of the overlapping sentence windows of `text`. A text of at most `sentences`
+    sentences is a single window.
+    """
+    if stride < 1 or stride > sentences:
+        raise ValueError(f"The stride must be between 1 and the window size {sentences}, not {stride}")
+    spans = sentence_spans(text)
+    if not spans:
+        return []
+    windows = []
+    for first in range(0, max(1, len(spans) - sentences + stride), stride):
+        last = min(first + sentences, len(spans)) - 1
+        windows.append((spans[first][0], spans[last][1]))
+    return windows
+
+
+def passage_key(prefix: str, paper_id: str, number: int) -> str:
+    return f"{prefix}{paper_id}:{number}"
+
+
+def passage_hash(paper: dict) -> str:
+    """Hash of the fields of a paper its passages are made of or copy: they are stale when it changes."""
+    return _digest([paper["title"], paper["abstract"], *(paper[field] for field in FILTER_FIELDS)])
+
+
+def empty_numeric_fields(paper: dict) -> List[str]:
+    """Filter fields without a value that RediSearch would have to parse as a number: it leaves hashes holding an
+    empty string there out of the index, so they are not stored.
+    """
+    return [field for field in FILTER_FIELDS if field in NUMERIC_FIELDS and paper[field] == ""]
+
+
+def passage_to_mapping(paper: dict, start: int, end: int, count: int, vector) -> dict:
+    """The passage only stores its offsets in the abstract, its text is read from the paper hash. `passage_hash` and
+    `passage_count` tell the loader when the passages of the paper are stale, and which ones to delete.
+    Empty numeric fields, see `empty_numeric_fields`, are left out.
+    """
+    empty = empty_numeric_fields(paper)
+    return {
+        "paper_id": paper["paper_id"],
+        "passage_start": start,
+        "passage_end": end,
+        **{field: paper[field] for field in FILTER_FIELDS if field not in empty},
+        "vector": vector_to_bytes(vector),
+        "passage_hash": paper["passage_hash"],
+        "passage_count": count,
+    }
+
+
+def group_passages(hits: list, top_k: int) -> list:
+    """Keep the closest passage hit of each paper, for the `top_k` papers with the closest passages. `hits` are
+    sorted by distance, as returned by the KNN search.
+    """
+    best = {}
+    for hit in hits:
+        if hit.paper_id not in best:
+            best[hit.paper_id] = hit
+            if len(best) == top_k:
+                break
+    return list(best.values())
@@ -0,0 +1,259 @@
+import time
+from typing import Iterator, Optional, Tuple
+
+from askyves import metrics
+from askyves.reader_policy import ReaderPolicy, reader_load
+from config import (
+    BATCH_MAX_QUEUE_DEPTH,
+    BATCH_TIMEOUT_SECONDS,
+    BATCH_WINDOW_MS,
+    DOCUMENT_CACHE_SIZE,
+    DOCUMENT_STORE,
+    EMBED_MAX_BATCH_SIZE,
+    MICRO_BATCHING,
+    NUMPY_STORE_PATH,
+    PASSAGE_CANDIDATES,
+    PASSAGE_INDEX_NAME,
+    PASSAGE_MODE,
+    READER_BUDGET_SECONDS,
+    READER_HIGH_LOAD,
+    READER_MAX_BATCH_SIZE,
+    READER_MIN_DOCUMENTS,
+    READER_SCORE_GAP,
+    READER_TOKEN_CACHE_SIZE,
+    READER_TOKENS,
+    REDIS_DISTANCE_METRIC,
+    REDIS_HOST,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_PASSWORD,
+    REDIS_PORT,
+    REDIS_READ_REPLICAS,
+    REDIS_RETRIES,
+    REDIS_SOCKET_TIMEOUT,
+    RERANK_CANDIDATES,
+    TOP_K_READER,
+    TOP_K_RETRIEVER,
+    WARM_UP_MODELS,
+)
+
+
+def build_document_store():
+    from askyves.embedder import configure_query_cache
+
+    if DOCUMENT_STORE == "numpy":
+        from askyves.numpy_document_store import NumpyDocumentStore
+
+        document_store = NumpyDocumentStore(NUMPY_STORE_PATH, distance_metric=REDIS_DISTANCE_METRIC)
+    else:
+        from askyves.redis_document_store import RedisDocumentStore
+
+        document_store = RedisDocumentStore(
+            host=[REDIS_HOST] + [host for host, _ in REDIS_READ_REPLICAS],
+            port=[int(REDIS_PORT)] + [int(port) for _, port in REDIS_READ_REPLICAS],
+            password=REDIS_PASSWORD,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            retries=REDIS_RETRIES,
+            rerank_candidates=RERANK_CANDIDATES,
+            document_cache_size=DOCUMENT_CACHE_SIZE,
+            passage_index=PASSAGE_INDEX_NAME if PASSAGE_MODE else None,
+            passage_candidates=PASSAGE_CANDIDATES,
+        )
+    # Back the in-process query embedding cache with Redis so that every app worker shares it
+    configure_query_cache(redis_client=getattr(document_store, "client", None))
+    return document_store
+
+
+def build_reader(document_store):
+    from askyves.models import get_reader
+
+    reader = get_reader()
+    if READER_TOKENS:
+        from askyves.reader_tokens import use_reader_tokens
+
+        # The tokens stored at ingest time are read from the papers: there are none in the in-process store
+        use_reader_tokens(reader, getattr(document_store, "client", None), maxsize=READER_TOKEN_CACHE_SIZE)
+    return reader
+
+
+def build_pipeline(micro_batching: bool = MICRO_BATCHING):
+    # haystack and the models are imported here rather than at module level, so that scripts only creating
+    # indexes (e.g. data/load_data_in_redis.py) do not pay for them at startup
+    from haystack.pipelines import ExtractiveQAPipeline
+
+    from askyves.models import warm_up
+    from askyves.retriever import CachedEmbeddingRetriever
+
+    if WARM_UP_MODELS:
+        warm_up()
+    document_store = build_document_store()
+    reader = build_reader(document_store)
+    if micro_batching:
+        from askyves.batching import batch_reader
+        from askyves.embedder import configure_query_batching
+
+        limits = {"window": BATCH_WINDOW_MS / 1000, "max_queue_depth": BATCH_MAX_QUEUE_DEPTH}
+        limits["timeout"] = BATCH_TIMEOUT_SECONDS
+        configure_query_batching(max_batch_size=EMBED_MAX_BATCH_SIZE, **limits)
+        batch_reader(reader, max_batch_size=READER_MAX_BATCH_SIZE, **limits)
+    retriever = metrics.instrument_node(CachedEmbeddingRetriever(document_store=document_store), "retriever")
+    reader = metrics.instrument_node(reader, "reader")
+    pipe = ExtractiveQAPipeline(reader, retriever)
+    # Shared by the questions of the process, so that its reader time estimate follows the load
+    pipe.reader_policy = ReaderPolicy(READER_BUDGET_SECONDS, READER_MIN_DOCUMENTS, READER_SCORE_GAP, READER_HIGH_LOAD)
+    return pipe
+
+
+def build_answer_cache(pipe):
+    from askyves.answer_cache import AnswerCache
+
+    # Answers are cached in Redis: there is no answer cache in front of the in-process store
+    redis_client = getattr(pipe.get_document_store(), "client", None)
+    return None if redis_client is None else AnswerCache(redis_client=redis_client)
+
+
+def _policy_budget(pipe, budget: Optional[float]) -> Tuple[Optional[ReaderPolicy], float]:
+    policy = getattr(pipe, "reader_policy", None)
+    if budget is None:
+        budget = 0 if policy is None else policy.budget
+    elif budget and policy is None:
+        policy = ReaderPolicy(budget)
+    return policy, budget
+
+
+def _cacheable(results: dict) -> bool:
+    """Answers cut by the load or the deadline depend on the moment they were computed: they are not cached."""
+    decisions = results.get("policy", {}).get("decisions", [])
+    return not any(decision["policy"] in ("load", "deadline") for decision in decisions)
+
+
+def _policy_record(budget: float, load: float, documents: list, read: int, decisions: list, start_time: float) -> dict:
+    return {
+        "budget_seconds": budget,
+        "load": round(load, 2),
+        "retrieved": len(documents),
+        "read": read,
+        "decisions": decisions,
+        "seconds": round(time.perf_counter() - start_time, 3),
+    }
+
+
+def read_within_budget(
+    pipe, policy: ReaderPolicy, text: str, date_range: list, budget: float, load: Optional[float] = None
+) -> dict:
+    """Answer within `budget` seconds of the start of the call, with the documents `policy` plans to read. They are
+    read in rounds that fit the rest of the budget: each round keeps its TOP_K_READER best answers, so the answers
+    are ranked as when the reader reads them all at once. `load` defaults to the fill ratio of the reader queue.
+    The results record the `policy` decisions.
+    """
+    start_time = time.perf_counter()
+    retriever, reader = pipe.get_node("Retriever"), pipe.get_node("Reader")
+    output, _ = retriever.run(root_node="Query", query=text, filters={"date_range": date_range}, top_k=TOP_K_RETRIEVER)
+    documents = output["documents"]
+    load = reader_load(reader) if load is None else load
+    depth, decisions = policy.plan(documents, load)
+
+    answers, read = [], 0
+    while read < depth:
+        size = policy.round_size(budget - (time.perf_counter() - start_time), depth - read)
+        if size == 0 and read:
+            decisions.append({"policy": "deadline", "documents": read})
+            break
+        # The best answers found so far need a first document, even past the deadline
+        end = read + max(1, size)
+        round_start = time.perf_counter()
+        output, _ = reader.run(query=text, documents=documents[read:end], top_k=TOP_K_READER)
+        policy.record(time.perf_counter() - round_start, end - read)
+        answers.extend(output["answers"])
+        read = end
+
+    # Answers of the same score stay in document order, as when the reader reads all the documents at once
+    answers = sorted(answers, reverse=True)[:TOP_K_READER]
+    record = _policy_record(budget, load, documents, read, decisions, start_time)
+    return {"query": text, "documents": documents, "answers": answers, "policy": record}
+
+
+def make_qa_query(
+    pipe, text: str, date_range: list, answer_cache=None, budget: Optional[float] = None, load: Optional[float] = None
+):
+    """Answer `text`. With a latency `budget` in seconds, by default the one of the reader policy of the pipeline,
+    the reader reads as many documents as fit it, see `read_within_budget`. A budget of 0 reads them all.
+    """
+    policy, budget = _policy_budget(pipe, budget)
+    with metrics.track_question(text):
+        if answer_cache is not None:
+            with metrics.stage("answer_cache"):
+                results, version = answer_cache.get(text, date_range, TOP_K_RETRIEVER, TOP_K_READER)
+            if results is not None:
+                return results
+
+        if budget:
+            results = read_within_budget(pipe, policy, text, date_range, budget, load)
+        else:
+            results = pipe.run(
+                query=text,
+                params={
+                    "Retriever": {"top_k": TOP_K_RETRIEVER, "filters": {"date_range": date_range}},
+                    "Reader": {"top_k": TOP_K_READER},
+                },
+                debug=True,
+            )
+        if answer_cache is not None and _cacheable(results):
+            answer_cache.set(text, date_range, TOP_K_RETRIEVER, TOP_K_READER, results, version)
+        return results
+
+
+def stream_qa_query(
+    pipe, text: str, date_range: list, answer_cache=None, budget: Optional[float] = None, load: Optional[float] = None
+) -> Iterator[dict]:
+    """`make_qa_query` one step at a time, for progressive rendering. The first step holds the retrieved `documents`,
+    each following one the `document_answers` found so far, by document id, as the reader scores one document at a
+    time. The last step is `done` and holds the final `answers`, ranked as `make_qa_query` ranks them: the reader
+    keeps the same candidates per document and scores them independently of the other documents.
+    With a latency `budget`, only the documents the reader policy plans to read are read, until the deadline, and
+    the last step records the `policy` decisions. A cached question is answered in a single step.
+    """
+    policy, budget = _policy_budget(pipe, budget)
+    with metrics.track_question(text):
+        start_time = time.perf_counter()
+        if answer_cache is not None:
+            with metrics.stage("answer_cache"):
+                results, version = answer_cache.get(text, date_range, TOP_K_RETRIEVER, TOP_K_READER)
+            if results is not None:
+                yield {**results, "documents": [], "document_answers": {}, "done": True}
+                return
+
+        retriever, reader = pipe.get_node("Retriever"), pipe.get_node("Reader")
+        output, _ = retriever.run(
+            root_node="Query", query=text, filters={"date_range": date_range}, top_k=TOP_K_RETRIEVER
+        )
+        documents = output["documents"]
+        document_answers = {}
+        yield {"query": text, "documents": documents, "document_answers": {}, "done": False}
+
+        depth, decisions = len(documents), []
+        if budget:
+            load = reader_load(reader) if load is None else load
+            depth, decisions = policy.plan(documents, load)
+        top_k_per_document = getattr(reader, "top_k_per_candidate", TOP_K_READER)
+        for document in documents[:depth]:
+            remaining = budget - (time.perf_counter() - start_time)
+            if budget and document_answers and policy.round_size(remaining, 1) == 0:
+                decisions.append({"policy": "deadline", "documents": len(document_answers)})
+                break
+            read_start = time.perf_counter()
+            output, _ = reader.run(query=text, documents=[document], top_k=top_k_per_document)
+            if budget:
+                policy.record(time.perf_counter() - read_start, 1)
+            document_answers[document.id] = output["answers"]
+            yield {"query": text, "documents": documents, "document_answers": dict(document_answers), "done": False}
+
+        # Answers of the same score stay in document order, as when the reader scores all the documents at once
+        read = [document for document in documents if document.id in document_answers]
+        answers = sorted((answer for document in read for answer in document_answers[document.id]), reverse=True)
+        results = {"query": text, "answers": answers[:TOP_K_READER]}
+        if budget:
+            results["policy"] = _policy_record(budget, load, documents, len(read), decisions, start_time)
+        if answer_cache is not None and _cacheable(results):
+            answer_cache.set(text, date_range, TOP_K_RETRIEVER, TOP_K_READER, results, version)
+        yield {**results, "documents": documents, "document_answers": document_answers, "done": True}
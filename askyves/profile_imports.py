@@ -0,0 +1,44 @@
+import argparse
+import subprocess
+import sys
+from typing import List, Tuple
+
+# Entry points whose cold start we care about: the Streamlit app and the Redis loader
+DEFAULT_MODULES = ["frontend.lib.query_utils", "data.load_data_in_redis"]
+
+
+def profile_import(module: str) -> List[Tuple[int, int, str]]:
+    """Import `module` in a fresh interpreter with `-X importtime` and return `(self_us, cumulative_us, name)`
+    for every module it imported.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Could not import {module}:\n{completed.stderr}")
+
+    timings = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        timings.append((int(self_us), int(cumulative_us), name.strip()))
+    return timings
+
+
+def report(module: str, top: int) -> None:
+    timings = profile_import(module)
+    # The module itself is the last top-level import to complete
+    total_us = next(cumulative for _, cumulative, name in reversed(timings) if name == module)
+    print(f"{module}: {total_us / 1e6:.2f}s to import, {len(timings)} modules loaded")
+    for _, cumulative_us, name in sorted(timings, key=lambda timing: -timing[1])[:top]:
+        print(f"    {cumulative_us / 1e6:8.3f}s  {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the cold-start import time of the app entry points")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="modules to import")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to show")
+    args = parser.parse_args()
+    for module in args.modules:
+        report(module, args.top)
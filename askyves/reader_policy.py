@@ -0,0 +1,87 @@
+import threading
+from typing import List, Optional, Tuple
+
+READER_MIN_DOCUMENTS = 1
+READER_SCORE_GAP = 0.5
+READER_HIGH_LOAD = 0.5
+# Weight of the last reading in the estimated reader time per document
+SMOOTHING = 0.2
+
+
+def score_gap_depth(scores: List[Optional[float]], min_documents: int, score_gap: float) -> int:
+    """Number of leading documents before the first drop between consecutive retrieval scores larger than
+    `score_gap` times the spread of the scores: the documents after it are much further from the question.
+    Scores are compared in absolute value, so that it works with distances as with similarities.
+    """
+    if len(scores) <= min_documents or any(score is None for score in scores):
+        return len(scores)
+    spread = abs(scores[0] - scores[-1])
+    if spread == 0:
+        return len(scores)
+    for i in range(min_documents - 1, len(scores) - 1):
+        if abs(scores[i] - scores[i + 1]) >= score_gap * spread:
+            return i + 1
+    return len(scores)
+
+
+class ReaderPolicy:
+    """Decides how many retrieved documents the reader reads for a question answered within `budget` seconds.
+    Before reading, the depth is cut at a large gap in the retrieval scores, see `score_gap_depth`, and shrunk
+    linearly from all the documents at a `high_load` to `min_documents` at full load. While reading, documents are
+    read in rounds that fit the rest of the budget, estimated from the reader time per document of the previous
+    rounds, of this question or earlier ones. Every cut is recorded as a decision.
+    """
+
+    def __init__(
+        self,
+        budget: float,
+        min_documents: int = READER_MIN_DOCUMENTS,
+        score_gap: float = READER_SCORE_GAP,
+        high_load: float = READER_HIGH_LOAD,
+    ):
+        self.budget = budget
+        self.min_documents = min_documents
+        self.score_gap = score_gap
+        self.high_load = high_load
+        self.seconds_per_document = None
+        self._lock = threading.Lock()
+
+    def plan(self, documents: list, load: float) -> Tuple[int, List[dict]]:
+        """Number of documents to read at most and the decisions that cut it."""
+        decisions = []
+        depth = score_gap_depth([document.score for document in documents], self.min_documents, self.score_gap)
+        if depth < len(documents):
+            decisions.append({"policy": "score_gap", "documents": depth})
+        if load > self.high_load:
+            fraction = max(0.0, (1 - load) / (1 - self.high_load))
+            shed = max(self.min_documents, round(len(documents) * fraction))
+            if shed < depth:
+                depth = shed
+                decisions.append({"policy": "load", "load": round(load, 2), "documents": depth})
+        return depth, decisions
+
+    def round_size(self, remaining_seconds: float, documents: int) -> int:
+        """Documents to read in the next round, 0 when the estimated time of one no longer fits the budget."""
+        with self._lock:
+            seconds_per_document = self.seconds_per_document
+        if seconds_per_document is None:
+            # Nothing to estimate from yet: time a single document first
+            return min(1, documents)
+        # Past the deadline, the remaining time is negative
+        return max(0, min(documents, int(remaining_seconds / seconds_per_document)))
+
+    def record(self, seconds: float, documents: int) -> None:
+        with self._lock:
+            seconds = seconds / documents
+            if self.seconds_per_document is None:
+                self.seconds_per_document = seconds
+            else:
+                self.seconds_per_document += SMOOTHING * (seconds - self.seconds_per_document)
+
+
+def reader_load(reader) -> float:
+    """Fill ratio of the queue of the micro-batched reader, 0 without micro-batching."""
+    batcher = getattr(reader, "batcher", None)
+    if batcher is None:
+        return 0.0
+    return batcher.info()["queue_depth"] / batcher.max_queue_depth
@@ -0,0 +1,232 @@
+import hashlib
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import redis
+
+from askyves import metrics
+from config import PAPER_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# Hash field of a paper holding the reader tokens of its abstract, see `pack_tokens`
+READER_TOKENS_FIELD = "reader_tokens"
+TOKEN_CACHE_SIZE = 10_000
+
+# Token ids, character offsets of the token starts and word ids of a document, as haystack computes them
+Tokens = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+# Fingerprints of the tokenizers, dropped with them: ids of collected objects are reused
+_tokenizer_ids: "weakref.WeakKeyDictionary[object, str]" = weakref.WeakKeyDictionary()
+# Token caches of the readers using them, by fingerprint of their tokenizer, see `use_reader_tokens`
+_token_caches: Dict[str, "ReaderTokenCache"] = {}
+_haystack_tokenize = None
+_install_lock = threading.Lock()
+
+
+def tokenizer_id(tokenizer) -> str:
+    """Fingerprint of the vocabulary and normalisation rules of a fast tokenizer and of the `tokenizers` version
+    applying them: tokens computed under another fingerprint may not split the text the same way.
+    """
+    fingerprint = _tokenizer_ids.get(tokenizer)
+    if fingerprint is None:
+        import tokenizers
+
+        config = f"{tokenizers.__version__}\x1f{tokenizer.backend_tokenizer.to_str()}"
+        fingerprint = _tokenizer_ids[tokenizer] = hashlib.blake2b(config.encode(), digest_size=8).hexdigest()
+    return fingerprint
+
+
+def tokens_key(tokenizer, text: str) -> str:
+    return f"{tokenizer_id(tokenizer)}:{hashlib.blake2b(text.encode(), digest_size=8).hexdigest()}"
+
+
+def _id_dtype(tokenizer) -> np.dtype:
+    # Two bytes per token for vocabularies such as RoBERTa's
+    return np.dtype("<u2" if len(tokenizer) <= 2**16 else "<u4")
+
+
+def tokenize(tokenizer, texts: List[str]) -> List[Tokens]:
+    """Tokenize documents as haystack's `tokenize_batch_question_answering` does, in one batch."""
+    if not texts:
+        return []
+    encoded = tokenizer(text=texts, return_offsets_mapping=True, add_special_tokens=False, verbose=False)
+    return [
+        (
+            np.asarray(ids, dtype=_id_dtype(tokenizer)),
+            np.asarray([offset[0] for offset in offsets], dtype="int16"),
+            np.asarray(encoding.word_ids, dtype="int16"),
+        )
+        for ids, offsets, encoding in zip(encoded["input_ids"], encoded["offset_mapping"], encoded.encodings)
+    ]
+
+
+def pack_tokens(tokenizer, text: str, tokens: Tokens) -> bytes:
+    """The `tokens_key` of `text`, then its token ids, offsets and word ids as little-endian arrays."""
+    ids, offsets, word_ids = tokens
+    payload = ids.tobytes() + offsets.astype("<i2").tobytes() + word_ids.astype("<i2").tobytes()
+    return tokens_key(tokenizer, text).encode() + b"\n" + payload
+
+
+def unpack_tokens(tokenizer, text: str, packed: bytes) -> Optional[Tokens]:
+    """The tokens packed by `pack_tokens`, None when they were computed from another text or by another tokenizer."""
+    key, _, payload = packed.partition(b"\n")
+    if key.decode() != tokens_key(tokenizer, text):
+        return None
+    dtype = _id_dtype(tokenizer)
+    count = len(payload) // (dtype.itemsize + 4)
+    ids_end = count * dtype.itemsize
+    offsets_end = ids_end + 2 * count
+    return (
+        np.frombuffer(payload[:ids_end], dtype=dtype),
+        np.frombuffer(payload[ids_end:offsets_end], dtype="<i2").astype("int16"),
+        np.frombuffer(payload[offsets_end:], dtype="<i2").astype("int16"),
+    )
+
+
+def encode_reader_tokens(tokenizer, texts: List[str]) -> List[bytes]:
+    """Packed reader tokens of `texts`, to store in the `READER_TOKENS_FIELD` of their papers."""
+    return [pack_tokens(tokenizer, text, tokens) for text, tokens in zip(texts, tokenize(tokenizer, texts))]
+
+
+class ReaderTokenCache:
+    """Reader tokens of documents, keyed by tokenizer fingerprint and text. The first tier is an in-process LRU, the
+    optional second tier the tokens stored with the papers in Redis at ingest time. Documents in neither tier are
+    tokenized on the fly, as are documents whose stored tokens are stale, e.g. after a sync changed their abstract,
+    or were computed by another tokenizer version.
+    """
+
+    def __init__(self, tokenizer, redis_client: Optional[redis.Redis] = None, maxsize: int = TOKEN_CACHE_SIZE):
+        self.tokenizer = tokenizer
+        self.redis_client = redis_client
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    def _read_stored(self, texts: Dict[str, str], document_ids: Dict[str, str]) -> Dict[str, Tokens]:
+        keys = [key for key in texts if document_ids.get(key) is not None]
+        if not keys or self.redis_client is None:
+            return {}
+        try:
+            with metrics.stage("reader_tokens"), self.redis_client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.hget(f"{PAPER_PREFIX}{document_ids[key]}", READER_TOKENS_FIELD)
+                values = metrics.execute_pipeline(pipe, "reader_tokens")
+        except redis.exceptions.RedisError as e:
+            logger.warning("Stored reader tokens unavailable, tokenizing on the fly: %s", e)
+            return {}
+        stored = {}
+        for key, value in zip(keys, values):
+            tokens = None if value is None else unpack_tokens(self.tokenizer, texts[key], value)
+            if tokens is not None:
+                stored[key] = tokens
+        return stored
+
+    def get_many(self, texts: List[str], document_ids: List[Optional[str]]) -> List[Tokens]:
+        keys = [tokens_key(self.tokenizer, text) for text in texts]
+        with self._lock:
+            found = {key: self._entries[key] for key in keys if key in self._entries}
+            for key in found:
+                self._entries.move_to_end(key)
+            self.stats["local_hits"] += len(found)
+
+        # A document read for several questions is only looked up and tokenized once
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            stored = self._read_stored(missing, dict(zip(keys, document_ids)))
+            to_tokenize = [key for key in missing if key not in stored]
+            tokenized = dict(zip(to_tokenize, tokenize(self.tokenizer, [missing[key] for key in to_tokenize])))
+            with self._lock:
+                for key, tokens in {**stored, **tokenized}.items():
+                    self._entries[key] = tokens
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                self.stats["redis_hits"] += len(stored)
+                self.stats["misses"] += len(tokenized)
+            found.update(stored)
+            found.update(tokenized)
+        return [found[key] for key in keys]
+
+    def info(self) -> dict:
+        with self._lock:
+            lookups = sum(self.stats.values())
+            hits = self.stats["local_hits"] + self.stats["redis_hits"]
+            return {
+                **self.stats,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+
+def _tokenize_batch_question_answering(pre_baskets: List[dict], tokenizer, indices: list) -> list:
+    """haystack's `tokenize_batch_question_answering`, with the document tokens of the `ReaderTokenCache` of the
+    tokenizer and each question tokenized once per batch.
+    """
+    # haystack raises its own error for slow tokenizers, which have no fingerprint
+    cache = _token_caches.get(tokenizer_id(tokenizer)) if getattr(tokenizer, "is_fast", False) else None
+    if cache is None:
+        return _haystack_tokenize(pre_baskets, tokenizer, indices)
+    from haystack.modeling.data_handler.samples import SampleBasket
+    from haystack.modeling.model.feature_extraction import _get_start_of_word_QA
+
+    if len(indices) != len(pre_baskets):
+        raise ValueError("indices and pre_baskets must have the same length")
+    documents = cache.get_many(
+        [pre_basket["context"] for pre_basket in pre_baskets],
+        [pre_basket["qas"][0]["id"] if pre_basket["qas"] else None for pre_basket in pre_baskets],
+    )
+    questions = {}
+    baskets = []
+    for i_doc, (pre_basket, (ids, offsets, word_ids)) in enumerate(zip(pre_baskets, documents)):
+        document_tokens = ids.tolist()
+        for i_q, qa in enumerate(pre_basket["qas"]):
+            question = questions.get(qa["question"])
+            if question is None:
+                question = questions[qa["question"]] = tokenizer(
+                    qa["question"], return_offsets_mapping=True, add_special_tokens=False
+                )
+            raw = {
+                "document_text": pre_basket["context"],
+                "document_tokens": document_tokens,
+                "document_offsets": offsets,
+                "document_start_of_word": _get_start_of_word_QA(word_ids),
+                "question_text": qa["question"],
+                "question_tokens": question["input_ids"],
+                "question_offsets": [offset[0] for offset in question["offset_mapping"]],
+                "question_start_of_word": _get_start_of_word_QA(question.encodings[0].word_ids),
+                "answers": qa["answers"],
+                "document_tokens_strings": tokenizer.convert_ids_to_tokens(document_tokens),
+                "question_tokens_strings": question.encodings[0].tokens,
+            }
+            baskets.append(
+                SampleBasket(raw=raw, id_internal=f"{indices[i_doc]}-{i_q}", id_external=qa["id"], samples=None)
+            )
+    return baskets
+
+
+def use_reader_tokens(reader, redis_client: Optional[redis.Redis] = None, maxsize: int = TOKEN_CACHE_SIZE):
+    """Make a FARMReader take the document tokens from a `ReaderTokenCache` backed by `redis_client`, instead of
+    tokenizing every document it reads. Returns the cache.
+    """
+    from haystack.modeling.data_handler import processor
+
+    global _haystack_tokenize
+    tokenizer = reader.inferencer.processor.tokenizer
+    with _install_lock:
+        if _haystack_tokenize is None:
+            # Every SquadProcessor calls it: readers without a cache keep haystack's own
+            _haystack_tokenize = processor.tokenize_batch_question_answering
+            processor.tokenize_batch_question_answering = _tokenize_batch_question_answering
+        # Readers of the same tokenizer share a cache: the tokens do not depend on the tokenizer object
+        fingerprint = tokenizer_id(tokenizer)
+        if fingerprint not in _token_caches:
+            _token_caches[fingerprint] = ReaderTokenCache(tokenizer, redis_client, maxsize)
+    reader.token_cache = _token_caches[fingerprint]
+    return reader.token_cache
@@ -0,0 +1,204 @@
+import asyncio
+import itertools
+import logging
+import threading
+import time
+import weakref
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+import redis
+import redis.asyncio
+import redis.asyncio.connection
+import redis.asyncio.retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, TimeoutError
+from redis.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+MAX_CONNECTIONS = 50
+POOL_TIMEOUT = 5.0
+SOCKET_TIMEOUT = 5.0
+SOCKET_CONNECT_TIMEOUT = 2.0
+HEALTH_CHECK_INTERVAL = 30
+RETRIES = 3
+BACKOFF_BASE = 0.05
+BACKOFF_CAP = 1.0
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+
+# Only transient errors are worth retrying or counting against a node: a ResponseError would fail again anywhere
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError)
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised when every node able to serve a request has its circuit open."""
+
+
+class CircuitBreaker:
+    """Stops sending requests to a node after `failure_threshold` consecutive failures. After `reset_timeout`
+    seconds a single trial request is let through: it closes the circuit if it succeeds and re-opens it if not.
+    """
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_in_flight or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def release_trial(self) -> None:
+        """End a trial request that failed for a reason other than the node, leaving the circuit as it was."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures, self._opened_at, self._trial_in_flight = 0, None, False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class RedisNode:
+    """One Redis server: a bounded, health-checked connection pool with retries, and its circuit breaker."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        password: str,
+        max_connections: int = MAX_CONNECTIONS,
+        socket_timeout: float = SOCKET_TIMEOUT,
+        socket_connect_timeout: float = SOCKET_CONNECT_TIMEOUT,
+        health_check_interval: int = HEALTH_CHECK_INTERVAL,
+        retries: int = RETRIES,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+    ):
+        self.name = f"{host}:{port}"
+        self.max_connections = max_connections
+        self._connection_kwargs = {
+            "host": host,
+            "port": port,
+            "password": password,
+            "socket_timeout": socket_timeout,
+            "socket_connect_timeout": socket_connect_timeout,
+            "health_check_interval": health_check_interval,
+            "retry_on_error": list(TRANSIENT_ERRORS),
+        }
+        self._retries = retries
+        # A blocking pool waits up to POOL_TIMEOUT for a free connection instead of opening unbounded ones
+        self.client = redis.Redis(
+            connection_pool=redis.BlockingConnectionPool(
+                max_connections=max_connections,
+                timeout=POOL_TIMEOUT,
+                retry=Retry(ExponentialBackoff(cap=BACKOFF_CAP, base=BACKOFF_BASE), retries),
+                **self._connection_kwargs,
+            )
+        )
+        # asyncio connections are bound to the event loop that opened them: keep one client per loop
+        self._async_clients = weakref.WeakKeyDictionary()
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    def async_client(self) -> redis.asyncio.Redis:
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            self._async_clients[loop] = redis.asyncio.Redis(
+                connection_pool=redis.asyncio.connection.BlockingConnectionPool(
+                    max_connections=self.max_connections,
+                    timeout=POOL_TIMEOUT,
+                    retry=redis.asyncio.retry.Retry(
+                        ExponentialBackoff(cap=BACKOFF_CAP, base=BACKOFF_BASE), self._retries
+                    ),
+                    **self._connection_kwargs,
+                )
+            )
+        return self._async_clients[loop]
+
+
+class RedisRouter:
+    """Sends writes to the primary and spreads reads round-robin over the read replicas.
+    Reads fall back to the other replicas, then to the primary, when a node fails or has its circuit open, so that
+    a single slow or dead node cannot stall every session.
+    """
+
+    def __init__(self, primary: RedisNode, replicas: Optional[List[RedisNode]] = None):
+        self.primary = primary
+        self.replicas = replicas or []
+        self._next_replica = itertools.count()
+
+    def _read_candidates(self) -> List[RedisNode]:
+        if not self.replicas:
+            return [self.primary]
+        start = next(self._next_replica) % len(self.replicas)
+        return self.replicas[start:] + self.replicas[:start] + [self.primary]
+
+    def _run(self, nodes: List[RedisNode], operation: Callable[[redis.Redis], T]) -> T:
+        last_error = None
+        for node in nodes:
+            if not node.breaker.allow():
+                continue
+            try:
+                result = operation(node.client)
+            except TRANSIENT_ERRORS as e:
+                logger.warning("Redis node %s failed: %s", node.name, e)
+                node.breaker.record_failure()
+                last_error = e
+                continue
+            except BaseException:
+                # e.g. a ResponseError or a cancelled task: another trial may go through if this one was
+                node.breaker.release_trial()
+                raise
+            node.breaker.record_success()
+            return result
+        raise CircuitOpenError(f"No Redis node available among {[node.name for node in nodes]}") from last_error
+
+    async def _arun(self, nodes: List[RedisNode], operation: Callable[[redis.asyncio.Redis], Awaitable[T]]) -> T:
+        last_error = None
+        for node in nodes:
+            if not node.breaker.allow():
+                continue
+            try:
+                result = await operation(node.async_client())
+            except TRANSIENT_ERRORS as e:
+                logger.warning("Redis node %s failed: %s", node.name, e)
+                node.breaker.record_failure()
+                last_error = e
+                continue
+            except BaseException:
+                # e.g. a ResponseError or a cancelled task: another trial may go through if this one was
+                node.breaker.release_trial()
+                raise
+            node.breaker.record_success()
+            return result
+        raise CircuitOpenError(f"No Redis node available among {[node.name for node in nodes]}") from last_error
+
+    def read(self, operation: Callable[[redis.Redis], T]) -> T:
+        return self._run(self._read_candidates(), operation)
+
+    async def aread(self, operation: Callable[[redis.asyncio.Redis], Awaitable[T]]) -> T:
+        return await self._arun(self._read_candidates(), operation)
+
+    def write(self, operation: Callable[[redis.Redis], T]) -> T:
+        return self._run([self.primary], operation)
@@ -1,21 +1,81 @@
+import contextlib
 import logging
-from typing import Dict, List, Optional, Union
+from typing import Dict, Generator, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import redis
+import redis.asyncio
 from haystack.document_stores.search_engine import SearchEngineDocumentStore
+from haystack.errors import DuplicateDocumentError
 from haystack.schema import Document
+from redis.commands.search.aggregation import AggregateRequest
+from redis.commands.search.field import NumericField, TagField, VectorField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
 from redis.commands.search.query import Query
+from redis.commands.search.result import Result
 
-from askyves.embedder import make_embeddings
-from config import INDEX_NAME, NUMBER_OF_RESULTS, SEARCH_TYPE
+from askyves import metrics
+from askyves.build_embeddings import paper_text
+from askyves.document_cache import DOCUMENT_FIELDS, DocumentCache
+from askyves.embedder import make_embeddings, make_query_embeddings
+from askyves.filters import NUMERIC_FIELDS, compile_filters
+from askyves.ingest import METADATA_FIELDS, PAPER_FIELDS, paper_to_mapping
+from askyves.passages import PASSAGE_FIELDS, group_passages
+from askyves.redis_connection import (
+    FAILURE_THRESHOLD,
+    HEALTH_CHECK_INTERVAL,
+    MAX_CONNECTIONS,
+    RESET_TIMEOUT,
+    RETRIES,
+    SOCKET_CONNECT_TIMEOUT,
+    SOCKET_TIMEOUT,
+    RedisNode,
+    RedisRouter,
+)
+from askyves.vector_codec import CODEC_KEY, VectorCodec
+from config import INDEX_NAME, INDEX_VERSION_KEY, NUMBER_OF_RESULTS, PAPER_PREFIX, REDIS_DISTANCE_METRIC, SEARCH_TYPE
 
 logger = logging.getLogger(__name__)
 
+HIT_FIELDS = [
+    "paper_id",
+    "vector_score",
+    "year",
+    "title",
+    "authors",
+    "abstract",
+    "categories",
+    "update_date",
+    "journal-ref",
+    "submitter",
+    "doi",
+]
+# Fields of the paper hashes read back as documents by `get_all_documents_generator`
+SCAN_FIELDS = ["paper_id", "title", "abstract", *METADATA_FIELDS]
+WRITE_BATCH_SIZE = 1000
+
+
+def _field_value(value) -> str:
+    """Hash field value of a document meta value, lists such as the categories being comma-separated."""
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ",".join(map(str, value))
+    return str(value)
+
 
 class RedisDocumentStore(SearchEngineDocumentStore):
     """Python Class designed to enable the `haystack` (built by deepset) framework to build NLP pipelines.
     This class creates the connection with the `Redis` database and can be integrated in a full `haystack` pipeline.
+    When `host` and `port` are lists, the first node is the primary and the others are read replicas: searches are
+    spread over the replicas and writes go to the primary.
+    Query vectors go through the same `VectorCodec` as the indexed vectors. With `rerank_candidates` above `top_k`,
+    that many candidates are fetched from the index and re-ranked exactly in float32 on the client.
+    `ef_runtime` overrides the HNSW EF_RUNTIME of the index for every query, the query methods also accept it per call.
+    With `document_cache_size` above 0, retrieval is two-phase: KNN searches only return ids and scores, and the
+    fields of the hits come from a `DocumentCache` of that size, misses being fetched with one pipelined HMGET.
+    With a `passage_index`, searches rank the sentence windows of the abstracts, `passage_candidates` per paper to
+    return, and each paper is returned with its closest passage as content, see `askyves.passages`.
     See https://github.com/deepset-ai/haystack for more.
     """
 
@@ -45,8 +105,48 @@ class RedisDocumentStore(SearchEngineDocumentStore):
         skip_missing_embeddings: bool = True,
         synonyms: Optional[List] = None,
         synonym_type: str = "synonym",
+        max_connections: int = MAX_CONNECTIONS,
+        socket_timeout: float = SOCKET_TIMEOUT,
+        socket_connect_timeout: float = SOCKET_CONNECT_TIMEOUT,
+        health_check_interval: int = HEALTH_CHECK_INTERVAL,
+        retries: int = RETRIES,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+        rerank_candidates: int = 0,
+        ef_runtime: Optional[int] = None,
+        document_cache_size: int = 0,
+        passage_index: Optional[str] = None,
+        passage_candidates: int = 3,
     ):
-        client = self._init_redis_client(host=host, port=port, password=password)
+        hosts = host if isinstance(host, list) else [host]
+        ports = port if isinstance(port, list) else [port] * len(hosts)
+        if len(hosts) != len(ports):
+            raise ValueError(f"Got {len(hosts)} hosts for {len(ports)} ports")
+        nodes = [
+            RedisNode(
+                host=node_host,
+                port=node_port,
+                password=password,
+                max_connections=max_connections,
+                socket_timeout=socket_timeout,
+                socket_connect_timeout=socket_connect_timeout,
+                health_check_interval=health_check_interval,
+                retries=retries,
+                failure_threshold=failure_threshold,
+                reset_timeout=reset_timeout,
+            )
+            for node_host, node_port in zip(hosts, ports)
+        ]
+        self.router = RedisRouter(primary=nodes[0], replicas=nodes[1:])
+        client = self.router.primary.client
+        self.rerank_candidates = rerank_candidates
+        self.ef_runtime = ef_runtime
+        self._codec = None
+        self._codec_version = None
+        self.passage_index = passage_index
+        self.passage_candidates = passage_candidates
+        # Passage hits are always filled with the fields of their paper: with a size of 0, the cache only fetches them
+        self.document_cache = DocumentCache(document_cache_size) if document_cache_size > 0 or passage_index else None
 
         super().__init__(
             client=client,
@@ -76,66 +176,255 @@ class RedisDocumentStore(SearchEngineDocumentStore):
         # Let the base class trap the right exception from the redis client
         self._RequestError = redis.exceptions.RedisError
 
-    @classmethod
-    def _init_redis_client(
-        cls,
-        host: str,
-        port: str,
-        password: str,
-    ) -> redis.client.Redis:
-        redis_client = redis.Redis(host=host, port=port, password=password)
-        return redis_client
+    @property
+    def codec(self) -> VectorCodec:
+        """Projection and storage type of the indexed vectors, written next to the index by the loader. Read again
+        once the index version changes, see `_check_codec_version`.
+        """
+        if self._codec is None:
+
+            def read(client: redis.Redis) -> list:
+                with client.pipeline(transaction=False) as pipe:
+                    return pipe.get(INDEX_VERSION_KEY).hgetall(CODEC_KEY).execute()
+
+            self._codec_version, mapping = self.router.read(read)
+            self._codec = VectorCodec.from_mapping(mapping)
+        return self._codec
+
+    def _check_codec_version(self, version: Optional[bytes]) -> None:
+        # A rebuilt index may use another distance metric, a reloaded one other vectors
+        if version != self._codec_version:
+            self._codec = None
 
     @staticmethod
     def _get_vector_similarity_query(
-        years: list,
+        filters: Optional[dict] = None,
         search_type: str = SEARCH_TYPE,
         number_of_results: int = NUMBER_OF_RESULTS,
+        ef_runtime: Optional[int] = None,
+        return_fields: List[str] = HIT_FIELDS,
     ) -> Query:
-        if years:
-            years = " | ".join(years)
-            tag = f"(@year:{{{years}}})"
-        else:
-            tag = "*"
-        base_query = f"{tag}=>[{search_type} {number_of_results} @vector $vec_param AS vector_score]"
+        # The filters are applied before the KNN search, which then only ranks the papers matching them
+        pre_filter = compile_filters(filters)
+        if pre_filter != "*":
+            pre_filter = f"({pre_filter})"
+        # HNSW only: overrides the EF_RUNTIME the index was created with
+        knn_args = f" EF_RUNTIME {ef_runtime}" if ef_runtime else ""
+        base_query = f"{pre_filter}=>[{search_type} {number_of_results} @vector $vec_param{knn_args} AS vector_score]"
         return (
             Query(base_query)
             .sort_by("vector_score")
             .paging(0, number_of_results)
-            .return_fields(
-                "paper_id",
-                "vector_score",
-                "year",
-                "title",
-                "authors",
-                "abstract",
-                "categories",
-                "update_date",
-                "journal-ref",
-                "submitter",
-                "doi",
-            )
+            .return_fields(*return_fields)
             .dialect(2)
         )
 
-    # Some methods are mandatory when defining `SearchEngineDocumentStore` object
-    # However for the sake of this project they are not used so we didn't allocate time
-    # To fully develop them
-    def _create_document_index(self):
-        pass
+    def _create_document_index(self, index_name: str, headers: Optional[Dict[str, str]] = None) -> None:
+        """Create a search index over the paper hashes, unless it exists. Bulk loads should rather let
+        `data/load_data_in_redis.py` create it, sized for the corpus once the papers are written.
+        """
+        self._check_unsupported_arguments(headers=headers)
+        client = self.router.primary.client
+        try:
+            client.ft(index_name).info()
+            return
+        except redis.exceptions.ResponseError:
+            pass
+        if not client.exists(CODEC_KEY):
+            # Documents written from now on are stored, and queries projected, with this codec
+            client.hset(CODEC_KEY, mapping=VectorCodec(distance_metric=REDIS_DISTANCE_METRIC).to_mapping())
+            self._codec = None
+        vector_field = VectorField(
+            "vector",
+            "HNSW" if self.index_type == "hnsw" else "FLAT",
+            {"TYPE": self.codec.vector_type, "DIM": self.codec.dim, "DISTANCE_METRIC": self.codec.distance_metric},
+        )
+        client.ft(index_name).create_index(
+            fields=[vector_field, TagField("categories"), TagField("submitter"), NumericField("year")],
+            definition=IndexDefinition(prefix=[PAPER_PREFIX], index_type=IndexType.HASH),
+        )
+        logger.info("Created the index %s", index_name)
 
-    def _create_label_index(self):
+    def _create_label_index(self, index_name: str, headers: Optional[Dict[str, str]] = None) -> None:
+        # Labels are not stored in Redis
         pass
 
-    def _do_bulk(self):
-        pass
+    def _do_bulk(self, mappings: Dict[str, dict]) -> None:
+        """Write the paper hashes of `mappings`, by key, in one pipeline round trip."""
+        with metrics.stage("write_documents"), self.router.primary.client.pipeline(transaction=False) as pipe:
+            for key, mapping in mappings.items():
+                # RediSearch leaves a paper out of the index when a numeric field does not parse: empty ones are
+                # removed instead, the paper then only misses the filters on them
+                empty = [field for field in NUMERIC_FIELDS if mapping.get(field) == ""]
+                if empty:
+                    pipe.hdel(key, *empty)
+                    mapping = {field: value for field, value in mapping.items() if field not in empty}
+                pipe.hset(key, mapping=mapping)
+            metrics.execute_pipeline(pipe, "write_documents")
 
-    def _do_scan(self):
-        pass
+    def _do_scan(self, index: str, query: str, fields: List[str], batch_size: int) -> Iterator[dict]:
+        """Stream the `fields` of the papers matching `query` with an FT.AGGREGATE cursor: only `batch_size` papers
+        are held at a time, whatever the size of the index.
+        """
+        request = AggregateRequest(query).load(*(f"@{field}" for field in fields)).cursor(count=batch_size)
+        # A cursor only exists on the node that opened it: every read goes to that node
+        client, result = self.router.read(lambda client: (client, client.ft(index).aggregate(request)))
+        try:
+            while True:
+                for row in result.rows:
+                    yield dict(zip(row[::2], row[1::2]))
+                if not result.cursor or not result.cursor.cid:
+                    return
+                result = client.ft(index).aggregate(result.cursor)
+        finally:
+            if result.cursor and result.cursor.cid:
+                # The generator was closed early: free the cursor instead of letting it idle out
+                with contextlib.suppress(redis.exceptions.RedisError):
+                    client.execute_command("FT.CURSOR", "DEL", index, result.cursor.cid)
 
     def _get_raw_similarity_score(self, score):
         return score
 
+    @staticmethod
+    def _check_unsupported_arguments(
+        return_embedding=None, headers=None, custom_query=None, all_terms_must_match=None
+    ) -> None:
+        if return_embedding:
+            raise NotImplementedError("`return_embedding` is not implemented yet")
+        if headers:
+            raise NotImplementedError("`headers` is not implemented yet")
+        if custom_query:
+            raise NotImplementedError("`custom_query` is not implemented yet")
+        if all_terms_must_match:
+            raise NotImplementedError("`all_terms_must_match` is not implemented yet")
+
+    def _search_index(self, index: Optional[str]) -> str:
+        # haystack retrievers pass the index of the store when they are given none: it also means the passage index
+        if self.passage_index is not None and index in (None, self.index):
+            return self.passage_index
+        return self.index if index is None else index
+
+    def _candidates(self, top_k: int) -> int:
+        """Hits to keep from the KNN search to return `top_k` papers."""
+        return top_k if self.passage_index is None else top_k * self.passage_candidates
+
+    def _prepare_query(
+        self, query_emb: Union[str, np.ndarray, bytes], filters, top_k: int, ef_runtime: Optional[int] = None
+    ) -> Tuple[Query, dict, np.ndarray]:
+        """Return the query, its parameters and the query vector in the index space, for re-ranking."""
+        if self.passage_index is not None:
+            return_fields = PASSAGE_FIELDS + ["vector_score"]
+        else:
+            # Two-phase retrieval: the other fields come from the document cache
+            return_fields = HIT_FIELDS if self.document_cache is None else ["vector_score"]
+        q = self._get_vector_similarity_query(
+            filters=filters,
+            search_type=SEARCH_TYPE,
+            number_of_results=max(self._candidates(top_k), self.rerank_candidates),
+            ef_runtime=ef_runtime or self.ef_runtime,
+            return_fields=return_fields,
+        )
+        # Vectorize the query
+        if isinstance(query_emb, str):
+            query_emb = make_query_embeddings(query_emb)
+        elif isinstance(query_emb, bytes):
+            query_emb = np.frombuffer(query_emb, dtype=np.float32)
+        query_vector = self.codec.project(query_emb)
+        return q, {"vec_param": query_vector.astype(self.codec.dtype).tobytes()}, query_vector
+
+    def _rerank(self, query_vector: np.ndarray, hits: list, vectors: List[bytes], top_k: int) -> list:
+        """Order the candidate hits by their exact distance to the query and keep the `top_k` closest."""
+        if not hits:
+            return hits
+        distances = self.codec.distances(query_vector, np.stack([self.codec.decode(vector) for vector in vectors]))
+        for hit, distance in zip(hits, distances):
+            hit.vector_score = float(distance)
+        return [hits[i] for i in np.argsort(distances, kind="stable")[:top_k]]
+
+    def _queue_searches(self, pipe, index: str, queries: List[Tuple[Query, dict, np.ndarray]]) -> None:
+        # The codec and the cached documents are only valid for the index version they were read from
+        pipe.get(INDEX_VERSION_KEY)
+        search = pipe.ft(index)
+        for q, params_dict, _ in queries:
+            pipe.execute_command("FT.SEARCH", index, *q.get_args(), *search.get_params_args(params_dict))
+
+    def _parse_searches(self, responses: list) -> List[list]:
+        """Replies of the pipeline of `_queue_searches`, executed without `raise_on_error`: the version is checked
+        before any error is raised, e.g. for a query vector projected by the codec of a replaced index.
+        """
+        version = responses.pop(0)
+        self._check_codec_version(version)
+        if self.document_cache is not None:
+            self.document_cache.check_version(version)
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+        return [Result(response, True).docs for response in responses]
+
+    def _cached_papers(self, hits: List[list]) -> Tuple[Dict[str, Optional[dict]], List[str]]:
+        """The cached fields of every hit and the keys of the hits missing from the document cache."""
+        papers = self.document_cache.get_many([hit.id for query_hits in hits for hit in query_hits])
+        return papers, [key for key, paper in papers.items() if paper is None]
+
+    @staticmethod
+    def _add_papers(hits: List[list], papers: Dict[str, Optional[dict]]) -> List[list]:
+        """Set the document fields on id-only hits, dropping the hits of papers deleted since the search."""
+        for hit in (hit for query_hits in hits for hit in query_hits if papers[hit.id] is not None):
+            for field, value in papers[hit.id].items():
+                setattr(hit, field, value)
+        return [[hit for hit in query_hits if papers[hit.id] is not None] for query_hits in hits]
+
+    def _group_passages(self, hits: List[list], top_k: int) -> List[list]:
+        """Keep the closest passage of the `top_k` closest papers, to be filled with the fields of their paper."""
+        if self.passage_index is None:
+            return hits
+        hits = [group_passages(query_hits, top_k) for query_hits in hits]
+        for hit in (hit for query_hits in hits for hit in query_hits):
+            hit.id = PAPER_PREFIX + hit.paper_id
+        return hits
+
+    def _fill_hits(self, client: redis.Redis, hits: List[list]) -> List[list]:
+        papers, missing = self._cached_papers(hits)
+        if missing:
+            with metrics.stage("document_fetch"), client.pipeline(transaction=False) as pipe:
+                for key in missing:
+                    pipe.hmget(key, DOCUMENT_FIELDS)
+                papers.update(self.document_cache.set_many(missing, metrics.execute_pipeline(pipe, "document_fetch")))
+        return self._add_papers(hits, papers)
+
+    async def _afill_hits(self, client: redis.asyncio.Redis, hits: List[list]) -> List[list]:
+        papers, missing = self._cached_papers(hits)
+        if missing:
+            with metrics.stage("document_fetch"):
+                async with client.pipeline(transaction=False) as pipe:
+                    for key in missing:
+                        pipe.hmget(key, DOCUMENT_FIELDS)
+                    values = await metrics.aexecute_pipeline(pipe, "document_fetch")
+            papers.update(self.document_cache.set_many(missing, values))
+        return self._add_papers(hits, papers)
+
+    def _search(self, client: redis.Redis, index: str, queries: List[Tuple[Query, dict, np.ndarray]], top_k: int):
+        """Run the KNN searches in one pipeline round trip, then fetch the candidate vectors in a second one
+        when re-ranking, and the fields of the hits missing from the document cache in a last one. Passage hits are
+        grouped by paper before the last one.
+        """
+        with metrics.stage("knn_search"), client.pipeline(transaction=False) as pipe:
+            self._queue_searches(pipe, index, queries)
+            hits = self._parse_searches(metrics.execute_pipeline(pipe, "knn_search", raise_on_error=False))
+
+        candidates = self._candidates(top_k)
+        if self.rerank_candidates > candidates:
+            with metrics.stage("rerank"), client.pipeline(transaction=False) as pipe:
+                for hit in (hit for query_hits in hits for hit in query_hits):
+                    pipe.hget(hit.id, "vector")
+                vectors = iter(metrics.execute_pipeline(pipe, "rerank"))
+                hits = [
+                    self._rerank(query_vector, query_hits, [next(vectors) for _ in query_hits], candidates)
+                    for (_, _, query_vector), query_hits in zip(queries, hits)
+                ]
+        hits = self._group_passages(hits, top_k)
+        return hits if self.document_cache is None else self._fill_hits(client, hits)
+
     def query_by_embedding(
         self,
         query_emb: str,
@@ -147,34 +436,47 @@ class RedisDocumentStore(SearchEngineDocumentStore):
         scale_score=True,
         custom_query=None,
         all_terms_must_match=None,
+        ef_runtime: Optional[int] = None,
     ):
-        if return_embedding:
-            raise NotImplementedError("`return_embedding` is not implemented yet")
-        if headers:
-            raise NotImplementedError("`headers` is not implemented yet")
-        if custom_query:
-            raise NotImplementedError("`custom_query` is not implemented yet")
-        if all_terms_must_match:
-            raise NotImplementedError("`all_terms_must_match` is not implemented yet")
+        self._check_unsupported_arguments(return_embedding, headers, custom_query, all_terms_must_match)
+        index = self._search_index(index)
+        query = self._prepare_query(query_emb, filters, top_k, ef_runtime)
 
-        if index is None:
-            index = self.index
-        date_range = []
-        if isinstance(filters, dict):
-            date_range = filters.get("date_range", date_range)
-        q = self._get_vector_similarity_query(years=date_range, search_type=SEARCH_TYPE, number_of_results=top_k)
-        # Vectorize the query
-        if isinstance(query_emb, str):
-            query_emb = make_embeddings(query_emb).astype(np.float32).tobytes()
-        elif isinstance(query_emb, np.ndarray):
-            query_emb = query_emb.astype(np.float32).tobytes()
-        params_dict = {"vec_param": query_emb}
-
-        # Execute the query
-        results = self.client.ft(index).search(q, query_params=params_dict)
-        documents = [self.convert_hit_to_document(hit, scale_score) for hit in results.docs]
+        # Execute the query on a replica if there is one
+        (hits,) = self.router.read(lambda client: self._search(client, index, [query], top_k))
+        with metrics.stage("convert_documents"):
+            documents = [self.convert_hit_to_document(hit, scale_score) for hit in hits]
         return documents
 
+    def query_by_embedding_batch(
+        self,
+        query_embs: Union[List[np.ndarray], np.ndarray],
+        filters: Optional[Union[dict, List[dict]]] = None,
+        top_k: int = 10,
+        index: Optional[str] = None,
+        return_embedding: Optional[bool] = None,
+        headers: Optional[Dict[str, str]] = None,
+        scale_score: bool = True,
+        ef_runtime: Optional[int] = None,
+    ) -> List[List[Document]]:
+        """Send one KNN FT.SEARCH per query embedding, all in a single pipeline round trip.
+        `filters` is either one filter applied to every query or a list with one filter per query.
+        """
+        self._check_unsupported_arguments(return_embedding, headers)
+        index = self._search_index(index)
+        if not isinstance(filters, list):
+            filters = [filters] * len(query_embs)
+        if len(filters) != len(query_embs):
+            raise ValueError(f"Got {len(filters)} filters for {len(query_embs)} queries")
+
+        queries = [
+            self._prepare_query(query_emb, query_filters, top_k, ef_runtime)
+            for query_emb, query_filters in zip(query_embs, filters)
+        ]
+        hits = self.router.read(lambda client: self._search(client, index, queries, top_k))
+        with metrics.stage("convert_documents"):
+            return [[self.convert_hit_to_document(hit, scale_score) for hit in query_hits] for query_hits in hits]
+
     def query(
         self,
         query: Optional[str],
@@ -187,8 +489,6 @@ class RedisDocumentStore(SearchEngineDocumentStore):
         all_terms_must_match: bool = False,
         scale_score: bool = True,
     ) -> List[Document]:
-        if index is None:
-            index = self.index
         if return_embedding is None:
             return_embedding = self.return_embedding
         documents = self.query_by_embedding(
@@ -204,16 +504,95 @@ class RedisDocumentStore(SearchEngineDocumentStore):
         )
         return documents
 
+    def query_batch(
+        self,
+        queries: List[str],
+        filters: Optional[Union[dict, List[dict]]] = None,
+        top_k: int = 10,
+        custom_query: Optional[str] = None,
+        index: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        all_terms_must_match: bool = False,
+        scale_score: bool = True,
+    ) -> List[List[Document]]:
+        """Embed all the queries in one forward pass, then search them in one pipeline round trip."""
+        self._check_unsupported_arguments(
+            headers=headers, custom_query=custom_query, all_terms_must_match=all_terms_must_match
+        )
+        query_embs = make_query_embeddings(list(queries)) if queries else []
+        return self.query_by_embedding_batch(
+            query_embs, filters=filters, top_k=top_k, index=index, scale_score=scale_score
+        )
+
+    async def aquery_by_embedding(
+        self,
+        query_emb: Union[str, np.ndarray],
+        filters: Optional[dict] = None,
+        top_k: int = 10,
+        index: Optional[str] = None,
+        return_embedding: Optional[bool] = None,
+        headers: Optional[Dict[str, str]] = None,
+        scale_score: bool = True,
+        ef_runtime: Optional[int] = None,
+    ) -> List[Document]:
+        """asyncio version of `query_by_embedding`, so that one process can serve many concurrent sessions.
+        Query embedding still runs the model on the event loop: pass precomputed embeddings to avoid blocking it.
+        """
+        self._check_unsupported_arguments(return_embedding, headers)
+        index = self._search_index(index)
+        query = self._prepare_query(query_emb, filters, top_k, ef_runtime)
+
+        async def search(client: redis.asyncio.Redis) -> list:
+            with metrics.stage("knn_search"):
+                async with client.pipeline(transaction=False) as pipe:
+                    self._queue_searches(pipe, index, [query])
+                    responses = await metrics.aexecute_pipeline(pipe, "knn_search", raise_on_error=False)
+                    (hits,) = self._parse_searches(responses)
+            if self.rerank_candidates > self._candidates(top_k):
+                with metrics.stage("rerank"):
+                    async with client.pipeline(transaction=False) as pipe:
+                        for hit in hits:
+                            pipe.hget(hit.id, "vector")
+                        vectors = await metrics.aexecute_pipeline(pipe, "rerank")
+                    hits = self._rerank(query[2], hits, vectors, self._candidates(top_k))
+            (hits,) = self._group_passages([hits], top_k)
+            if self.document_cache is not None:
+                (hits,) = await self._afill_hits(client, [hits])
+            return hits
+
+        hits = await self.router.aread(search)
+        with metrics.stage("convert_documents"):
+            return [self.convert_hit_to_document(hit, scale_score) for hit in hits]
+
+    async def aquery(
+        self,
+        query: Optional[str],
+        filters: Optional[Dict[str, Union[Dict, List, str, int, float, bool]]] = None,
+        top_k: int = 10,
+        index: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        scale_score: bool = True,
+    ) -> List[Document]:
+        return await self.aquery_by_embedding(
+            query_emb=query, filters=filters, top_k=top_k, index=index, headers=headers, scale_score=scale_score
+        )
+
     @staticmethod
     def convert_hit_to_document(paper, scale_score=False):
         meta_data = {"categories": paper.categories, "name": paper.title, "update_date": paper.update_date}
+        content = paper.abstract
+        if getattr(paper, "passage_start", None) is not None:
+            # The reader only reads the passage: answer offsets are mapped back to the abstract with `passage_start`
+            start, end = int(paper.passage_start), int(paper.passage_end)
+            meta_data.update(abstract=paper.abstract, passage_start=start)
+            content = paper.abstract[start:end]
         if scale_score:
             score = round(100 * float(paper.vector_score), 1)
         else:
             score = float(paper.vector_score)
         doc_dict = {
             "id": paper.paper_id,
-            "content": paper.abstract,
+            "content": content,
             "content_type": "text",
             "meta": meta_data,
             "score": score,
@@ -221,3 +600,121 @@ class RedisDocumentStore(SearchEngineDocumentStore):
         }
         document = Document.from_dict(doc_dict)
         return document
+
+    def _document_to_paper(self, document: Document) -> dict:
+        meta = document.meta or {}
+        paper = {field: _field_value(meta.get(field)) for field in PAPER_FIELDS}
+        paper.update(
+            id=str(document.id),
+            title=_field_value(meta.get(self.name_field, meta.get("title"))),
+            abstract=document.content,
+        )
+        for field in NUMERIC_FIELDS:
+            try:
+                float(paper[field] or 0)
+            except ValueError:
+                raise ValueError(f"Document {document.id}: `{field}` must be a number, not {paper[field]!r}")
+        return paper
+
+    def write_documents(
+        self,
+        documents: Union[List[dict], List[Document]],
+        index: Optional[str] = None,
+        batch_size: int = WRITE_BATCH_SIZE,
+        duplicate_documents: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Write documents as paper hashes, `batch_size` per pipeline round trip. The `name` meta is the title, other
+        meta fields named like the paper fields are stored as such. Documents without an embedding are embedded like
+        the loader embeds papers, from their title and abstract. Documents without a `year` are indexed, but never match
+        a filter on it.
+        Every index of the store covers the paper hashes: `index` only sets the index named in errors.
+        `duplicate_documents` is `overwrite`, `skip` or `fail` for documents whose id is already stored.
+        """
+        self._check_unsupported_arguments(headers=headers)
+        duplicate_documents = duplicate_documents or self.duplicate_documents
+        if duplicate_documents not in self.duplicate_documents_options:
+            raise ValueError(f"duplicate_documents must be one of {self.duplicate_documents_options}")
+        field_map = self._create_document_field_map()
+        documents = [
+            Document.from_dict(document, field_map=field_map) if isinstance(document, dict) else document
+            for document in documents
+        ]
+        documents = self._drop_duplicate_documents(documents, index)
+        # The vectors are written with the codec of the current index, whatever the searches last saw
+        self._codec = None
+
+        written = 0
+        for start in range(0, len(documents), batch_size):
+            end = start + batch_size
+            written += self._write_batch(documents[start:end], index or self.index, duplicate_documents)
+        if written:
+            # Drop the documents and answers the app instances cached before the write
+            self.router.primary.client.incr(INDEX_VERSION_KEY)
+        logger.info("Wrote %d of %d documents", written, len(documents))
+
+    def _write_batch(self, documents: List[Document], index: str, duplicate_documents: str) -> int:
+        keys = [PAPER_PREFIX + str(document.id) for document in documents]
+        if duplicate_documents != "overwrite":
+            with self.router.primary.client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.exists(key)
+                exists = metrics.execute_pipeline(pipe, "write_documents")
+            duplicates = [document.id for document, exist in zip(documents, exists) if exist]
+            if duplicates and duplicate_documents == "fail":
+                raise DuplicateDocumentError(
+                    f"{len(duplicates)} documents already exist in index '{index}', e.g. {duplicates[:5]}"
+                )
+            if duplicates:
+                logger.info("Skipping %d documents that already exist in index '%s'", len(duplicates), index)
+            keys = [key for key, exist in zip(keys, exists) if not exist]
+            documents = [document for document, exist in zip(documents, exists) if not exist]
+        if not documents:
+            return 0
+
+        papers = [self._document_to_paper(document) for document in documents]
+        embeddings = [document.embedding for document in documents]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            with metrics.stage("embed_documents"):
+                for i, embedding in zip(missing, make_embeddings([paper_text(papers[i]) for i in missing])):
+                    embeddings[i] = embedding
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.shape[1] != self.embedding_dim:
+            raise ValueError(f"Got embeddings of dimension {embeddings.shape[1]}, expected {self.embedding_dim}")
+        vectors = self.codec.encode(embeddings)
+        self._do_bulk({key: paper_to_mapping(paper, vector) for key, paper, vector in zip(keys, papers, vectors)})
+        return len(documents)
+
+    def get_all_documents_generator(
+        self,
+        index: Optional[str] = None,
+        filters: Optional[Dict[str, Union[Dict, List, str, int, float, bool]]] = None,
+        return_embedding: Optional[bool] = None,
+        batch_size: int = 10_000,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Generator[Document, None, None]:
+        """Stream the documents matching `filters`, `batch_size` at a time, see `_do_scan`.
+        Embeddings are returned as stored in the index, i.e. after the projection of the codec if it has one.
+        """
+        self._check_unsupported_arguments(headers=headers)
+        if index is None:
+            index = self.index
+        if return_embedding is None:
+            return_embedding = self.return_embedding
+        fields = SCAN_FIELDS + ["vector"] if return_embedding else SCAN_FIELDS
+        for paper in self._do_scan(index, compile_filters(filters), fields, batch_size):
+            yield self._paper_to_document(paper)
+
+    def _paper_to_document(self, paper: Dict[bytes, bytes]) -> Document:
+        paper = {field.decode(): value for field, value in paper.items()}
+        vector = paper.pop("vector", None)
+        paper = {field: value.decode() for field, value in paper.items()}
+        meta = {field: paper.get(field, "") for field in METADATA_FIELDS}
+        meta["name"] = paper.get("title", "")
+        return Document(
+            id=paper["paper_id"],
+            content=paper.get("abstract", ""),
+            meta=meta,
+            embedding=None if vector is None else self.codec.decode(vector),
+        )
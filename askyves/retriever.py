@@ -0,0 +1,69 @@
+from typing import List, Optional, Union
+
+import numpy as np
+from haystack.nodes import EmbeddingRetriever
+from haystack.nodes.retriever.dense import DenseRetriever
+from haystack.schema import Document
+
+from askyves.embedder import make_embeddings, make_query_embeddings
+from askyves.models import EMBEDDING_MODEL_NAME
+
+
+class CachedEmbeddingRetriever(EmbeddingRetriever):
+    """`EmbeddingRetriever` whose queries and documents are embedded by `askyves.embedder`, like the indexed
+    abstracts: queries are cleaned the same way and looked up in the query embedding cache before running the model.
+    The model itself is shared with the embedder through `askyves.models`.
+    """
+
+    def __init__(
+        self,
+        document_store,
+        embedding_model: str = EMBEDDING_MODEL_NAME,
+        batch_size: int = 32,
+        top_k: int = 10,
+        progress_bar: bool = True,
+        scale_score: bool = True,
+        embed_meta_fields: List[str] = [],
+    ):
+        # `EmbeddingRetriever.__init__` would load a second copy of the model for its own encoder, never used here
+        DenseRetriever.__init__(self)
+        self.document_store = document_store
+        self.embedding_model = embedding_model
+        self.model_format = "sentence_transformers"
+        self.batch_size = batch_size
+        self.top_k = top_k
+        self.progress_bar = progress_bar
+        self.scale_score = scale_score
+        self.embed_meta_fields = embed_meta_fields
+        self.embedding_encoder = None
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        if isinstance(queries, str):
+            queries = [queries]
+        return make_query_embeddings(queries)
+
+    def embed_documents(self, documents: List[Document]) -> np.ndarray:
+        documents = self._preprocess_documents(documents)
+        return make_embeddings([document.content for document in documents])
+
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        filters: Optional[Union[dict, List[dict]]] = None,
+        top_k: Optional[int] = None,
+        index: Optional[str] = None,
+        headers: Optional[dict] = None,
+        batch_size: Optional[int] = None,
+        scale_score: Optional[bool] = None,
+    ) -> List[List[Document]]:
+        """Embed all the queries at once, then search them in a single pipeline when the store supports it."""
+        if not hasattr(self.document_store, "query_by_embedding_batch"):
+            return super().retrieve_batch(queries, filters, top_k, index, headers, batch_size, scale_score)
+        return self.document_store.query_by_embedding_batch(
+            self.embed_queries(queries),
+            filters=filters,
+            top_k=self.top_k if top_k is None else top_k,
+            index=self.document_store.index if index is None else index,
+            headers=headers,
+            scale_score=self.scale_score if scale_score is None else scale_score,
+        )
@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import tornado.httputil
+import tornado.web
+
+from askyves import metrics
+from askyves.batching import Overloaded
+from askyves.build_embeddings import MAX_YEAR, MIN_YEAR
+from askyves.filters import compile_filters
+from config import METRICS_PORT, SERVICE_MAX_PENDING, SERVICE_PORT, SERVICE_WORKERS, TOP_K_RETRIEVER
+
+logger = logging.getLogger(__name__)
+
+# Pipeline of the model worker process, built by `_init_worker`
+_pipeline = None
+_answer_cache = None
+
+
+def _init_worker() -> None:
+    from askyves.pipeline import build_answer_cache, build_pipeline
+
+    global _pipeline, _answer_cache
+    # A worker runs one request at a time: there is nothing for the micro-batchers to group
+    _pipeline = build_pipeline(micro_batching=False)
+    _answer_cache = build_answer_cache(_pipeline)
+
+
+def _worker_pid() -> int:
+    return os.getpid()
+
+
+def _search(question: str, filters: Optional[dict], top_k: int) -> str:
+    from askyves.answer_cache import _to_builtin
+
+    output, _ = _pipeline.get_node("Retriever").run(root_node="Query", query=question, filters=filters, top_k=top_k)
+    documents = [
+        {"id": document.id, "content": document.content, "score": document.score, "meta": document.meta}
+        for document in output["documents"]
+    ]
+    # Encoded in the worker: the event loop only forwards the reply
+    return json.dumps({"query": question, "documents": documents}, default=_to_builtin)
+
+
+def _ask(question: str, date_range: list, budget: Optional[float], load: float) -> str:
+    from askyves.answer_cache import _to_builtin
+    from askyves.pipeline import make_qa_query
+
+    results = make_qa_query(
+        _pipeline, text=question, date_range=date_range, answer_cache=_answer_cache, budget=budget, load=load
+    )
+    answers = [answer.to_dict() for answer in results["answers"]]
+    return json.dumps({"query": question, "answers": answers, "policy": results.get("policy")}, default=_to_builtin)
+
+
+class ModelWorkers:
+    """Pool of processes that each hold the models and a QA pipeline, and answer one request at a time.
+    At most `max_pending` requests run or wait for a worker, further ones raise `Overloaded`.
+    """
+
+    def __init__(self, num_workers: int = SERVICE_WORKERS, max_pending: int = SERVICE_MAX_PENDING):
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        # torch does not survive a fork once initialised: start the workers from a fresh interpreter
+        self.executor = ProcessPoolExecutor(
+            num_workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+        )
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            metrics.BATCH_REJECTED.labels("service", "queue_full").inc()
+            raise Overloaded(f"{self.pending} requests are already waiting for a model worker")
+        # The event loop is single-threaded: the counter needs no lock
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def start(self) -> None:
+        """Start every worker and wait for its models to be loaded."""
+        pids = await asyncio.gather(*(self.run(_worker_pid) for _ in range(self.num_workers)))
+        logger.info("%d model workers ready", len(set(pids)))
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+
+
+class _JsonHandler(tornado.web.RequestHandler):
+    def initialize(self, workers: ModelWorkers):
+        self.workers = workers
+
+    def read_question(self) -> dict:
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="The body is not valid JSON")
+        if not isinstance(body, dict) or not str(body.get("question", "")).strip():
+            raise tornado.web.HTTPError(400, reason="`question` is missing")
+        return body
+
+    @staticmethod
+    def date_range(body: dict) -> list:
+        """Years of the `start_year`..`end_year` filter, within the MIN_YEAR..MAX_YEAR years of the papers, no year
+        filter without them.
+        """
+        if body.get("start_year") is None and body.get("end_year") is None:
+            return []
+        try:
+            start_year, end_year = int(body["start_year"]), int(body["end_year"])
+        except (KeyError, TypeError, ValueError):
+            raise tornado.web.HTTPError(400, reason="`start_year` and `end_year` must be given together, as integers")
+        if start_year > end_year:
+            raise tornado.web.HTTPError(400, reason="`start_year` must not be after `end_year`")
+        # An empty list would not filter at all
+        start_year, end_year = max(start_year, MIN_YEAR), min(end_year, MAX_YEAR)
+        if start_year > end_year:
+            raise tornado.web.HTTPError(400, reason=f"The years must overlap {MIN_YEAR}..{MAX_YEAR}")
+        return list(map(str, range(start_year, end_year + 1)))
+
+    async def run(self, stage: str, fn, *args) -> None:
+        try:
+            with metrics.stage(stage):
+                reply = await self.workers.run(fn, *args)
+        except Overloaded as e:
+            raise tornado.web.HTTPError(503, reason=str(e))
+        self.set_header("Content-Type", "application/json")
+        self.finish(reply)
+
+    def write_error(self, status_code: int, **kwargs) -> None:
+        # `send_error` clears the headers set before the error was raised
+        if status_code == 503:
+            self.set_header("Retry-After", "1")
+        error = kwargs.get("exc_info", (None, None, None))[1]
+        reason = getattr(error, "reason", None) or tornado.httputil.responses.get(status_code, "Unknown")
+        self.finish({"error": reason})
+
+
+class SearchHandler(_JsonHandler):
+    async def post(self):
+        body = self.read_question()
+        # Any haystack-style filters, e.g. on `categories`, or the year range of the app
+        filters = body.get("filters") or {"date_range": self.date_range(body)}
+        try:
+            top_k = int(body.get("top_k", TOP_K_RETRIEVER))
+        except (TypeError, ValueError):
+            raise tornado.web.HTTPError(400, reason="`top_k` must be an integer")
+        try:
+            # Validated here: an error of the worker is a server error
+            compile_filters(filters)
+        except (AttributeError, TypeError, ValueError) as e:
+            raise tornado.web.HTTPError(400, reason=f"Invalid `filters`: {e}")
+        await self.run("service_search", _search, body["question"], filters, top_k)
+
+
+class AskHandler(_JsonHandler):
+    async def post(self):
+        body = self.read_question()
+        # Optional latency budget of the question, READER_BUDGET_SECONDS by default
+        budget = body.get("budget_seconds")
+        if budget is not None and (isinstance(budget, bool) or not isinstance(budget, (int, float)) or budget < 0):
+            raise tornado.web.HTTPError(400, reason="`budget_seconds` must be a non-negative number")
+        # The model workers are only as loaded as the queue of the service
+        load = self.workers.pending / self.workers.max_pending
+        await self.run("service_ask", _ask, body["question"], self.date_range(body), budget, load)
+
+
+class HealthHandler(_JsonHandler):
+    def get(self):
+        self.finish({"status": "ok", "workers": self.workers.num_workers, "pending": self.workers.pending})
+
+
+def make_app(workers: ModelWorkers) -> tornado.web.Application:
+    handlers = [("/search", SearchHandler), ("/ask", AskHandler), ("/health", HealthHandler)]
+    return tornado.web.Application([(path, handler, {"workers": workers}) for path, handler in handlers])
+
+
+async def serve(port: int = SERVICE_PORT, num_workers: int = SERVICE_WORKERS, max_pending: int = SERVICE_MAX_PENDING):
+    workers = ModelWorkers(num_workers, max_pending)
+    try:
+        await workers.start()
+        make_app(workers).listen(port)
+        logger.info("Serving /search and /ask on port %d", port)
+        await asyncio.Event().wait()
+    finally:
+        workers.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP search and QA service over the paper index")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help="port to serve the API on")
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="model worker processes")
+    parser.add_argument(
+        "--max-pending", type=int, default=SERVICE_MAX_PENDING, help="requests running or waiting before a 503"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if METRICS_PORT:
+        metrics.start_metrics_server(METRICS_PORT)
+    asyncio.run(serve(args.port, args.workers, args.max_pending))
@@ -0,0 +1,116 @@
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+from config import INDEX_NAME
+
+# Hash holding the codec the paper vectors were written with, next to the search index
+CODEC_KEY = f"{INDEX_NAME}:codec"
+# File holding the codec in an ingest directory exported from Redis
+CODEC_FILE = "codec.npz"
+VECTOR_TYPES = {"FLOAT32": np.float32, "FLOAT16": np.float16}
+PCA_SAMPLE_SIZE = 100_000
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.clip(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12, None)
+
+
+class VectorCodec:
+    """How paper and query vectors are stored in the index: an optional PCA projection to `dim` dimensions, fitted
+    on the corpus at ingest, followed by a cast to `vector_type`. Query vectors go through the same projection.
+    """
+
+    def __init__(
+        self,
+        vector_type: str = "FLOAT32",
+        dim: int = 768,
+        distance_metric: str = "L2",
+        mean: Optional[np.ndarray] = None,
+        components: Optional[np.ndarray] = None,
+    ):
+        if vector_type not in VECTOR_TYPES:
+            raise ValueError(f"Unsupported vector type {vector_type}, use one of {list(VECTOR_TYPES)}")
+        self.vector_type = vector_type
+        self.dtype = VECTOR_TYPES[vector_type]
+        self.dim = dim
+        self.distance_metric = distance_metric
+        self.mean = mean
+        self.components = components
+
+    @property
+    def is_identity(self) -> bool:
+        return self.vector_type == "FLOAT32" and self.components is None
+
+    @classmethod
+    def fit(cls, sample: np.ndarray, vector_type: str, dim: int, distance_metric: str) -> "VectorCodec":
+        """Fit the PCA projection on a sample of the corpus when `dim` is below the embedding dimension."""
+        sample = np.asarray(sample, dtype=np.float32)
+        if dim >= sample.shape[1]:
+            return cls(vector_type, sample.shape[1], distance_metric)
+        mean = sample.mean(axis=0)
+        centered = sample - mean
+        # Eigenvectors of the covariance: much cheaper than an SVD of the sample itself
+        eigenvalues, eigenvectors = np.linalg.eigh(centered.T @ centered)
+        components = eigenvectors[:, np.argsort(eigenvalues)[::-1][:dim]].T.astype(np.float32)
+        return cls(vector_type, dim, distance_metric, mean, np.ascontiguousarray(components))
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        """Float32 vectors in the index space, before the cast to the storage type."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.components is None:
+            return vectors
+        # The embeddings are normalised: keep the projected vectors normalised for inner product and cosine
+        return normalize((vectors - self.mean) @ self.components.T)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(self.project(vectors), dtype=self.dtype)
+
+    def decode(self, data: bytes) -> np.ndarray:
+        return np.frombuffer(data, dtype=self.dtype).astype(np.float32)
+
+    def distances(self, query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        """Exact distances as reported by RediSearch in `vector_score`: the lower, the closer."""
+        if self.distance_metric == "L2":
+            return ((vectors - query) ** 2).sum(axis=1)
+        if self.distance_metric == "COSINE":
+            return 1 - normalize(vectors) @ normalize(query)
+        return 1 - vectors @ query
+
+    def to_mapping(self) -> dict:
+        mapping = {"vector_type": self.vector_type, "dim": self.dim, "distance_metric": self.distance_metric}
+        if self.components is not None:
+            mapping["mean"] = self.mean.astype(np.float32).tobytes()
+            mapping["components"] = self.components.astype(np.float32).tobytes()
+        return mapping
+
+    @classmethod
+    def from_mapping(cls, mapping: dict) -> "VectorCodec":
+        """Inverse of `to_mapping`, from the raw `HGETALL` reply. An empty mapping is the historical FLOAT32 index."""
+        mapping = {_text(key): value for key, value in mapping.items()}
+        if not mapping:
+            return cls()
+        dim = int(mapping["dim"])
+        mean, components = None, None
+        if "components" in mapping:
+            mean = np.frombuffer(mapping["mean"], dtype=np.float32)
+            components = np.frombuffer(mapping["components"], dtype=np.float32).reshape(dim, -1)
+        return cls(_text(mapping["vector_type"]), dim, _text(mapping["distance_metric"]), mean, components)
+
+    def save(self, path: Union[str, Path]) -> None:
+        arrays = {"vector_type": self.vector_type, "dim": self.dim, "distance_metric": self.distance_metric}
+        if self.components is not None:
+            arrays.update(mean=self.mean, components=self.components)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "VectorCodec":
+        with np.load(path) as arrays:
+            mean = arrays["mean"] if "mean" in arrays else None
+            components = arrays["components"] if "components" in arrays else None
+            return cls(str(arrays["vector_type"]), int(arrays["dim"]), str(arrays["distance_metric"]), mean, components)
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
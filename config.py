@@ -1,22 +1,32 @@
 import os
 from pathlib import Path
 
-import torch
-
 
 def get_project_root() -> Path:
     return Path(__file__).parent
 
 
+def gpu_available() -> bool:
+    # Importing torch takes seconds: only look for the NVIDIA driver to pick defaults at import time
+    return os.path.exists("/proc/driver/nvidia/version") and os.getenv("CUDA_VISIBLE_DEVICES") != ""
+
+
 # Redis
 REDIS_HOST = os.getenv("REDIS_HOST", "NONE__REDIS_HOST")
 REDIS_PORT = os.getenv("REDIS_PORT", "NONE__REDIS_PORT")
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "NONE__REDIS_PASSWORD")
 REDIS_DB = os.environ.get("REDIS_DB", "NONE__REDIS_DB")
-REDIS_INDEX_TYPE = os.environ.get("REDIS_DB", "NONE__REDIS_INDEX_TYPE")
+REDIS_INDEX_TYPE = os.environ.get("REDIS_INDEX_TYPE", "NONE__REDIS_INDEX_TYPE")
 
 REDIS_URL = f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
 INDEX_NAME = "papers"
+# Prefix of the paper hashes covered by the index
+PAPER_PREFIX = "paper_vector:"
+# Optional index of the overlapping sentence windows of the abstracts, see `askyves.passages`
+PASSAGE_INDEX_NAME = "passages"
+PASSAGE_PREFIX = "passage_vector:"
+# Incremented every time the search index is rebuilt, cached answers computed against older versions are ignored
+INDEX_VERSION_KEY = f"{INDEX_NAME}:version"
 
 missing = [
     env_var.lstrip("NONE__")
@@ -26,6 +36,36 @@ missing = [
 if missing:
     raise RuntimeError(f"The following env variables haven't been set : {missing}")
 
+# Optional read replicas as "host:port,host:port": searches are spread over them, writes go to REDIS_HOST
+REDIS_READ_REPLICAS = [
+    tuple(replica.strip().rsplit(":", 1))
+    for replica in os.getenv("REDIS_READ_REPLICAS", "").split(",")
+    if replica.strip()
+]
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", "3"))
+# Vector index settings. FLAT and HNSW indexes use the same metric so that their scores are comparable
+REDIS_DISTANCE_METRIC = os.getenv("REDIS_DISTANCE_METRIC", "COSINE")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_RUNTIME = int(os.getenv("HNSW_EF_RUNTIME", "10"))
+# Candidates fetched from the index and re-ranked exactly on the client, 0 to disable
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "0"))
+# Papers cached in process: KNN searches then only return ids and scores, 0 to fetch every field with the search
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", "0"))
+# The reader takes the tokens of the abstracts from an in-process cache of READER_TOKEN_CACHE_SIZE abstracts, then from
+# the tokens stored with the papers by `load_data_in_redis.py --reader-tokens`, and only tokenizes the others
+READER_TOKENS = os.getenv("READER_TOKENS", "false").lower() == "true"
+READER_TOKEN_CACHE_SIZE = int(os.getenv("READER_TOKEN_CACHE_SIZE", "10000"))
+# Search the passage index and read only the closest passage of each paper instead of its whole abstract.
+# PASSAGE_CANDIDATES passages are fetched per paper to return, as several of them can come from the same paper
+PASSAGE_MODE = os.getenv("PASSAGE_MODE", "false").lower() == "true"
+PASSAGE_CANDIDATES = int(os.getenv("PASSAGE_CANDIDATES", "3"))
+# "redis", or "numpy" to search an ingest directory in process with `askyves.numpy_document_store`
+DOCUMENT_STORE = os.getenv("DOCUMENT_STORE", "redis")
+NUMPY_STORE_PATH = os.getenv("NUMPY_STORE_PATH", str(get_project_root() / "data/arxiv_embeddings"))
+
 SEARCH_TYPE = "KNN"
 NUMBER_OF_RESULTS = 10
 
@@ -35,9 +75,44 @@ REDIS_ICON_PATH = "https://arxiv.org/favicon.ico"
 
 FONT_AWESOME_IMPORT = '<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css">'  # noqa: E501
 
-if torch.cuda.is_available():
+if gpu_available():
     TOP_K_READER = 100
 else:
     TOP_K_READER = 10
 
 TOP_K_RETRIEVER = 10
+# Year range the app starts with, also used for questions asked without one
+DEFAULT_YEARS = (2011, 2022)
+
+# Render the retrieved abstracts as soon as they are found, then each answer as the reader scores its abstract
+PROGRESSIVE_RENDERING = os.getenv("PROGRESSIVE_RENDERING", "true").lower() == "true"
+# Latency budget of a question in seconds, 0 to always read the TOP_K_RETRIEVER documents. With a budget, the reader
+# only reads the documents before the first gap of more than READER_SCORE_GAP of the spread of their retrieval scores,
+# fewer of them above a READER_HIGH_LOAD reader queue fill ratio, never less than READER_MIN_DOCUMENTS, and stops at
+# the deadline once it has read one. See `askyves.reader_policy`
+READER_BUDGET_SECONDS = float(os.getenv("READER_BUDGET_SECONDS", "0"))
+READER_MIN_DOCUMENTS = int(os.getenv("READER_MIN_DOCUMENTS", "1"))
+READER_SCORE_GAP = float(os.getenv("READER_SCORE_GAP", "0.5"))
+READER_HIGH_LOAD = float(os.getenv("READER_HIGH_LOAD", "0.5"))
+# With MICRO_BATCHING, the questions of concurrent sessions are embedded and read in shared forward passes, see
+# `askyves.batching`.
+# Requests are collected for up to BATCH_WINDOW_MS after the first one, and dropped once BATCH_MAX_QUEUE_DEPTH
+# requests are waiting or after waiting BATCH_TIMEOUT_SECONDS
+MICRO_BATCHING = os.getenv("MICRO_BATCHING", "false").lower() == "true"
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+READER_MAX_BATCH_SIZE = int(os.getenv("READER_MAX_BATCH_SIZE", "8"))
+BATCH_MAX_QUEUE_DEPTH = int(os.getenv("BATCH_MAX_QUEUE_DEPTH", "64"))
+BATCH_TIMEOUT_SECONDS = float(os.getenv("BATCH_TIMEOUT_SECONDS", "30"))
+# HTTP search and QA service, see `askyves.service`. Each worker process holds its own copy of the models
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "2"))
+SERVICE_MAX_PENDING = int(os.getenv("SERVICE_MAX_PENDING", "64"))
+# When set, e.g. to "http://localhost:8080", the app asks the service instead of loading the models itself
+ASKYVES_API_URL = os.getenv("ASKYVES_API_URL", "")
+ASKYVES_API_TIMEOUT = float(os.getenv("ASKYVES_API_TIMEOUT", "60"))
+# Load the models when the app starts instead of on the first query
+WARM_UP_MODELS = os.getenv("WARM_UP_MODELS", "false").lower() == "true"
+# Prometheus metrics of the app are served on this port, e.g. 8000, 0 to disable. See `askyves.metrics` for the slow
+# query log
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
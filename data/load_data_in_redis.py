@@ -1,12 +1,43 @@
+import argparse
 import asyncio
 import pickle
+import time
 import typing as t
 
 import numpy as np
 import redis.asyncio as redis
 
-from config import REDIS_INDEX_TYPE, REDIS_URL
-from frontend.lib.query_utils import create_flat_index, create_hnsw_index
+from askyves.ingest import (
+    EMBEDDING_DIM,
+    count_papers,
+    is_ingest_dir,
+    iter_paper_batches,
+    paper_to_mapping,
+    read_vectors,
+)
+from askyves.reader_tokens import READER_TOKENS_FIELD, encode_reader_tokens
+from askyves.vector_codec import CODEC_KEY, PCA_SAMPLE_SIZE, VECTOR_TYPES, VectorCodec
+from config import (
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_RUNTIME,
+    HNSW_M,
+    INDEX_NAME,
+    INDEX_VERSION_KEY,
+    PAPER_PREFIX,
+    REDIS_DISTANCE_METRIC,
+    REDIS_INDEX_TYPE,
+    REDIS_URL,
+)
+from frontend.lib.query_utils import create_flat_index, create_hnsw_index, index_exists
+
+# Number of papers committed contiguously from the start of the file, used to resume an interrupted load
+LOADER_OFFSET_KEY = "loader:papers:offset"
+# Set once every paper is written and the search index is created
+LOADER_COMPLETE_KEY = "loader:papers:complete"
+
+CHUNK_SIZE = 1000
+MAX_IN_FLIGHT = 8
+PROGRESS_INTERVAL = 5.0
 
 
 def read_paper_df(path_to_pickle_file: str) -> t.List:
@@ -15,55 +46,263 @@ def read_paper_df(path_to_pickle_file: str) -> t.List:
     return df
 
 
-async def gather_with_concurrency(n, redis_conn, *papers):
-    semaphore = asyncio.Semaphore(n)
-
-    async def load_paper(paper):
-        async with semaphore:
-            vector = paper.pop("vector")
-            key = "paper_vector:" + str(paper["id"])
-            # async write data to redis
-            await redis_conn.hset(
-                key,
-                mapping={
-                    "paper_id": paper["id"],
-                    "categories": paper["categories"],
-                    "title": paper["title"],
-                    "year": paper["year"],
-                    "authors": paper["authors"],
-                    "abstract": paper["abstract"],
-                    "update_date": paper["update_date"],
-                    "doi": paper["doi"],
-                    "journal-ref": paper["journal-ref"],
-                    "submitter": paper["submitter"],
-                    "vector": np.array(vector, dtype=np.float32).tobytes(),
-                },
-            )
-
-    # gather with concurrency
-    await asyncio.gather(*[load_paper(p) for p in papers])
-
-
-async def load_all_data(path_to_pickle_file: str):
+def sample_vectors(path: str, papers=None, sample_size: int = PCA_SAMPLE_SIZE) -> np.ndarray:
+    """Random sample of the corpus vectors, to fit the PCA projection of the index."""
+    rng = np.random.default_rng(0)
+    if papers is None:
+        vectors = read_vectors(path)
+        rows = np.sort(rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False))
+        return np.asarray(vectors[rows], dtype=np.float32)
+    rows = rng.choice(len(papers), min(sample_size, len(papers)), replace=False)
+    return np.stack(papers["vector"].iloc[rows].to_numpy()).astype(np.float32)
+
+
+def iter_chunks(df, chunk_size: int, offset: int = 0) -> t.Iterator[t.Tuple[int, t.List[dict]]]:
+    """Lazily yield `(start, papers)` chunks so that only the chunks in flight are materialised as records."""
+    for start in range(offset, len(df), chunk_size):
+        end = start + chunk_size
+        yield start, df.iloc[start:end].to_dict("records")
+
+
+async def load_chunk(
+    redis_conn, papers: t.List[dict], codec: t.Optional[VectorCodec] = None, reader_tokenizer=None
+) -> None:
+    """With a `reader_tokenizer`, the reader tokens of the abstracts are stored with the papers, see
+    `askyves.reader_tokens`.
+    """
+    vectors = [None] * len(papers)
+    if codec is not None and not codec.is_identity:
+        # Project and cast the whole chunk at once
+        vectors = codec.encode(np.stack([paper["vector"] for paper in papers]))
+    reader_tokens = [None] * len(papers)
+    if reader_tokenizer is not None:
+        reader_tokens = encode_reader_tokens(reader_tokenizer, [paper["abstract"] for paper in papers])
+    # Non-transactional pipeline: a single round-trip per chunk, no MULTI/EXEC overhead
+    async with redis_conn.pipeline(transaction=False) as pipe:
+        for paper, vector, tokens in zip(papers, vectors, reader_tokens):
+            mapping = paper_to_mapping(paper, vector)
+            if tokens is not None:
+                mapping[READER_TOKENS_FIELD] = tokens
+            pipe.hset(PAPER_PREFIX + str(paper["id"]), mapping=mapping)
+        await pipe.execute()
+
+
+async def bulk_load(
+    redis_conn,
+    chunks: t.Iterable[t.Tuple[int, t.List[dict]]],
+    total: int,
+    offset: int,
+    max_in_flight: int,
+    codec: t.Optional[VectorCodec] = None,
+    reader_tokenizer=None,
+) -> None:
+    """Write `(start, papers)` chunks through at most `max_in_flight` concurrent pipelines.
+    Chunks may complete out of order, so the checkpoint only moves forward over contiguous committed chunks.
+    """
+    progress = {"offset": offset, "last_report": time.perf_counter()}
+    committed = {}
+    checkpoint_lock = asyncio.Lock()
+    start_time = time.perf_counter()
+
+    async def commit(start: int, papers: t.List[dict]) -> None:
+        await load_chunk(redis_conn, papers, codec, reader_tokenizer)
+        async with checkpoint_lock:
+            committed[start] = start + len(papers)
+            while progress["offset"] in committed:
+                progress["offset"] = committed.pop(progress["offset"])
+            await redis_conn.set(LOADER_OFFSET_KEY, progress["offset"])
+
+        now = time.perf_counter()
+        if now - progress["last_report"] >= PROGRESS_INTERVAL:
+            progress["last_report"] = now
+            rate = (progress["offset"] - offset) / (now - start_time)
+            print(f"{progress['offset']}/{total} papers loaded ({rate:.0f} papers/s)")
+
+    pending = set()
+    try:
+        for start, papers in chunks:
+            if len(pending) >= max_in_flight:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+            pending.add(asyncio.create_task(commit(start, papers)))
+        await asyncio.gather(*pending)
+    except BaseException:
+        # No chunk goes on writing behind the failed one: the next run resumes from the checkpoint
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        raise
+
+    elapsed = time.perf_counter() - start_time
+    print(f"{total - offset} papers written in {elapsed:.1f}s ({(total - offset) / elapsed:.0f} papers/s)")
+
+
+async def read_codec(redis_conn) -> t.Optional[VectorCodec]:
+    mapping = await redis_conn.hgetall(CODEC_KEY)
+    return VectorCodec.from_mapping(mapping) if mapping else None
+
+
+async def build_index(
+    redis_conn, total: int, codec: VectorCodec, hnsw_params: t.Optional[dict] = None, poll_interval: float = 1.0
+) -> str:
+    """Create a new versioned index over the papers, next to the one `INDEX_NAME` points to, and wait until every
+    paper is indexed. Searches keep going to the current index until `swap_index` is called with the returned name.
+    """
+    index_name = f"{INDEX_NAME}_v{int(await redis_conn.get(INDEX_VERSION_KEY) or 0) + 1}"
+    if await index_exists(redis_conn, index_name):
+        print(f"Dropping {index_name}, left over by a build that was not swapped in")
+        await redis_conn.ft(index_name).dropindex(delete_documents=False)
+
+    print(f"Creating vector search index {index_name}")
+    index_args = dict(prefix=PAPER_PREFIX, distance_metric=codec.distance_metric, vector_type=codec.vector_type)
+    if REDIS_INDEX_TYPE == "HNSW":
+        await create_hnsw_index(
+            redis_conn, total, dim=codec.dim, index_name=index_name, **index_args, **(hnsw_params or {})
+        )
+    else:
+        await create_flat_index(redis_conn, total, dim=codec.dim, index_name=index_name, **index_args)
+
+    # Existing papers are indexed in the background
+    start_time, last_report = time.perf_counter(), time.perf_counter()
+    while float((await redis_conn.ft(index_name).info())["percent_indexed"]) < 1:
+        if time.perf_counter() - last_report >= PROGRESS_INTERVAL:
+            last_report = time.perf_counter()
+            info = await redis_conn.ft(index_name).info()
+            print(f"{index_name}: {100 * float(info['percent_indexed']):.0f}% indexed")
+        await asyncio.sleep(poll_interval)
+    print(f"{index_name} built in {time.perf_counter() - start_time:.1f}s")
+    return index_name
+
+
+async def swap_index(redis_conn, index_name: str) -> None:
+    """Point the `INDEX_NAME` alias at `index_name` and bump the index version in one transaction, so that searches
+    switch to the new index at once. The index it replaces is then dropped, the papers are kept.
+    """
+    previous = None
+    if await index_exists(redis_conn):
+        previous = (await redis_conn.ft(INDEX_NAME).info())["index_name"]
+    async with redis_conn.pipeline(transaction=True) as pipe:
+        if previous == INDEX_NAME:
+            # An index created before versioned indexes holds the name itself: the alias can only take it once dropped
+            pipe.execute_command("FT.DROPINDEX", INDEX_NAME)
+        pipe.execute_command("FT.ALIASUPDATE", INDEX_NAME, index_name)
+        pipe.incr(INDEX_VERSION_KEY)
+        await pipe.execute()
+    if previous not in (None, INDEX_NAME):
+        await redis_conn.ft(previous).dropindex(delete_documents=False)
+    print(f"{INDEX_NAME} now points to {index_name}")
+
+
+async def load_all_data(
+    path: str,
+    chunk_size: int = CHUNK_SIZE,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    recreate_index: bool = False,
+    vector_type: str = "FLOAT32",
+    dim: int = EMBEDDING_DIM,
+    distance_metric: str = REDIS_DISTANCE_METRIC,
+    hnsw_params: t.Optional[dict] = None,
+    reader_tokens: bool = False,
+):
+    """Load papers from either a columnar ingest directory (see `askyves.ingest`) or a legacy pickled DataFrame.
+    Vectors are stored as `vector_type`, projected to `dim` dimensions with a PCA fitted on the corpus when `dim` is
+    below the embedding dimension. `hnsw_params` (`m`, `ef_construction`, `ef_runtime`) are passed to
+    `create_hnsw_index`. With `reader_tokens`, the abstracts are also tokenized for the reader, see `load_chunk`.
+    With `recreate_index`, a new search index is built over the papers already in Redis, e.g. to pick up new
+    filterable fields, and swapped in once complete.
+    """
     redis_conn = redis.from_url(REDIS_URL)
-    if await redis_conn.dbsize() > 300:
+    total = await redis_conn.get(LOADER_COMPLETE_KEY)
+    if total is not None and not recreate_index:
         print("papers already loaded")
-    else:
+        return
+
+    codec = await read_codec(redis_conn)
+    if total is None:
         print("Loading papers into Vecsim App")
-        papers = read_paper_df(path_to_pickle_file)
-        papers = papers.to_dict("records")
-        await gather_with_concurrency(100, redis_conn, *papers)
+        offset = int(await redis_conn.get(LOADER_OFFSET_KEY) or 0)
+        papers = None if is_ingest_dir(path) else read_paper_df(path)
+        if codec is None:
+            # A load started before vectors could be compressed must be resumed in the same format
+            if offset:
+                codec = VectorCodec(distance_metric=distance_metric)
+            elif dim < EMBEDDING_DIM:
+                print(f"Fitting the {vector_type} vector codec with {dim} dimensions")
+                codec = VectorCodec.fit(sample_vectors(path, papers), vector_type, dim, distance_metric)
+            else:
+                # No projection to fit: the vectors are only cast
+                codec = VectorCodec(vector_type, EMBEDDING_DIM, distance_metric)
+            await redis_conn.hset(CODEC_KEY, mapping=codec.to_mapping())
+        if papers is None:
+            total = count_papers(path)
+            chunks = iter_paper_batches(path, chunk_size, offset)
+        else:
+            total = len(papers)
+            chunks = iter_chunks(papers, chunk_size, offset)
+        if offset:
+            print(f"Resuming from paper {offset}/{total}")
+        reader_tokenizer = None
+        if reader_tokens:
+            from askyves.models import get_reader_tokenizer
+
+            reader_tokenizer = get_reader_tokenizer()
+        await bulk_load(redis_conn, chunks, total, offset, max_in_flight, codec, reader_tokenizer)
         print("papers loaded!")
+    total = int(total)
+    codec = codec or VectorCodec(distance_metric=distance_metric)
+    # Once papers are written, the stored codec wins over `vector_type` and `dim`
+    vector_bytes = codec.dim * np.dtype(codec.dtype).itemsize
+    print(f"Vectors stored as {codec.vector_type} with {codec.dim} dimensions ({vector_bytes} bytes each)")
 
-        print("Creating vector search index")
-        # create a search index
-        if REDIS_INDEX_TYPE == "HNSW":
-            await create_hnsw_index(redis_conn, len(papers), prefix="paper_vector:", distance_metric="IP")
-        else:
-            await create_flat_index(redis_conn, len(papers), prefix="paper_vector:", distance_metric="L2")
-        print("Search index created")
+    if recreate_index:
+        # The metric, unlike the stored vectors, can change when the index is rebuilt
+        codec.distance_metric = distance_metric
+        await redis_conn.hset(CODEC_KEY, mapping=codec.to_mapping())
+
+    # A previous run may have died after creating the index but before setting the completion marker
+    if await index_exists(redis_conn) and not recreate_index:
+        print("Search index already exists")
+    else:
+        # The current index, if any, keeps serving searches while the new one is built
+        await swap_index(redis_conn, await build_index(redis_conn, total, codec, hnsw_params))
+
+    await redis_conn.set(LOADER_COMPLETE_KEY, total)
+    await redis_conn.delete(LOADER_OFFSET_KEY)
 
 
 if __name__ == "__main__":
-    embeddings_pickle_file = "data/arxiv_embedings.pkl"
-    asyncio.run(load_all_data(path_to_pickle_file=embeddings_pickle_file))
+    parser = argparse.ArgumentParser(description="Bulk load arXiv papers and their embeddings into Redis")
+    parser.add_argument(
+        "--path",
+        default="data/arxiv_embedings.pkl",
+        help="columnar ingest directory (papers.parquet + vectors.npy) or pickled DataFrame of embedded papers",
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="papers written per pipeline")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="concurrent pipelines")
+    parser.add_argument("--vector-type", choices=list(VECTOR_TYPES), default="FLOAT32", help="vector storage type")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM, help="project vectors to fewer dimensions with PCA")
+    parser.add_argument("--distance-metric", choices=["L2", "IP", "COSINE"], default=REDIS_DISTANCE_METRIC)
+    parser.add_argument("--m", type=int, default=HNSW_M, help="HNSW: edges per node")
+    parser.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION, help="HNSW: build beam width")
+    parser.add_argument("--ef-runtime", type=int, default=HNSW_EF_RUNTIME, help="HNSW: default query beam width")
+    parser.add_argument(
+        "--recreate-index", action="store_true", help="build a new search index over the loaded papers and swap it in"
+    )
+    parser.add_argument(
+        "--reader-tokens", action="store_true", help="store the reader tokens of the abstracts, for READER_TOKENS"
+    )
+    args = parser.parse_args()
+    asyncio.run(
+        load_all_data(
+            args.path,
+            chunk_size=args.chunk_size,
+            max_in_flight=args.max_in_flight,
+            recreate_index=args.recreate_index,
+            vector_type=args.vector_type,
+            dim=args.dim,
+            distance_metric=args.distance_metric,
+            hnsw_params={"m": args.m, "ef_construction": args.ef_construction, "ef_runtime": args.ef_runtime},
+            reader_tokens=args.reader_tokens,
+        )
+    )
@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import time
+import typing as t
+
+import numpy as np
+import redis.asyncio as redis
+
+from askyves.build_embeddings import BATCH_SIZE, NUM_WORKERS, embed_texts, encoder_pool
+from askyves.cleaner import clean_descriptions
+from askyves.models import EMBEDDING_MODEL_NAME
+from askyves.passages import (
+    PASSAGE_SENTENCES,
+    PASSAGE_STRIDE,
+    empty_numeric_fields,
+    passage_hash,
+    passage_key,
+    passage_to_mapping,
+    split_passages,
+)
+from askyves.vector_codec import VectorCodec
+from config import (
+    INDEX_VERSION_KEY,
+    PAPER_PREFIX,
+    PASSAGE_INDEX_NAME,
+    PASSAGE_PREFIX,
+    REDIS_DISTANCE_METRIC,
+    REDIS_INDEX_TYPE,
+    REDIS_URL,
+)
+from data.load_data_in_redis import CHUNK_SIZE, LOADER_COMPLETE_KEY, read_codec
+from frontend.lib.query_utils import create_flat_index, create_hnsw_index, index_exists
+
+PAPER_FIELDS = ["paper_id", "title", "abstract", "year", "categories", "submitter"]
+
+
+async def read_papers(redis_conn, chunk_size: int = CHUNK_SIZE) -> t.AsyncIterator[t.List[dict]]:
+    """The papers in Redis, `chunk_size` at a time, each with the `passage_hash` and `passage_count` of its stored
+    passages, None when it has none.
+    """
+    keys = []
+    async for key in redis_conn.scan_iter(f"{PAPER_PREFIX}*", count=10_000):
+        keys.append(key)
+        if len(keys) == chunk_size:
+            yield await read_chunk(redis_conn, keys)
+            keys = []
+    if keys:
+        yield await read_chunk(redis_conn, keys)
+
+
+async def read_chunk(redis_conn, keys: list) -> t.List[dict]:
+    async with redis_conn.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.hmget(key, PAPER_FIELDS)
+            pipe.hmget(
+                passage_key(PASSAGE_PREFIX, key.decode().removeprefix(PAPER_PREFIX), 0),
+                ["passage_hash", "passage_count"],
+            )
+        values = await pipe.execute()
+    papers = []
+    for fields, (stored_hash, stored_count) in zip(values[::2], values[1::2]):
+        paper = {field: (data or b"").decode() for field, data in zip(PAPER_FIELDS, fields)}
+        paper["passage_hash"] = passage_hash(paper)
+        paper["stored_hash"] = None if stored_hash is None else stored_hash.decode()
+        paper["stored_count"] = 0 if stored_count is None else int(stored_count)
+        papers.append(paper)
+    return papers
+
+
+async def write_passages(
+    redis_conn, papers: t.List[dict], spans: t.List[t.List[t.Tuple[int, int]]], vectors: np.ndarray
+) -> None:
+    """Write the passages of `papers` and delete the ones left over by longer previous versions of their abstract."""
+    vectors = iter(vectors)
+    async with redis_conn.pipeline(transaction=False) as pipe:
+        for paper, paper_spans in zip(papers, spans):
+            empty = empty_numeric_fields(paper)
+            for number, (start, end) in enumerate(paper_spans):
+                key = passage_key(PASSAGE_PREFIX, paper["paper_id"], number)
+                if empty:
+                    # The previous version of the paper may have had a value
+                    pipe.hdel(key, *empty)
+                pipe.hset(key, mapping=passage_to_mapping(paper, start, end, len(paper_spans), next(vectors)))
+            stale = range(len(paper_spans), paper["stored_count"])
+            if stale:
+                pipe.unlink(*[passage_key(PASSAGE_PREFIX, paper["paper_id"], number) for number in stale])
+        await pipe.execute()
+
+
+async def load_passages(
+    model_name: str = EMBEDDING_MODEL_NAME,
+    num_workers: int = NUM_WORKERS,
+    batch_size: int = BATCH_SIZE,
+    chunk_size: int = CHUNK_SIZE,
+    sentences: int = PASSAGE_SENTENCES,
+    stride: int = PASSAGE_STRIDE,
+    recreate_index: bool = False,
+) -> dict:
+    """Split the abstracts of the papers in Redis into overlapping sentence windows, embed them and index them in
+    `PASSAGE_INDEX_NAME`, for the passage mode of the document store. Papers whose passages are up to date are
+    skipped: run it again after a sync to embed the passages of new and changed papers. The passages of papers
+    deleted since are only dropped by `recreate_index`, as are passages split with other `sentences` or `stride`.
+    """
+    redis_conn = redis.from_url(REDIS_URL)
+    if await redis_conn.get(LOADER_COMPLETE_KEY) is None:
+        print("No complete load to split, run data/load_data_in_redis.py first")
+        return {}
+    # Passages are stored and searched like papers
+    codec = await read_codec(redis_conn) or VectorCodec(distance_metric=REDIS_DISTANCE_METRIC)
+    if recreate_index and await index_exists(redis_conn, PASSAGE_INDEX_NAME):
+        print(f"Dropping {PASSAGE_INDEX_NAME} and its passages")
+        await redis_conn.ft(PASSAGE_INDEX_NAME).dropindex(delete_documents=True)
+
+    counts = {"papers": 0, "split": 0, "passages": 0}
+    start_time = time.perf_counter()
+    with encoder_pool(model_name, num_workers) as pool:
+        async for papers in read_papers(redis_conn, chunk_size):
+            counts["papers"] += len(papers)
+            changed = [paper for paper in papers if paper["stored_hash"] != paper["passage_hash"]]
+            counts["passages"] += sum(
+                paper["stored_count"] for paper in papers if paper["stored_hash"] == paper["passage_hash"]
+            )
+            changed_spans = [split_passages(paper["abstract"], sentences, stride) for paper in changed]
+            # A paper without sentences has no passage to record its hash in: it is only split again to delete the
+            # passages of a previous version of its abstract
+            stale, spans = [], []
+            for paper, paper_spans in zip(changed, changed_spans):
+                if paper_spans or paper["stored_count"]:
+                    stale.append(paper)
+                    spans.append(paper_spans)
+            texts = [
+                paper["abstract"][start:end] for paper, paper_spans in zip(stale, spans) for start, end in paper_spans
+            ]
+            if stale:
+                vectors = codec.encode(embed_texts(pool, clean_descriptions(texts), batch_size)) if texts else []
+                await write_passages(redis_conn, stale, spans, vectors)
+            counts["split"] += len(stale)
+            counts["passages"] += len(texts)
+            print(f"{counts['papers']} papers read ({time.perf_counter() - start_time:.0f}s): {counts}")
+
+    if not await index_exists(redis_conn, PASSAGE_INDEX_NAME):
+        print(f"Creating vector search index {PASSAGE_INDEX_NAME}")
+        index_args = dict(prefix=PASSAGE_PREFIX, distance_metric=codec.distance_metric, vector_type=codec.vector_type)
+        create = create_hnsw_index if REDIS_INDEX_TYPE == "HNSW" else create_flat_index
+        await create(redis_conn, max(1, counts["passages"]), dim=codec.dim, index_name=PASSAGE_INDEX_NAME, **index_args)
+    if counts["split"]:
+        # Drop the answers the app instances cached from the previous passages
+        await redis_conn.incr(INDEX_VERSION_KEY)
+    print(f"Passages loaded in {time.perf_counter() - start_time:.0f}s: {counts}")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the sentence windows of the abstracts loaded in Redis")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME, help="model the loaded papers were embedded with")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="number of encoding processes")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="texts per forward pass")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="papers split and written at a time")
+    parser.add_argument("--sentences", type=int, default=PASSAGE_SENTENCES, help="sentences per passage")
+    parser.add_argument("--stride", type=int, default=PASSAGE_STRIDE, help="sentences between passage starts")
+    parser.add_argument(
+        "--recreate-index", action="store_true", help="drop the passage index and its passages, then split every paper"
+    )
+    args = parser.parse_args()
+    asyncio.run(
+        load_passages(
+            model_name=args.model,
+            num_workers=args.workers,
+            batch_size=args.batch_size,
+            chunk_size=args.chunk_size,
+            sentences=args.sentences,
+            stride=args.stride,
+            recreate_index=args.recreate_index,
+        )
+    )
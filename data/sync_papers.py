@@ -0,0 +1,209 @@
+import argparse
+import asyncio
+import contextlib
+import time
+import typing as t
+
+import redis.asyncio as redis
+
+from askyves.build_embeddings import (
+    BATCH_SIZE,
+    MAX_YEAR,
+    NUM_WORKERS,
+    SHARD_SIZE,
+    embed_texts,
+    encoder_pool,
+    iter_shards,
+    paper_text,
+)
+from askyves.cleaner import clean_descriptions
+from askyves.ingest import METADATA_FIELDS, content_hash, metadata_hash
+from askyves.models import EMBEDDING_MODEL_NAME
+from askyves.vector_codec import VectorCodec
+from config import (
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_RUNTIME,
+    HNSW_M,
+    INDEX_VERSION_KEY,
+    PAPER_PREFIX,
+    REDIS_DISTANCE_METRIC,
+    REDIS_URL,
+)
+from data.load_data_in_redis import CHUNK_SIZE, LOADER_COMPLETE_KEY, build_index, load_chunk, read_codec, swap_index
+
+# Refuse to delete more than this fraction of the stored papers: a truncated snapshot must not wipe the corpus
+MAX_DELETE_FRACTION = 0.1
+
+
+async def read_stored_hashes(redis_conn, chunk_size: int = CHUNK_SIZE) -> t.Dict[str, t.Tuple[str, str]]:
+    """`(content_hash, metadata_hash)` of every paper in Redis, by paper id. Papers loaded before the hashes were
+    stored get them computed from their fields.
+    """
+    keys = [key async for key in redis_conn.scan_iter(f"{PAPER_PREFIX}*", count=10_000)]
+    hashes, legacy = {}, []
+    for start in range(0, len(keys), chunk_size):
+        end = start + chunk_size
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            for key in keys[start:end]:
+                pipe.hmget(key, ["content_hash", "metadata_hash"])
+            values = await pipe.execute()
+        for key, (stored_content_hash, stored_metadata_hash) in zip(keys[start:end], values):
+            if stored_content_hash is None:
+                legacy.append(key)
+            else:
+                hashes[key.decode().removeprefix(PAPER_PREFIX)] = (
+                    stored_content_hash.decode(),
+                    stored_metadata_hash.decode(),
+                )
+
+    fields = ["title", "abstract", *METADATA_FIELDS]
+    for start in range(0, len(legacy), chunk_size):
+        end = start + chunk_size
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            for key in legacy[start:end]:
+                pipe.hmget(key, fields)
+            values = await pipe.execute()
+        for key, value in zip(legacy[start:end], values):
+            paper = {field: (data or b"").decode() for field, data in zip(fields, value)}
+            hashes[key.decode().removeprefix(PAPER_PREFIX)] = (content_hash(paper), metadata_hash(paper))
+    if legacy:
+        print(f"{len(legacy)} papers without stored hashes, they were hashed from their fields")
+    return hashes
+
+
+async def update_metadata(redis_conn, papers: t.List[dict]) -> None:
+    """Rewrite the metadata of papers whose title and abstract did not change, keeping their vectors."""
+    async with redis_conn.pipeline(transaction=False) as pipe:
+        for paper in papers:
+            mapping = {field: paper[field] for field in METADATA_FIELDS}
+            pipe.hset(PAPER_PREFIX + paper["id"], mapping={**mapping, "metadata_hash": metadata_hash(paper)})
+        await pipe.execute()
+
+
+async def delete_papers(redis_conn, paper_ids: t.List[str], chunk_size: int = CHUNK_SIZE) -> None:
+    for start in range(0, len(paper_ids), chunk_size):
+        end = start + chunk_size
+        await redis_conn.unlink(*[PAPER_PREFIX + paper_id for paper_id in paper_ids[start:end]])
+
+
+async def sync_papers(
+    snapshot_path: str,
+    model_name: str = EMBEDDING_MODEL_NAME,
+    num_workers: int = NUM_WORKERS,
+    batch_size: int = BATCH_SIZE,
+    shard_size: int = SHARD_SIZE,
+    max_year: int = MAX_YEAR,
+    max_delete_fraction: float = MAX_DELETE_FRACTION,
+    rebuild_index: bool = False,
+    hnsw_params: t.Optional[dict] = None,
+    dry_run: bool = False,
+    reader_tokens: bool = False,
+) -> dict:
+    """Bring the papers in Redis in line with a new arXiv snapshot: new papers and papers whose title or abstract
+    changed are embedded and written, papers whose other fields changed are rewritten without re-embedding them,
+    and withdrawn papers are deleted. The search index follows the changes as they are written.
+    With `rebuild_index`, a fresh versioned index is then built in the background and swapped in. With
+    `reader_tokens`, the reader tokens of the written abstracts are stored with them, see `load_chunk`.
+    """
+    redis_conn = redis.from_url(REDIS_URL)
+    if await redis_conn.get(LOADER_COMPLETE_KEY) is None:
+        print("No complete load to sync, run data/load_data_in_redis.py first")
+        return {}
+    codec = await read_codec(redis_conn) or VectorCodec(distance_metric=REDIS_DISTANCE_METRIC)
+    stored = await read_stored_hashes(redis_conn)
+    reader_tokenizer = None
+    if reader_tokens and not dry_run:
+        from askyves.models import get_reader_tokenizer
+
+        reader_tokenizer = get_reader_tokenizer()
+    print(f"{len(stored)} papers in Redis")
+
+    counts = {"new": 0, "changed": 0, "metadata": 0, "unchanged": 0, "deleted": 0}
+    seen = set()
+    start_time = time.perf_counter()
+    with contextlib.nullcontext() if dry_run else encoder_pool(model_name, num_workers) as pool:
+        for papers in iter_shards(snapshot_path, shard_size, max_year):
+            to_embed, to_update = [], []
+            for paper in papers:
+                seen.add(paper["id"])
+                hashes = stored.get(paper["id"])
+                if hashes is None or hashes[0] != content_hash(paper):
+                    counts["new" if hashes is None else "changed"] += 1
+                    to_embed.append(paper)
+                elif hashes[1] != metadata_hash(paper):
+                    counts["metadata"] += 1
+                    to_update.append(paper)
+                else:
+                    counts["unchanged"] += 1
+
+            if not dry_run and to_embed:
+                vectors = embed_texts(pool, clean_descriptions([paper_text(paper) for paper in to_embed]), batch_size)
+                for start in range(0, len(to_embed), CHUNK_SIZE):
+                    end = start + CHUNK_SIZE
+                    chunk = [
+                        {**paper, "vector": vector} for paper, vector in zip(to_embed[start:end], vectors[start:end])
+                    ]
+                    await load_chunk(redis_conn, chunk, codec, reader_tokenizer)
+            if not dry_run and to_update:
+                await update_metadata(redis_conn, to_update)
+            print(f"{len(seen)} papers compared ({time.perf_counter() - start_time:.0f}s): {counts}")
+
+    withdrawn = sorted(set(stored) - seen)
+    if len(withdrawn) > max_delete_fraction * len(stored):
+        raise ValueError(
+            f"{len(withdrawn)} of the {len(stored)} papers are missing from the snapshot, more than "
+            f"{max_delete_fraction:.0%}: is it complete? Raise `--max-delete-fraction` to delete them anyway"
+        )
+    counts["deleted"] = len(withdrawn)
+    if dry_run:
+        print(f"Dry run, nothing written: {counts}")
+        return counts
+    await delete_papers(redis_conn, withdrawn)
+    await redis_conn.set(LOADER_COMPLETE_KEY, len(seen))
+    print(f"Sync done in {time.perf_counter() - start_time:.0f}s: {counts}")
+
+    if rebuild_index:
+        await swap_index(redis_conn, await build_index(redis_conn, len(seen), codec, hnsw_params))
+    elif counts["new"] + counts["changed"] + counts["metadata"] + counts["deleted"]:
+        # Drop the papers and answers the app instances cached before the sync
+        await redis_conn.incr(INDEX_VERSION_KEY)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync the papers in Redis with a new arXiv snapshot")
+    parser.add_argument("--input", default="data/arxiv-metadata-oai-snapshot.json", help="arXiv JSON lines snapshot")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME, help="model the loaded papers were embedded with")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="number of encoding processes")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="texts per forward pass")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="papers compared at a time")
+    parser.add_argument("--max-year", type=int, default=MAX_YEAR, help="ignore journal reference years after this")
+    parser.add_argument(
+        "--max-delete-fraction", type=float, default=MAX_DELETE_FRACTION, help="abort above this share of deletions"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="only count the changes, without embedding anything")
+    parser.add_argument(
+        "--rebuild-index", action="store_true", help="then build a fresh search index and swap it in atomically"
+    )
+    parser.add_argument("--m", type=int, default=HNSW_M, help="HNSW: edges per node")
+    parser.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION, help="HNSW: build beam width")
+    parser.add_argument("--ef-runtime", type=int, default=HNSW_EF_RUNTIME, help="HNSW: default query beam width")
+    parser.add_argument(
+        "--reader-tokens", action="store_true", help="store the reader tokens of the new and changed abstracts"
+    )
+    args = parser.parse_args()
+    asyncio.run(
+        sync_papers(
+            args.input,
+            model_name=args.model,
+            num_workers=args.workers,
+            batch_size=args.batch_size,
+            shard_size=args.shard_size,
+            max_year=args.max_year,
+            max_delete_fraction=args.max_delete_fraction,
+            rebuild_index=args.rebuild_index,
+            hnsw_params={"m": args.m, "ef_construction": args.ef_construction, "ef_runtime": args.ef_runtime},
+            dry_run=args.dry_run,
+            reader_tokens=args.reader_tokens,
+        )
+    )
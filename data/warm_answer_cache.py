@@ -0,0 +1,35 @@
+import argparse
+import time
+
+from askyves.pipeline import build_answer_cache, build_pipeline, make_qa_query
+from config import DEFAULT_YEARS
+
+
+def read_questions(path: str) -> list:
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def warm_answer_cache(path: str, start_year: int, end_year: int) -> None:
+    questions = read_questions(path)
+    date_range = list(map(str, range(start_year, end_year + 1)))
+    pipe = build_pipeline()
+    answer_cache = build_answer_cache(pipe)
+
+    start_time = time.perf_counter()
+    for i, question in enumerate(questions, start=1):
+        # Without a latency budget: cached answers are read from every retrieved document
+        make_qa_query(pipe, text=question, date_range=date_range, answer_cache=answer_cache, budget=0)
+        print(f"{i}/{len(questions)} questions answered ({time.perf_counter() - start_time:.1f}s)")
+    stats = answer_cache.info()
+    print(f"{stats['misses']} answers computed, {stats['hits']} already cached")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-populate the answer cache with a list of popular questions")
+    parser.add_argument("--questions", required=True, help="text file with one question per line")
+    # Defaults match the year range the app starts with
+    parser.add_argument("--start-year", type=int, default=DEFAULT_YEARS[0], help="first year of the date filter")
+    parser.add_argument("--end-year", type=int, default=DEFAULT_YEARS[1], help="last year of the date filter")
+    args = parser.parse_args()
+    warm_answer_cache(args.questions, args.start_year, args.end_year)
@@ -1,7 +1,7 @@
 import streamlit as st
 
 from assets.categories import CAT_TO_DEFINITION_MAP
-from config import FONT_AWESOME_IMPORT
+from config import DEFAULT_YEARS, FONT_AWESOME_IMPORT
 
 
 def load_fontawesome():
@@ -32,5 +32,5 @@ def display_categories(paper):
 
 def display_user_inputs():
     user_question = st.text_input(label="Enter your question here 👇", max_chars=2000, key="user_question_input")
-    date_range = st.slider("Select a range of dates", 2008, 2022, (2011, 2022))
+    date_range = st.slider("Select a range of dates", 2008, 2022, DEFAULT_YEARS)
     return user_question, date_range
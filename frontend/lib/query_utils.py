@@ -1,80 +1,155 @@
+from types import SimpleNamespace
+from typing import Iterator
+
+import requests
 import streamlit as st
-import torch
-from haystack.nodes import EmbeddingRetriever
-from haystack.nodes.reader.farm import FARMReader
-from haystack.pipelines import ExtractiveQAPipeline
 from redis.asyncio import Redis
-from redis.commands.search.field import TagField, VectorField
+from redis.commands.search.field import NumericField, TagField, VectorField
 from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.exceptions import ResponseError
 
-from askyves.redis_document_store import RedisDocumentStore
-from config import INDEX_NAME, REDIS_HOST, REDIS_PASSWORD, REDIS_PORT, TOP_K_READER, TOP_K_RETRIEVER
+from askyves import metrics
+from askyves.batching import Overloaded
+from askyves.pipeline import build_answer_cache, build_pipeline
+from config import (
+    ASKYVES_API_TIMEOUT,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_RUNTIME,
+    HNSW_M,
+    INDEX_NAME,
+    METRICS_PORT,
+    REDIS_DISTANCE_METRIC,
+)
 
 
 @st.experimental_singleton(show_spinner=False)
 def instanciate_retriever():
+    if METRICS_PORT:
+        metrics.start_metrics_server(METRICS_PORT)
     with st.spinner("Loading models..."):
-        document_store = RedisDocumentStore(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD)
-        retriever = EmbeddingRetriever(
-            document_store=document_store,
-            embedding_model="sentence-transformers/all-mpnet-base-v2",
-            model_format="sentence_transformers",
-        )
-        reader = FARMReader(
-            model_name_or_path="deepset/roberta-base-squad2",
-            use_gpu=torch.cuda.is_available(),
-            context_window_size=2000,
-        )
-        pipe = ExtractiveQAPipeline(reader, retriever)
+        pipe = build_pipeline()
     return pipe
 
 
-def make_qa_query(pipe, text: str, date_range: list):
-    results = pipe.run(
-        query=text,
-        params={
-            "Retriever": {"top_k": TOP_K_RETRIEVER, "filters": {"date_range": date_range}},
-            "Reader": {"top_k": TOP_K_READER},
-        },
-        debug=True,
-    )
-    return results
+@st.experimental_singleton(show_spinner=False)
+def instanciate_answer_cache(_pipe):
+    return build_answer_cache(_pipe)
+
+
+class AskYvesClient:
+    """Client of the `askyves.service` HTTP API, with the interface of `make_qa_query` and `stream_qa_query`: the app
+    then runs without loading any model. Answers and documents are returned as plain objects with the attributes of
+    their haystack counterparts.
+    """
+
+    def __init__(self, url: str, timeout: float = ASKYVES_API_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _post(self, path: str, text: str, date_range: list) -> dict:
+        payload = {"question": text}
+        if date_range:
+            payload.update(start_year=int(min(date_range)), end_year=int(max(date_range)))
+        response = self.session.post(self.url + path, json=payload, timeout=self.timeout)
+        if response.status_code == 503:
+            raise Overloaded(response.json().get("error", "The service is overloaded"))
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _answer(answer: dict) -> SimpleNamespace:
+        offsets = [SimpleNamespace(**span) for span in answer["offsets_in_document"] or []]
+        return SimpleNamespace(**{**answer, "offsets_in_document": offsets})
+
+    def search(self, text: str, date_range: list) -> list:
+        return [SimpleNamespace(**document) for document in self._post("/search", text, date_range)["documents"]]
+
+    def make_qa_query(self, text: str, date_range: list) -> dict:
+        results = self._post("/ask", text, date_range)
+        answers = [self._answer(answer) for answer in results["answers"]]
+        return {"query": text, "answers": answers, "policy": results.get("policy")}
+
+    def stream_qa_query(self, text: str, date_range: list) -> Iterator[dict]:
+        """The retrieved documents first, then the final answers: the service does not stream the reader."""
+        documents = self.search(text, date_range)
+        yield {"query": text, "documents": documents, "document_answers": {}, "done": False}
+        yield {**self.make_qa_query(text, date_range), "documents": documents, "document_answers": {}, "done": True}
+
+
+@st.experimental_singleton(show_spinner=False)
+def instanciate_client(url: str) -> AskYvesClient:
+    return AskYvesClient(url)
+
+
+async def index_exists(redis_conn: Redis, index_name: str = INDEX_NAME) -> bool:
+    try:
+        await redis_conn.ft(index_name).info()
+    except ResponseError:
+        return False
+    return True
 
 
-async def create_index(redis_conn, prefix: str, v_field: VectorField):
+async def create_index(redis_conn, prefix: str, v_field: VectorField, index_name: str = INDEX_NAME):
+    # Fields that KNN searches can be pre-filtered on, see `askyves.filters`
     categories_field = TagField("categories")
-    year_field = TagField("year")
+    submitter_field = TagField("submitter")
+    year_field = NumericField("year")
     # Create Index
-    await redis_conn.ft(INDEX_NAME).create_index(
-        fields=[v_field, categories_field, year_field],
+    await redis_conn.ft(index_name).create_index(
+        fields=[v_field, categories_field, submitter_field, year_field],
         definition=IndexDefinition(prefix=[prefix], index_type=IndexType.HASH),
     )
 
 
-async def create_flat_index(redis_conn: Redis, number_of_vectors: int, prefix: str, distance_metric: str = "L2"):
+async def create_flat_index(
+    redis_conn: Redis,
+    number_of_vectors: int,
+    prefix: str,
+    distance_metric: str = REDIS_DISTANCE_METRIC,
+    vector_type: str = "FLOAT32",
+    dim: int = 768,
+    index_name: str = INDEX_NAME,
+):
     text_field = VectorField(
         "vector",
         "FLAT",
         {
-            "TYPE": "FLOAT32",
-            "DIM": 768,
+            "TYPE": vector_type,
+            "DIM": dim,
             "DISTANCE_METRIC": distance_metric,
             "INITIAL_CAP": number_of_vectors,
             "BLOCK_SIZE": number_of_vectors,
         },
     )
-    await create_index(redis_conn, prefix, text_field)
+    await create_index(redis_conn, prefix, text_field, index_name)
 
 
-async def create_hnsw_index(redis_conn: Redis, number_of_vectors: int, prefix: str, distance_metric: str = "COSINE"):
+async def create_hnsw_index(
+    redis_conn: Redis,
+    number_of_vectors: int,
+    prefix: str,
+    distance_metric: str = REDIS_DISTANCE_METRIC,
+    vector_type: str = "FLOAT32",
+    dim: int = 768,
+    m: int = HNSW_M,
+    ef_construction: int = HNSW_EF_CONSTRUCTION,
+    ef_runtime: int = HNSW_EF_RUNTIME,
+    index_name: str = INDEX_NAME,
+):
+    # `m` and `ef_construction` trade build time and memory for recall, `ef_runtime` trades query latency for recall
+    # and can be overridden per query
     text_field = VectorField(
         "vector",
         "HNSW",
         {
-            "TYPE": "FLOAT32",
-            "DIM": 768,
+            "TYPE": vector_type,
+            "DIM": dim,
             "DISTANCE_METRIC": distance_metric,
             "INITIAL_CAP": number_of_vectors,
+            "M": m,
+            "EF_CONSTRUCTION": ef_construction,
+            "EF_RUNTIME": ef_runtime,
         },
     )
-    await create_index(redis_conn, prefix, text_field)
+    await create_index(redis_conn, prefix, text_field, index_name)
@@ -1,16 +1,130 @@
+import functools
 import time
 
 import streamlit as st
 from lib.app_utils import button_callback, display_categories, display_user_inputs, instanciate_button, load_fontawesome
-from lib.query_utils import instanciate_retriever, make_qa_query
+from lib.query_utils import instanciate_answer_cache, instanciate_client, instanciate_retriever
 
-from config import ASKYVES_IMG_PATH, REDIS_ICON_PATH
+from askyves.batching import Overloaded
+from askyves.pipeline import make_qa_query, stream_qa_query
+from config import ASKYVES_API_URL, ASKYVES_IMG_PATH, PROGRESSIVE_RENDERING, REDIS_ICON_PATH
+
+
+def display_paper(rank: int, paper, paper_id: str, text: str, score_str: str, icon: str = "fa-crosshairs"):
+    """One result: an answer of the reader or a retrieved document, whose `meta` hold the paper fields."""
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.markdown(
+            f'<h1> <a style="color:#F71734;font-size:22px;" href="https://arxiv.org/abs/{paper_id}"> Abstract #{rank} - {paper.meta["name"]}</h1>',
+            unsafe_allow_html=True,
+        )
+        st.markdown(f'<p style="color:#FFF;font-size:19px;">{text}</p>', unsafe_allow_html=True)
+
+    with col2:
+        st.markdown(
+            '<h1 style="font-size:25px;"> </h1>',
+            unsafe_allow_html=True,
+        )
+        score_icon = f'<i class="fa-solid {icon}" style="color:#F71734;font-size:19px;"></i>'
+        st.markdown(
+            f'<h2 style="color:#FFFFFF;font-size:19px;"> {score_icon} &nbsp {score_str}</h2>',
+            unsafe_allow_html=True,
+        )
+
+        if paper.meta["update_date"]:
+            calendar_icon = '<i class="fa-regular fa-calendar" style="color:#F71734;font-size:19px;"></i>'
+            st.markdown(
+                f'<h1 style="color:#FFFFFF;font-size:19px;"> {calendar_icon} &nbsp {paper.meta["update_date"]}</h1>',
+                unsafe_allow_html=True,
+            )
+
+        if paper.meta["categories"]:
+            def_str = display_categories(paper)
+        else:
+            def_str = "Unknown categories"
+        st.markdown(f'<h1 style="color:#FFFFFF;font-size:14px;"> {def_str}</h1>', unsafe_allow_html=True)
+    st.markdown("""---""")
+
+
+def display_answer(rank: int, paper):
+    abstact_str = paper.context
+    start, end = paper.offsets_in_document[0].start, paper.offsets_in_document[0].end
+    passage_start = (paper.meta or {}).get("passage_start")
+    if passage_start is not None:
+        # Passage mode: the offsets are in the passage the reader read, the whole abstract is displayed
+        abstact_str = paper.meta["abstract"]
+        start, end = start + passage_start, end + passage_start
+    abstact_str = f'{abstact_str[:start]}<b style="background-color:#FFBA08;color:#4C4C4C;">{abstact_str[start:end]}</b>{abstact_str[end:]}'
+    display_paper(rank, paper, paper.document_id, abstact_str, f"{round(100 *float(paper.score), 1)}%")
+
+
+def display_document(rank: int, document):
+    """A retrieved abstract the reader has not scored yet, with its similarity to the question."""
+    similarity_score_str = f"{round(100 * float(document.score), 1)}%"
+    abstract = (document.meta or {}).get("abstract", document.content)
+    display_paper(rank, document, document.id, abstract, similarity_score_str, "fa-magnifying-glass")
+
+
+def display_answers(answers: list):
+    for i, paper in enumerate(sorted(answers, key=lambda x: x.score, reverse=True)):
+        display_answer(i + 1, paper)
+
+
+def display_answers_found(container, answers: list, seconds: float):
+    if len(answers) > 0:
+        container.success(f"Top {len(answers)} answers found in {round(seconds, 2)} seconds!")
+    else:
+        container.error("Yves couldn't find an answer to your question...")
+
+
+def display_progressive_results(stream, user_question: str, date_range: list):
+    """Render the retrieved abstracts in retrieval order as soon as they are found, then replace each one by its best
+    answer as the reader scores it. Once every abstract is read, the answers are shown in their final ranking.
+    `stream` is `stream_qa_query`, run locally or by the HTTP service.
+    """
+    status = st.sidebar.empty()
+    results_area = st.empty()
+    placeholders = []
+    start_time = time.time()
+    status.info("Asking Yves for answers...")
+    for step in stream(text=user_question, date_range=date_range):
+        if step["done"]:
+            # The last step: let the generator finish, which records the question latency
+            continue
+        read = len(step["document_answers"])
+        if read == 0:
+            with results_area.container():
+                placeholders = [st.empty() for _ in step["documents"]]
+            for i, (placeholder, document) in enumerate(zip(placeholders, step["documents"])):
+                with placeholder.container():
+                    display_document(i + 1, document)
+            status.info(
+                f"{len(step['documents'])} abstracts found in {round(time.time() - start_time, 2)} seconds, "
+                "reading them..."
+            )
+            continue
+        # Only the abstract read in this step changes, the others are left as rendered
+        answers = step["document_answers"][step["documents"][read - 1].id]
+        if answers:
+            with placeholders[read - 1].container():
+                display_answer(read, max(answers, key=lambda x: x.score))
+
+    display_answers_found(status, step["answers"], time.time() - start_time)
+    with results_area.container():
+        display_answers(step["answers"])
 
 
 def app():
     st.set_page_config(page_title="Redis Player One", page_icon=REDIS_ICON_PATH, layout="wide")
     load_fontawesome()
-    pipe = instanciate_retriever()
+    if ASKYVES_API_URL:
+        client = instanciate_client(ASKYVES_API_URL)
+        ask, stream = client.make_qa_query, client.stream_qa_query
+    else:
+        pipe = instanciate_retriever()
+        answer_cache = instanciate_answer_cache(pipe)
+        ask = functools.partial(make_qa_query, pipe, answer_cache=answer_cache)
+        stream = functools.partial(stream_qa_query, pipe, answer_cache=answer_cache)
     instanciate_button("button1")
     st.sidebar.image(ASKYVES_IMG_PATH)
     with st.form(key="content_section"):
@@ -28,65 +142,19 @@ def app():
             )
             st.markdown("""---""")
 
-            with st.spinner("Asking Yves for answers..."):
-                start_time = time.time()
-                results = make_qa_query(
-                    pipe=pipe,
-                    text=user_question,
-                    date_range=list(map(str, list((range(date_range[0], date_range[1] + 1))))),
-                )
-                end_time = time.time()
-
-            if len(results["answers"]) > 0:
-                st.sidebar.success(
-                    f"Top {len(results['answers'])} answers found in {round(end_time - start_time, 2)} seconds!"
-                )
-            else:
-                st.sidebar.error("Yves couldn't find an answer to your question...")
-
-            if results:
-                answers = sorted(results["answers"], key=lambda x: x.score, reverse=True)
-                for i, paper in enumerate(answers):
-                    col1, col2 = st.columns([3, 1])
-                    with col1:
-                        st.markdown(
-                            f'<h1> <a style="color:#F71734;font-size:22px;" href="https://arxiv.org/abs/{paper.document_id}"> Abstract #{i + 1} - {paper.meta["name"]}</h1>',
-                            unsafe_allow_html=True,
-                        )
-                        abstact_str = paper.context
-                        start, end = paper.offsets_in_document[0].start, paper.offsets_in_document[0].end
-                        abstact_str = f'{abstact_str[:start]}<b style="background-color:#FFBA08;color:#4C4C4C;">{abstact_str[start:end]}</b>{abstact_str[end:]}'
-                        st.markdown(f'<p style="color:#FFF;font-size:19px;">{abstact_str}</p>', unsafe_allow_html=True)
-
-                    with col2:
-                        st.markdown(
-                            '<h1 style="font-size:25px;"> </h1>',
-                            unsafe_allow_html=True,
-                        )
-                        similarity_score_str = f"{round(100 *float(paper.score), 1)}%"
-                        crosshairs_icon = '<i class="fa-solid fa-crosshairs" style="color:#F71734;font-size:19px;"></i>'
-                        st.markdown(
-                            f'<h2 style="color:#FFFFFF;font-size:19px;"> {crosshairs_icon} &nbsp {similarity_score_str}</h2>',
-                            unsafe_allow_html=True,
-                        )
-
-                        if paper.meta["update_date"]:
-                            calendar_icon = (
-                                '<i class="fa-regular fa-calendar" style="color:#F71734;font-size:19px;"></i>'
-                            )
-                            st.markdown(
-                                f'<h1 style="color:#FFFFFF;font-size:19px;"> {calendar_icon} &nbsp {paper.meta["update_date"]}</h1>',
-                                unsafe_allow_html=True,
-                            )
-
-                        if paper.meta["categories"]:
-                            def_str = display_categories(paper)
-                        else:
-                            def_str = "Unknown categories"
-                        st.markdown(
-                            f'<h1 style="color:#FFFFFF;font-size:14px;"> {def_str}</h1>', unsafe_allow_html=True
-                        )
-                    st.markdown("""---""")
+            years = list(map(str, list((range(date_range[0], date_range[1] + 1)))))
+            try:
+                if PROGRESSIVE_RENDERING:
+                    display_progressive_results(stream, user_question, years)
+                else:
+                    with st.spinner("Asking Yves for answers..."):
+                        start_time = time.time()
+                        results = ask(text=user_question, date_range=years)
+                        end_time = time.time()
+                    display_answers_found(st.sidebar, results["answers"], end_time - start_time)
+                    display_answers(results["answers"])
+            except Overloaded:
+                st.sidebar.error("Yves is answering too many questions right now, please try again in a moment...")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,11 @@
+import os
+
+# `config` refuses to load without a Redis connection: the tests never open one
+for name, value in {
+    "REDIS_HOST": "localhost",
+    "REDIS_PORT": "6379",
+    "REDIS_PASSWORD": "",
+    "REDIS_DB": "0",
+    "REDIS_INDEX_TYPE": "HNSW",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,18 @@
+from prometheus_client import REGISTRY
+
+from askyves.batching import MicroBatcher
+
+
+def wait_seconds(name: str) -> float:
+    return REGISTRY.get_sample_value("askyves_batch_wait_seconds_sum", {"batcher": name}) or 0.0
+
+
+def test_results_are_handed_back_in_order():
+    batcher = MicroBatcher(lambda items: [item * 2 for item in items], "test_order")
+    assert [batcher.submit(item) for item in range(3)] == [0, 2, 4]
+
+
+def test_wait_includes_the_batch_window():
+    batcher = MicroBatcher(lambda items: items, "test_wait", window=0.05)
+    assert batcher.submit("item") == "item"
+    assert wait_seconds("test_wait") >= 0.05
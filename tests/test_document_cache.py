@@ -0,0 +1,23 @@
+from prometheus_client import REGISTRY
+
+from askyves.document_cache import DOCUMENT_FIELDS, DocumentCache
+
+
+def gauge(name: str) -> float:
+    return REGISTRY.get_sample_value(name)
+
+
+def test_size_and_hit_rate_are_exported():
+    cache = DocumentCache(maxsize=2)
+    cache.check_version(b"1")
+    assert cache.get_many(["a", "b"]) == {"a": None, "b": None}
+    papers = cache.set_many(["a", "b", "c"], [[b"x"] * len(DOCUMENT_FIELDS), [None] * len(DOCUMENT_FIELDS), [b"y"]])
+    assert papers["b"] is None and papers["c"]["paper_id"] == "y"
+    assert gauge("askyves_document_cache_entries") == 2
+    cache.get_many(["a", "c"])
+    assert gauge("askyves_document_cache_hit_rate") == 0.5
+    assert cache.info()["hit_rate"] == 0.5
+
+    # A rebuilt index empties the cache
+    cache.check_version(b"2")
+    assert gauge("askyves_document_cache_entries") == 0
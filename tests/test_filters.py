@@ -0,0 +1,74 @@
+import pytest
+
+from askyves.filters import compile_filters, escape_tag, parse_filters
+
+
+def test_no_filters_match_every_paper():
+    assert compile_filters(None) == "*"
+    assert compile_filters({}) == "*"
+    assert compile_filters({"date_range": []}) == "*"
+    assert parse_filters({"date_range": []}) is None
+
+
+def test_escape_tag():
+    assert escape_tag("cs.LG") == "cs\\.LG"
+    assert escape_tag("Jane Doe-Smith") == "Jane\\ Doe\\-Smith"
+    assert escape_tag("a{b}|c") == "a\\{b\\}\\|c"
+    assert escape_tag(2020) == "2020"
+
+
+@pytest.mark.parametrize(
+    "filters, query",
+    [
+        ({"categories": "cs.LG"}, "@categories:{cs\\.LG}"),
+        ({"categories": ["cs.LG", "stat.ML"]}, "@categories:{cs\\.LG | stat\\.ML}"),
+        ({"categories": {"$nin": ["cs.LG"]}}, "-@categories:{cs\\.LG}"),
+        ({"submitter": {"$ne": "Jane Doe"}}, "-@submitter:{Jane\\ Doe}"),
+        ({"year": 2020}, "@year:[2020 2020]"),
+        ({"year": {"$gte": 2015, "$lt": 2020}}, "@year:[2015 (2020]"),
+        ({"year": {"$gt": 2015}}, "@year:[(2015 +inf]"),
+        ({"year": {"$lte": 2015, "$ne": 2012}}, "(@year:[-inf 2015] -@year:[2012 2012])"),
+    ],
+)
+def test_compile_field_filters(filters, query):
+    assert compile_filters(filters) == query
+
+
+def test_compile_logical_operators():
+    filters = {"year": {"$gte": 2015}, "categories": ["cs.LG", "stat.ML"]}
+    assert compile_filters(filters) == "(@year:[2015 +inf] @categories:{cs\\.LG | stat\\.ML})"
+    assert compile_filters({"$and": filters}) == compile_filters(filters)
+    assert compile_filters({"$or": filters}) == "(@year:[2015 +inf] | @categories:{cs\\.LG | stat\\.ML})"
+    assert compile_filters({"$or": [{"year": 2020}, {"categories": "cs.LG", "submitter": "Doe"}]}) == (
+        "(@year:[2020 2020] | (@categories:{cs\\.LG} @submitter:{Doe}))"
+    )
+    assert compile_filters({"$not": {"categories": "cs.LG"}}) == "-@categories:{cs\\.LG}"
+    assert compile_filters({"$not": {"$or": {"year": 2020, "categories": "cs.LG"}}}) == (
+        "-(@year:[2020 2020] | @categories:{cs\\.LG})"
+    )
+
+
+def test_date_range_collapses_into_year_runs():
+    assert compile_filters({"date_range": list(range(2011, 2023))}) == "@year:[2011 2022]"
+    assert compile_filters({"date_range": [2019, 2012, 2011, 2013, 2020, 2013]}) == (
+        "(@year:[2011 2013] | @year:[2019 2020])"
+    )
+    assert compile_filters({"date_range": ["2015"], "categories": "cs.LG"}) == (
+        "(@year:[2015 2015] @categories:{cs\\.LG})"
+    )
+    assert compile_filters({"year": {"$nin": [2011, 2012, 2015]}}) == "-(@year:[2011 2012] | @year:[2015 2015])"
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {"title": "attention"},
+        {"year": {"$like": 2020}},
+        {"categories": {"$gt": "cs"}},
+        {"categories": []},
+        {"$or": {}},
+    ],
+)
+def test_invalid_filters(filters):
+    with pytest.raises(ValueError):
+        compile_filters(filters)
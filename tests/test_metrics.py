@@ -0,0 +1,13 @@
+import logging
+import socket
+
+from askyves import metrics
+
+
+def test_taken_metrics_port_is_logged_not_raised(caplog):
+    with socket.socket() as sock:
+        sock.bind(("", 0))
+        sock.listen()
+        with caplog.at_level(logging.WARNING, logger="askyves.metrics"):
+            metrics.start_metrics_server(sock.getsockname()[1])
+    assert "not served" in caplog.text
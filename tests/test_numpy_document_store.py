@@ -0,0 +1,47 @@
+import fakeredis
+import numpy as np
+import pytest
+
+pytest.importorskip("haystack")
+
+from askyves.ingest import PAPER_FIELDS, paper_to_mapping  # noqa: E402
+from askyves.numpy_document_store import NumpyDocumentStore, export_redis  # noqa: E402
+from askyves.vector_codec import CODEC_KEY, VectorCodec, normalize  # noqa: E402
+from config import PAPER_PREFIX  # noqa: E402
+
+
+def make_paper(number: int, year: str, categories: str, vector: np.ndarray) -> dict:
+    paper = {field: "" for field in PAPER_FIELDS}
+    paper.update(id=f"p{number}", title=f"Title {number}", abstract=f"Abstract {number}", year=year)
+    paper.update(categories=categories, submitter=f"S{number}", vector=vector)
+    return paper
+
+
+def test_export_then_load_round_trip(tmp_path):
+    vectors = normalize(np.random.default_rng(0).normal(size=(3, 8)).astype(np.float32))
+    papers = [
+        make_paper(0, "2020", "cs.LG", vectors[0]),
+        make_paper(1, "2021", "cs.CL,stat.ML", vectors[1]),
+        # Written through `RedisDocumentStore.write_documents` without a year: the field is left out of the hash
+        make_paper(2, "", "cs.LG", vectors[2]),
+    ]
+    client = fakeredis.FakeRedis()
+    client.hset(CODEC_KEY, mapping=VectorCodec(dim=8, distance_metric="COSINE").to_mapping())
+    for paper in papers:
+        mapping = paper_to_mapping(paper)
+        if not paper["year"]:
+            del mapping["year"]
+        client.hset(f"{PAPER_PREFIX}{paper['id']}", mapping=mapping)
+
+    assert export_redis(client, str(tmp_path)) == 3
+    store = NumpyDocumentStore(str(tmp_path))
+    assert store.get_document_count() == 3
+
+    (documents,) = store.query_by_embedding_batch(vectors[2:], top_k=3)
+    assert documents[0].id == "p2"
+    assert [document.id for document in store.query_by_embedding(vectors[0], filters={"year": [2020, 2021]})] == [
+        "p0",
+        "p1",
+    ]
+    filters = {"categories": ["cs.LG"], "$not": {"year": 2020}}
+    assert [document.id for document in store.query_by_embedding(vectors[2], filters=filters)] == ["p2"]
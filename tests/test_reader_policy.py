@@ -0,0 +1,19 @@
+from askyves.reader_policy import ReaderPolicy
+
+
+def test_round_size_times_a_single_document_first():
+    assert ReaderPolicy(1).round_size(1, 5) == 1
+    assert ReaderPolicy(1).round_size(1, 0) == 0
+
+
+def test_round_size_fits_the_rest_of_the_budget():
+    policy = ReaderPolicy(1)
+    policy.record(0.2, 2)
+    assert policy.round_size(0.35, 5) == 3
+    assert policy.round_size(1, 5) == 5
+
+
+def test_round_size_is_zero_past_the_deadline():
+    policy = ReaderPolicy(1)
+    policy.record(0.1, 1)
+    assert policy.round_size(-0.5, 5) == 0
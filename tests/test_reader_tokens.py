@@ -0,0 +1,80 @@
+import fakeredis
+import numpy as np
+import pytest
+
+transformers = pytest.importorskip("transformers")
+pytest.importorskip("haystack")
+
+from haystack.modeling.model.feature_extraction import tokenize_batch_question_answering  # noqa: E402
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers  # noqa: E402
+
+from askyves import reader_tokens  # noqa: E402
+from askyves.reader_tokens import READER_TOKENS_FIELD, ReaderTokenCache, pack_tokens, tokenize  # noqa: E402
+from config import PAPER_PREFIX  # noqa: E402
+
+ABSTRACTS = [
+    "We study the convergence of stochastic gradient descent on non-convex objectives. Our bounds are tight.",
+    "Transformers attend to every token of their input; we propose a sparse variant with linear complexity.",
+    "A survey of graph neural networks, from spectral convolutions to message passing, with open problems.",
+]
+QUESTION = "What do we propose?"
+
+
+@pytest.fixture
+def tokenizer():
+    """A small byte-level BPE tokenizer, like RoBERTa's, trained on the abstracts."""
+    backend = Tokenizer(models.BPE())
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=400, initial_alphabet=pre_tokenizers.ByteLevel.alphabet(), special_tokens=["<pad>"]
+    )
+    backend.train_from_iterator(ABSTRACTS + [QUESTION], trainer)
+    return transformers.PreTrainedTokenizerFast(tokenizer_object=backend, pad_token="<pad>")
+
+
+def pre_baskets() -> list:
+    return [
+        {"context": abstract, "qas": [{"question": QUESTION, "id": f"p{number}", "answers": []}]}
+        for number, abstract in enumerate(ABSTRACTS)
+    ]
+
+
+def assert_same_baskets(baskets: list, expected: list) -> None:
+    assert len(baskets) == len(expected)
+    for basket, expected_basket in zip(baskets, expected):
+        assert (basket.id_internal, basket.id_external) == (expected_basket.id_internal, expected_basket.id_external)
+        assert basket.raw.keys() == expected_basket.raw.keys()
+        for key, value in expected_basket.raw.items():
+            if isinstance(value, str):
+                assert basket.raw[key] == value, key
+            else:
+                assert np.array_equal(np.asarray(basket.raw[key]), np.asarray(value)), key
+
+
+def test_cached_tokens_give_haystack_baskets(tokenizer, monkeypatch):
+    client = fakeredis.FakeRedis()
+    # p0 has up-to-date stored tokens, p1 tokens of a previous version of its abstract, p2 none
+    tokens = tokenize(tokenizer, [ABSTRACTS[0], "An older abstract."])
+    client.hset(f"{PAPER_PREFIX}p0", READER_TOKENS_FIELD, pack_tokens(tokenizer, ABSTRACTS[0], tokens[0]))
+    client.hset(f"{PAPER_PREFIX}p1", READER_TOKENS_FIELD, pack_tokens(tokenizer, "An older abstract.", tokens[1]))
+    cache = ReaderTokenCache(tokenizer, client)
+    monkeypatch.setattr(reader_tokens, "_haystack_tokenize", tokenize_batch_question_answering)
+    monkeypatch.setitem(reader_tokens._token_caches, reader_tokens.tokenizer_id(tokenizer), cache)
+
+    indices = list(range(len(ABSTRACTS)))
+    expected = tokenize_batch_question_answering(pre_baskets(), tokenizer, indices)
+    baskets = reader_tokens._tokenize_batch_question_answering(pre_baskets(), tokenizer, indices)
+    assert_same_baskets(baskets, expected)
+    assert cache.stats == {"local_hits": 0, "redis_hits": 1, "misses": 2}
+
+    # From the in-process tier the second time
+    assert_same_baskets(reader_tokens._tokenize_batch_question_answering(pre_baskets(), tokenizer, indices), expected)
+    assert cache.stats["local_hits"] == 3
+
+
+def test_tokenizers_without_a_cache_keep_haystack_tokenization(tokenizer, monkeypatch):
+    monkeypatch.setattr(reader_tokens, "_haystack_tokenize", tokenize_batch_question_answering)
+    indices = list(range(len(ABSTRACTS)))
+    baskets = reader_tokens._tokenize_batch_question_answering(pre_baskets(), tokenizer, indices)
+    assert_same_baskets(baskets, tokenize_batch_question_answering(pre_baskets(), tokenizer, indices))
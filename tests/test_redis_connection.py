@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+import redis
+
+from askyves.redis_connection import CircuitBreaker, CircuitOpenError, RedisNode, RedisRouter
+
+
+def open_node(**kwargs) -> RedisNode:
+    node = RedisNode("localhost", 6379, "", failure_threshold=1, reset_timeout=0, **kwargs)
+    node.breaker.record_failure()
+    assert node.breaker.is_open
+    return node
+
+
+def fail(error: Exception):
+    def operation(client):
+        raise error
+
+    return operation
+
+
+def test_breaker_opens_and_closes_after_a_successful_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    assert not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open
+    assert breaker.allow()
+    # A single trial at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow()
+
+
+def test_trial_failing_on_transient_error_reopens_the_circuit():
+    node = open_node()
+    with pytest.raises(CircuitOpenError):
+        RedisRouter(node).write(fail(redis.ConnectionError("down")))
+    assert node.breaker.is_open
+    assert node.breaker.allow()
+
+
+@pytest.mark.parametrize("error", [redis.ResponseError("unknown command"), KeyError("field")])
+def test_trial_failing_on_other_error_releases_the_trial(error):
+    node = open_node()
+    router = RedisRouter(node)
+    with pytest.raises(type(error)):
+        router.write(fail(error))
+    # The node is not locked out: the next request is a new trial
+    assert router.write(lambda client: "ok") == "ok"
+    assert not node.breaker.is_open
+
+
+def test_async_trial_cancelled_releases_the_trial():
+    node = open_node()
+    router = RedisRouter(node)
+
+    async def cancelled(client):
+        raise asyncio.CancelledError()
+
+    async def ok(client):
+        return "ok"
+
+    async def run():
+        with pytest.raises(asyncio.CancelledError):
+            await router.aread(cancelled)
+        return await router.aread(ok)
+
+    assert asyncio.run(run()) == "ok"
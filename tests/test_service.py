@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import pytest
+import tornado.httpclient
+import tornado.httpserver
+import tornado.testing
+
+from askyves.batching import Overloaded
+from askyves.build_embeddings import MAX_YEAR, MIN_YEAR
+from askyves.service import make_app
+
+
+class FakeWorkers:
+    """Runs nothing: replies with the name and the arguments of the function, or raises `error`."""
+
+    num_workers = 1
+    max_pending = 4
+
+    def __init__(self, error: Exception = None):
+        self.pending = 0
+        self.error = error
+
+    async def run(self, fn, *args):
+        if self.error is not None:
+            raise self.error
+        return json.dumps({"function": fn.__name__, "args": args})
+
+
+def post(path: str, body: dict, error: Exception = None) -> tornado.httpclient.HTTPResponse:
+    async def run():
+        sock, port = tornado.testing.bind_unused_port()
+        server = tornado.httpserver.HTTPServer(make_app(FakeWorkers(error)))
+        server.add_sockets([sock])
+        try:
+            return await tornado.httpclient.AsyncHTTPClient().fetch(
+                f"http://127.0.0.1:{port}{path}", method="POST", body=json.dumps(body), raise_error=False
+            )
+        finally:
+            server.stop()
+
+    return asyncio.run(run())
+
+
+def test_overloaded_reply_keeps_retry_after():
+    response = post("/ask", {"question": "q"}, error=Overloaded("queue full"))
+    assert response.code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_invalid_filters_are_rejected_before_reaching_a_worker():
+    response = post("/search", {"question": "q", "filters": {"abstract": "x"}}, error=AssertionError("not validated"))
+    assert response.code == 400
+    assert "cannot be filtered on" in json.loads(response.body)["error"]
+
+
+def test_worker_value_error_is_a_server_error():
+    response = post("/search", {"question": "q"}, error=ValueError("bug in the pipeline"))
+    assert response.code == 500
+    assert json.loads(response.body) == {"error": "Internal Server Error"}
+
+
+@pytest.mark.parametrize("budget", [-1, True, "1"])
+def test_invalid_budget_is_rejected(budget):
+    assert post("/ask", {"question": "q", "budget_seconds": budget}).code == 400
+
+
+def test_valid_request_is_answered():
+    response = post("/ask", {"question": "q", "budget_seconds": 0.5})
+    assert response.code == 200
+    assert json.loads(response.body)["function"] == "_ask"
+
+
+def test_year_range_is_clamped_to_the_years_of_the_papers():
+    response = post("/ask", {"question": "q", "start_year": 0, "end_year": 2_000_000_000})
+    assert json.loads(response.body)["args"][1] == list(map(str, range(MIN_YEAR, MAX_YEAR + 1)))
+
+
+@pytest.mark.parametrize("years", [(2020, 2010), (MAX_YEAR + 1, MAX_YEAR + 5), (2010, None)])
+def test_invalid_year_range_is_rejected(years):
+    start_year, end_year = years
+    assert post("/search", {"question": "q", "start_year": start_year, "end_year": end_year}).code == 400
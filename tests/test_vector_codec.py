@@ -0,0 +1,93 @@
+import fakeredis
+import numpy as np
+import pytest
+
+from askyves.vector_codec import CODEC_FILE, CODEC_KEY, VectorCodec, normalize
+
+
+@pytest.fixture
+def sample():
+    # Normalised embeddings whose variance lies mostly in a few directions, like the real ones
+    rng = np.random.default_rng(0)
+    latent = rng.normal(size=(500, 4)) @ rng.normal(size=(4, 32))
+    return normalize(latent + 0.01 * rng.normal(size=(500, 32))).astype(np.float32)
+
+
+def test_identity_codec(sample):
+    codec = VectorCodec.fit(sample, "FLOAT32", 64, "COSINE")
+    assert codec.is_identity
+    assert codec.dim == 32
+    assert np.array_equal(codec.project(sample), sample)
+    assert np.array_equal(codec.decode(codec.encode(sample[0]).tobytes()), sample[0])
+
+
+def test_fit_projects_on_the_main_components(sample):
+    codec = VectorCodec.fit(sample, "FLOAT32", 4, "IP")
+    assert not codec.is_identity
+    assert codec.components.shape == (4, 32)
+    projected = codec.project(sample)
+    assert projected.shape == (500, 4)
+    assert projected.dtype == np.float32
+    assert np.allclose(np.linalg.norm(projected, axis=1), 1, atol=1e-5)
+    # Four components hold nearly all the variance: neighbours are the same as in the full space
+    query = sample[0]
+    assert np.argsort(1 - sample @ query)[:5].tolist() == np.argsort(1 - projected @ projected[0])[:5].tolist()
+
+
+def test_encode_decode_float16(sample):
+    codec = VectorCodec.fit(sample, "FLOAT16", 8, "L2")
+    encoded = codec.encode(sample[:3])
+    assert encoded.dtype == np.float16
+    assert encoded.flags["C_CONTIGUOUS"]
+    decoded = codec.decode(encoded[1].tobytes())
+    assert decoded.dtype == np.float32
+    assert np.allclose(decoded, codec.project(sample[1]), atol=1e-3)
+
+
+def test_distances():
+    query = np.array([1, 0], dtype=np.float32)
+    vectors = np.array([[1, 0], [0, 2], [-1, 0]], dtype=np.float32)
+    assert np.allclose(VectorCodec(dim=2, distance_metric="L2").distances(query, vectors), [0, 5, 4])
+    assert np.allclose(VectorCodec(dim=2, distance_metric="COSINE").distances(query, vectors), [0, 1, 2])
+    assert np.allclose(VectorCodec(dim=2, distance_metric="IP").distances(query, vectors), [0, 1, 2])
+
+
+def test_unsupported_vector_type():
+    with pytest.raises(ValueError):
+        VectorCodec("INT8")
+
+
+def assert_same_codec(codec: VectorCodec, expected: VectorCodec) -> None:
+    assert (codec.vector_type, codec.dim, codec.distance_metric) == (
+        expected.vector_type,
+        expected.dim,
+        expected.distance_metric,
+    )
+    if expected.components is None:
+        assert codec.components is None and codec.mean is None
+    else:
+        assert np.array_equal(codec.mean, expected.mean)
+        assert np.array_equal(codec.components, expected.components)
+
+
+@pytest.mark.parametrize("vector_type, dim", [("FLOAT32", 32), ("FLOAT16", 8)])
+def test_redis_round_trip(sample, vector_type, dim):
+    codec = VectorCodec.fit(sample, vector_type, dim, "COSINE")
+    client = fakeredis.FakeRedis()
+    client.hset(CODEC_KEY, mapping=codec.to_mapping())
+    loaded = VectorCodec.from_mapping(client.hgetall(CODEC_KEY))
+    assert_same_codec(loaded, codec)
+    assert np.array_equal(loaded.encode(sample), codec.encode(sample))
+
+
+def test_missing_mapping_is_the_historical_index():
+    assert_same_codec(VectorCodec.from_mapping({}), VectorCodec())
+
+
+@pytest.mark.parametrize("vector_type, dim", [("FLOAT32", 32), ("FLOAT16", 8)])
+def test_file_round_trip(sample, tmp_path, vector_type, dim):
+    codec = VectorCodec.fit(sample, vector_type, dim, "L2")
+    codec.save(tmp_path / CODEC_FILE)
+    loaded = VectorCodec.load(tmp_path / CODEC_FILE)
+    assert_same_codec(loaded, codec)
+    assert np.array_equal(loaded.encode(sample), codec.encode(sample))